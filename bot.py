@@ -9,6 +9,13 @@ from dotenv import load_dotenv
 from telegram.ext import ApplicationBuilder
 from modules.jobs import setup_jobs
 from modules.handlers import setup_handlers
+from modules.migrations import run_migrations
+from modules.load import preload_catalogs
+from modules.search import preload_search_index
+from modules.query import get_url_builder
+from modules.webhook import get_webhook_config, create_update_queue, run_application
+from modules.updates import create_update_processor
+from modules.persistence import create_persistence
 
 # Load environment variables from .env file
 load_dotenv()
@@ -26,12 +33,27 @@ def main():
     if not token:
         raise ValueError("No BOT_TOKEN provided in .env file")
 
-    application = ApplicationBuilder().token(token).build()
+    for name in run_migrations():
+        logger.info(f"Applied database migration: {name}")
+
+    preload_catalogs()
+    preload_search_index()
+    logger.info(f"Using tori API version: {get_url_builder().version}")
+    webhook_config = get_webhook_config()
+    update_processor = create_update_processor()
+    logger.info(f"Processing updates with {update_processor.workers} workers")
+
+    application = (ApplicationBuilder()
+                   .token(token)
+                   .update_queue(create_update_queue())
+                   .concurrent_updates(update_processor)
+                   .persistence(create_persistence())
+                   .build())
 
     setup_handlers(application)
     setup_jobs(application.job_queue)
 
-    application.run_polling()
+    run_application(application, webhook_config)
 
 if __name__ == '__main__':
     asyncio.run(main())
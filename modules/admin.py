@@ -1,9 +1,14 @@
+import html
 from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from modules.database import get_session
-from modules.models import UserPreferences
-from modules.load import load_messages
-from modules.utils import get_language
+from sqlalchemy import func
+from modules.models import UserPreferences, ToriItem, OutboxMessage, ItemCategory, ItemLocation
+from modules.load import load_messages, get_catalog_names, get_all_labels
+from modules.utils import get_language, language_cache
+from modules.keyboards import get_keyboard
+from modules.broadcast import start_broadcast, get_active_broadcast
+from modules.outbox import photo_cache
 from modules.constants import (
     ADMIN_ID,
     ADMIN_MENU,
@@ -12,6 +17,9 @@ from modules.constants import (
     ADMIN_BROADCAST_CONFIRM
 )
 
+# Number of the most tracked categories and locations shown in the statistics
+TOP_FILTERS_COUNT = 5
+
 
 def is_admin(user_id: int) -> bool:
     """Check if user is admin."""
@@ -35,6 +43,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
     keyboard = [
         ["📢 Рассылка сообщений"],
+        ["📊 Статистика"],
         ["❌ Закрыть админ-панель"]
     ]
     reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=False, resize_keyboard=True)
@@ -65,17 +74,15 @@ async def admin_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     if choice == "📢 Рассылка сообщений":
         return await select_broadcast_language(update, context)
+    elif choice == "📊 Статистика":
+        return await show_statistics(update, context)
     elif choice == "❌ Закрыть админ-панель":
         # Return to main menu with keyboard
         telegram_id = update.message.from_user.id
         language = get_language(telegram_id)
         messages = load_messages(language)
 
-        keyboard = [
-            [messages['add_item'], messages['items']],
-            [messages['settings']]
-        ]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=False, resize_keyboard=True)
+        reply_markup = get_keyboard(language, 'main_menu')
 
         await update.message.reply_text(
             "✅ Админ-панель закрыта.\n\n" + messages['menu'],
@@ -87,6 +94,92 @@ async def admin_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ADMIN_MENU
 
 
+def get_top_filters(session, model, limit: int = TOP_FILTERS_COUNT) -> list:
+    """
+    Count the tracked items per category or location code, from the item_categories / item_locations tables.
+    Args:
+        session (Session): The database session.
+        model: ItemCategory or ItemLocation.
+        limit (int): Number of codes returned.
+    Returns:
+        list: (code, number of items) tuples, the most tracked first; the code is None for all categories
+            or the whole Finland.
+    """
+    item_count = func.count(model.item_id)
+    return session.query(model.code, item_count).group_by(model.code).order_by(item_count.desc(), model.code).limit(limit).all()
+
+
+def format_top_filters(kind: str, top_filters: list, language: str) -> str:
+    """
+    Render the most tracked categories or locations for the statistics, one line per code.
+    Args:
+        kind (str): 'categories' or 'locations'.
+        top_filters (list): (code, number of items) tuples as returned by get_top_filters.
+        language (str): Language of the names.
+    Returns:
+        str: The lines, e.g. "Uusimaa > Helsinki: 12\n".
+    """
+    if not top_filters:
+        return "—\n"
+    names = get_catalog_names(kind, language)
+    all_label = get_all_labels(language)['category' if kind == 'categories' else 'region']
+    lines = []
+    for code, count in top_filters:
+        name = ' > '.join(names.get(code, (code,))) if code is not None else all_label
+        lines.append(f"{html.escape(name)}: {count}\n")
+    return ''.join(lines)
+
+
+async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """
+    Show bot statistics: users, tracked items, the most tracked categories and locations, the notification outbox
+    and the language and photo cache counters.
+    Args:
+        update (Update): The update object.
+        context (ContextTypes.DEFAULT_TYPE): The context object.
+    Returns:
+        int: ADMIN_MENU state.
+    """
+    session = get_session()
+    user_count = session.query(UserPreferences).count()
+    item_count = session.query(ToriItem).count()
+    top_categories = get_top_filters(session, ItemCategory)
+    top_locations = get_top_filters(session, ItemLocation)
+    outbox_counts = dict(session.query(OutboxMessage.status, func.count()).group_by(OutboxMessage.status).all())
+    session.close()
+
+    language = get_language(update.message.from_user.id)
+
+    cache_stats = language_cache.stats()
+    photo_stats = photo_cache.stats()
+
+    await update.message.reply_text(
+        f"📊 <b>Статистика</b>\n\n"
+        f"👥 Пользователей: <b>{user_count}</b>\n"
+        f"🔍 Отслеживаемых товаров: <b>{item_count}</b>\n\n"
+        f"🏷 <b>Популярные категории</b>\n"
+        f"{format_top_filters('categories', top_categories, language)}\n"
+        f"📍 <b>Популярные регионы</b>\n"
+        f"{format_top_filters('locations', top_locations, language)}\n"
+        f"📬 <b>Очередь уведомлений</b>\n"
+        f"Ожидают отправки: {outbox_counts.get('pending', 0)}\n"
+        f"Отправлено: {outbox_counts.get('sent', 0)}\n"
+        f"Не доставлено: {outbox_counts.get('failed', 0)}\n\n"
+        f"🗂 <b>Кэш языков</b>\n"
+        f"Записей: {cache_stats['size']} / {cache_stats['maxsize']}\n"
+        f"Попаданий: {cache_stats['hits']}\n"
+        f"Промахов: {cache_stats['misses']}\n"
+        f"Доля попаданий: {cache_stats['hit_rate']:.1%}\n\n"
+        f"🖼 <b>Кэш фото объявлений</b>\n"
+        f"Записей: {photo_stats['size']} / {photo_stats['maxsize']}\n"
+        f"Повторных отправок по file_id: {photo_stats['hits']}\n"
+        f"Доля попаданий: {photo_stats['hit_rate']:.1%}",
+        parse_mode='HTML'
+    )
+
+    return ADMIN_MENU
+
+
 async def select_broadcast_language(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Ask admin to select target language for broadcast.
@@ -221,7 +314,7 @@ async def save_broadcast_message(update: Update, context: ContextTypes.DEFAULT_T
 
 async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
-    Confirm and send broadcast message.
+    Confirm the broadcast message and start sending it in the background.
     Args:
         update (Update): The update object.
         context (ContextTypes.DEFAULT_TYPE): The context object.
@@ -251,59 +344,49 @@ async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Ошибка: данные рассылки не найдены.")
         return await admin_panel(update, context)
 
-    # Get target users
-    session = get_session()
-    if broadcast_language == "all":
-        users = session.query(UserPreferences).all()
-    else:
-        users = session.query(UserPreferences).filter_by(language=broadcast_language).all()
-    session.close()
-
-    # Send broadcast
-    await update.message.reply_text(
-        f"📤 Начинаю рассылку...\nВсего пользователей: {len(users)}"
-    )
+    if get_active_broadcast() is not None:
+        await update.message.reply_text("❗ Предыдущая рассылка ещё не завершена. Дождитесь её окончания или остановите её.")
+        return await admin_panel(update, context)
 
-    success_count = 0
-    failed_count = 0
-
-    for user in users:
-        try:
-            await context.bot.send_message(
-                chat_id=user.telegram_id,
-                text=broadcast_message,
-                parse_mode='HTML'
-            )
-            success_count += 1
-        except Exception as e:
-            failed_count += 1
-            print(f"Failed to send to {user.telegram_id}: {e}")
+    # The broadcast runs in the background; its progress is shown in a message that is edited in place
+    await start_broadcast(context.application, broadcast_message, broadcast_language, update.message.chat_id)
 
     # Clean up context
     context.user_data.pop('broadcast_message', None)
     context.user_data.pop('broadcast_language', None)
 
-    await update.message.reply_text(
-        f"✅ <b>Рассылка завершена!</b>\n\n"
-        f"✅ Успешно: {success_count}\n"
-        f"❌ Ошибок: {failed_count}",
-        parse_mode='HTML'
-    )
-
     return await admin_panel(update, context)
 
 
+async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Stop the running broadcast (the button under its progress message).
+    Args:
+        update (Update): The update object containing the callback query.
+        context (ContextTypes.DEFAULT_TYPE): The context object.
+    """
+    query = update.callback_query
+
+    if not is_admin(query.from_user.id):
+        await query.answer()
+        return
+
+    broadcast = get_active_broadcast()
+    if broadcast is None:
+        await query.answer("Рассылка уже завершена.")
+        return
+
+    broadcast.cancel()
+    await query.answer("⛔ Рассылка останавливается...")
+
+
 async def cancel_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel admin panel and return to main menu."""
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [
-        [messages['add_item'], messages['items']],
-        [messages['settings']]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=False, resize_keyboard=True)
+    reply_markup = get_keyboard(language, 'main_menu')
 
     await update.message.reply_text(
         "❌ Админ-панель отменена.\n\n" + messages['menu'],
@@ -0,0 +1,368 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+from modules.database import get_session
+from modules.models import UserPreferences, ToriItem, BroadcastJob
+from modules.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Number of messages being sent at the same time
+BROADCAST_CONCURRENCY = 8
+
+# Messages per second, below Telegram's limit of about 30 for bulk messages
+BROADCAST_RATE = 25
+
+# Times a message is retried after Telegram asked to slow down
+BROADCAST_MAX_RETRIES = 3
+
+# Seconds between the saves of the delivery cursor and the edits of the progress message
+BROADCAST_PROGRESS_INTERVAL = 5
+
+# Number of recipients read from the database at once
+BROADCAST_BATCH_SIZE = 500
+
+# Callback data of the cancel button under the progress message
+CANCEL_CALLBACK = 'broadcast_cancel'
+
+def iter_recipients(language: str, after_id: int = 0, batch_size: int = BROADCAST_BATCH_SIZE):
+    '''
+    Stream the broadcast recipients in batches (keyset pagination on the primary key).
+    Args:
+        language (str): Language of the recipients, or 'all'.
+        after_id (int): Only recipients with a greater user_preferences.id (the delivery cursor).
+        batch_size (int): Number of rows fetched per query.
+    Yields:
+        tuple: (user_preferences.id, telegram_id) of a recipient, in id order.
+    '''
+    last_id = after_id
+    while True:
+        session = get_session()
+        try:
+            query = session.query(UserPreferences.id, UserPreferences.telegram_id).filter(UserPreferences.id > last_id)
+            if language != 'all':
+                query = query.filter(UserPreferences.language == language)
+            rows = query.order_by(UserPreferences.id).limit(batch_size).all()
+        finally:
+            session.close()
+        if not rows:
+            return
+        for row in rows:
+            yield row.id, row.telegram_id
+        last_id = rows[-1].id
+
+def count_recipients(language: str) -> int:
+    '''
+    Count the broadcast recipients.
+    Args:
+        language (str): Language of the recipients, or 'all'.
+    Returns:
+        int: Number of recipients.
+    '''
+    session = get_session()
+    try:
+        query = session.query(UserPreferences)
+        if language != 'all':
+            query = query.filter_by(language=language)
+        return query.count()
+    finally:
+        session.close()
+
+class RateLimiter:
+    '''
+    Spaces calls evenly to a maximum rate shared by all the senders; pause() holds everyone back
+    (when Telegram answers with RetryAfter).
+    '''
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(self._next, time.monotonic()) + self.interval
+
+    def pause(self, seconds: float):
+        self._next = max(self._next, time.monotonic() + seconds)
+
+class Broadcast:
+    '''
+    A message sent to many users in the background, with its progress reported by editing a status message.
+    The progress is saved to its BroadcastJob row: the cursor is the recipient up to which everyone has been
+    processed, so a broadcast interrupted by a restart continues after it instead of starting over.
+    '''
+
+    def __init__(self, job: BroadcastJob):
+        self.job_id = job.id
+        self.text = job.text
+        self.language = job.language
+        self.chat_id = job.chat_id
+        self.message_id = job.message_id
+        self.total = job.total
+        self.cursor = job.cursor
+        self.sent = job.sent
+        self.blocked = job.blocked
+        self.failed = job.failed
+        self.created_at = job.created_at
+        self.cancelled = False
+        self.interrupted = False
+        self.finished = False
+        self._resumed_at = time.monotonic()
+        self._resumed_done = self.done
+        self._limiter = RateLimiter(BROADCAST_RATE)
+        self._pending = deque()         # ids of the recipients handed to the workers, in id order
+        self._completed = set()         # ids of the processed recipients not yet below the cursor
+        self._blocked_users = []        # Telegram IDs of the users to clean up at the next checkpoint
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    def cancel(self):
+        '''
+        Stop the broadcast: the messages already being sent finish, no new ones are started.
+        '''
+        self.cancelled = True
+
+    def format_progress(self) -> str:
+        '''
+        Render the status message.
+        Returns:
+            str: The progress in HTML.
+        '''
+        if self.cancelled and self.finished:
+            title = "⛔ <b>Рассылка остановлена</b>"
+        elif self.interrupted:
+            title = "⏸ <b>Рассылка приостановлена</b>\nБот перезапускается, рассылка продолжится автоматически."
+        elif self.finished:
+            title = "✅ <b>Рассылка завершена!</b>"
+        else:
+            title = "📤 <b>Идёт рассылка...</b>"
+        elapsed = (datetime.now() - self.created_at).total_seconds()
+        text = (
+            f"{title}\n\n"
+            f"Обработано: <b>{self.done}</b> / {self.total}\n"
+            f"✅ Успешно: {self.sent}\n"
+            f"🚫 Заблокировали бота: {self.blocked}\n"
+            f"❌ Ошибок: {self.failed}\n"
+            f"⏱ Прошло: {int(elapsed) // 60} мин {int(elapsed) % 60} с"
+        )
+        done_since_resume = self.done - self._resumed_done
+        if not self.finished and done_since_resume > 0:
+            remaining = max(self.total - self.done, 0) * (time.monotonic() - self._resumed_at) / done_since_resume
+            text += f"\n⏳ Осталось примерно: {int(remaining) // 60} мин {int(remaining) % 60} с"
+        return text
+
+    async def run(self, application):
+        '''
+        Send the message to the remaining recipients with at most BROADCAST_CONCURRENCY sends in flight.
+        When the application stops, the sends in flight finish, the progress is saved and the job stays
+        'running' in the database, to be resumed by resume_broadcasts.
+        Args:
+            application (Application): The running application.
+        '''
+        bot = application.bot
+        queue = asyncio.Queue(maxsize=BROADCAST_CONCURRENCY * 2)
+        workers = [asyncio.create_task(self._worker(application, queue)) for _ in range(BROADCAST_CONCURRENCY)]
+        progress = asyncio.create_task(self._report_progress(bot))
+        try:
+            for user_id, telegram_id in iter_recipients(self.language, self.cursor):
+                if not application.running:
+                    self.interrupted = True
+                if self.cancelled or self.interrupted:
+                    break
+                self._pending.append(user_id)
+                await queue.put((user_id, telegram_id))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except Exception:
+            logger.exception("Broadcast %d failed", self.job_id)
+            self.cancel()
+        finally:
+            self.finished = not self.interrupted
+            progress.cancel()
+            for worker in workers:
+                worker.cancel()
+            self.checkpoint()
+            await self.update_status(bot)
+            logger.info("Broadcast %d %s: %d sent, %d blocked, %d failed of %d", self.job_id,
+                        'interrupted' if self.interrupted else 'finished', self.sent, self.blocked, self.failed, self.total)
+
+    async def _worker(self, application, queue: asyncio.Queue):
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            if not application.running:
+                self.interrupted = True
+            if self.cancelled or self.interrupted:
+                continue
+            user_id, telegram_id = entry
+            await self._send(application.bot, telegram_id)
+            self._complete(user_id)
+
+    async def _send(self, bot, telegram_id: int):
+        for _ in range(BROADCAST_MAX_RETRIES + 1):
+            await self._limiter.wait()
+            try:
+                await bot.send_message(chat_id=telegram_id, text=self.text, parse_mode='HTML')
+                self.sent += 1
+                return
+            except RetryAfter as e:
+                logger.warning("Flood limit hit during the broadcast, pausing for %s s", e.retry_after)
+                self._limiter.pause(e.retry_after)
+            except Forbidden:
+                self.blocked += 1
+                self._blocked_users.append(telegram_id)
+                return
+            except TelegramError as e:
+                logger.warning("Failed to send the broadcast to %s: %s", telegram_id, e)
+                self.failed += 1
+                return
+        self.failed += 1
+
+    def _complete(self, user_id: int):
+        # Recipients finish out of order; the cursor only moves past a recipient once everyone before it is done
+        self._completed.add(user_id)
+        while self._pending and self._pending[0] in self._completed:
+            self.cursor = self._pending.popleft()
+            self._completed.discard(self.cursor)
+
+    def checkpoint(self):
+        '''
+        Remove the items of the users who blocked the bot (in one query) and save the cursor and the counters.
+        '''
+        blocked_users, self._blocked_users = self._blocked_users, []
+        if self.finished:
+            status = 'cancelled' if self.cancelled else 'finished'
+        else:
+            status = 'running'
+        session = get_session()
+        try:
+            if blocked_users:
+                session.query(ToriItem).filter(ToriItem.telegram_id.in_(blocked_users)).delete(synchronize_session=False)
+            session.query(BroadcastJob).filter_by(id=self.job_id).update({
+                'cursor': self.cursor,
+                'sent': self.sent,
+                'blocked': self.blocked,
+                'failed': self.failed,
+                'status': status,
+                'finished_at': datetime.now() if self.finished else None
+            })
+            session.commit()
+        except Exception:
+            session.rollback()
+            self._blocked_users = blocked_users + self._blocked_users
+            logger.exception("Failed to save the progress of broadcast %d", self.job_id)
+            return
+        finally:
+            session.close()
+        for telegram_id in blocked_users:
+            registry.remove_user(telegram_id)
+
+    async def _report_progress(self, bot):
+        reported = None
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            if self.done != reported:
+                reported = self.done
+                self.checkpoint()
+                await self.update_status(bot)
+
+    async def update_status(self, bot):
+        '''
+        Edit the status message with the current progress (with a cancel button while the broadcast runs).
+        Args:
+            bot (Bot): The bot that posted the status message.
+        '''
+        reply_markup = None
+        if not self.finished and not self.interrupted:
+            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⛔ Остановить", callback_data=CANCEL_CALLBACK)]])
+        try:
+            await bot.edit_message_text(self.format_progress(), chat_id=self.chat_id, message_id=self.message_id,
+                                        parse_mode='HTML', reply_markup=reply_markup)
+        except BadRequest as e:
+            if 'not modified' not in str(e):
+                logger.warning("Failed to update the broadcast progress: %s", e)
+        except TelegramError as e:
+            logger.warning("Failed to update the broadcast progress: %s", e)
+
+# The broadcast in progress (only one runs at a time)
+active_broadcast: Optional[Broadcast] = None
+
+def get_active_broadcast() -> Optional[Broadcast]:
+    '''
+    Get the broadcast in progress.
+    Returns:
+        Broadcast | None: The running broadcast, or None.
+    '''
+    if active_broadcast is not None and (active_broadcast.finished or active_broadcast.interrupted):
+        return None
+    return active_broadcast
+
+def run_broadcast(application, job: BroadcastJob) -> Broadcast:
+    '''
+    Run a stored broadcast in the background.
+    Args:
+        application (Application): The running application (runs the background task).
+        job (BroadcastJob): The broadcast to run.
+    Returns:
+        Broadcast: The running broadcast.
+    '''
+    global active_broadcast
+    active_broadcast = Broadcast(job)
+    application.create_task(active_broadcast.run(application))
+    return active_broadcast
+
+async def start_broadcast(application, text: str, language: str, chat_id: int) -> Broadcast:
+    '''
+    Store a new broadcast, post its status message and start it in the background.
+    Args:
+        application (Application): The running application.
+        text (str): The message in HTML.
+        language (str): Language of the recipients, or 'all'.
+        chat_id (int): Chat of the status message (the admin's).
+    Returns:
+        Broadcast: The started broadcast.
+    '''
+    total = count_recipients(language)
+    status = await application.bot.send_message(chat_id, f"📤 Начинаю рассылку...\nВсего пользователей: {total}")
+    session = get_session()
+    try:
+        job = BroadcastJob(text=text, language=language, chat_id=chat_id, message_id=status.message_id, total=total)
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        session.expunge(job)
+    finally:
+        session.close()
+    broadcast = run_broadcast(application, job)
+    await broadcast.update_status(application.bot)
+    return broadcast
+
+async def resume_broadcasts(context):
+    '''
+    Resume the broadcast interrupted by the last restart, if any (run once when the bot starts).
+    Args:
+        context (ContextTypes.DEFAULT_TYPE): The context object for accessing the application.
+    '''
+    session = get_session()
+    try:
+        job = session.query(BroadcastJob).filter_by(status='running').order_by(BroadcastJob.id).first()
+        if job is not None:
+            session.expunge(job)
+    finally:
+        session.close()
+    if job is not None and get_active_broadcast() is None:
+        logger.info("Resuming broadcast %d after recipient %d", job.id, job.cursor)
+        run_broadcast(context.application, job)
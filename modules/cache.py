@@ -0,0 +1,112 @@
+from collections import OrderedDict
+
+class LRUCache:
+    '''
+    Bounded in-process cache that evicts the least recently used entries, with hit/miss counters.
+    '''
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        '''
+        Get a cached value and mark it as recently used.
+        Args:
+            key: The cache key.
+            default: Value returned when the key is not cached.
+        Returns:
+            The cached value or the default.
+        '''
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        Store a value, evicting the least recently used entry if the cache is full.
+        Args:
+            key: The cache key.
+            value: The value to cache.
+        '''
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        '''
+        Remove a key from the cache.
+        Args:
+            key: The cache key.
+        '''
+        self._data.pop(key, None)
+
+    def clear(self):
+        '''
+        Remove all entries (the counters are kept).
+        '''
+        self._data.clear()
+
+    def stats(self) -> dict:
+        '''
+        Get the cache statistics.
+        Returns:
+            dict: size, maxsize, hits, misses and hit_rate (0..1).
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+class RotatingSet:
+    '''
+    Bounded set of recently added keys. Keys go to the current generation; when it is full, the previous
+    generation is dropped and the current one takes its place, so a key is remembered for at least
+    maxsize / 2 later additions and memory stays bounded without tracking the age of each key.
+    '''
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._current = set()
+        self._previous = set()
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def __contains__(self, key) -> bool:
+        return key in self._current or key in self._previous
+
+    def add(self, key):
+        '''
+        Remember a key, forgetting the oldest generation of keys if the set is full.
+        Args:
+            key: The key to remember.
+        '''
+        if key in self._current:
+            return
+        if len(self._current) >= self.maxsize // 2:
+            self._previous = self._current
+            self._current = set()
+        self._current.add(key)
+
+    def clear(self):
+        '''
+        Forget all keys.
+        '''
+        self._current.clear()
+        self._previous.clear()
@@ -0,0 +1,195 @@
+import html
+import re
+from typing import NamedTuple, Optional
+from telegram import Update
+from telegram.ext import ContextTypes
+from modules.database import get_session
+from modules.models import ToriItem
+from modules.load import load_messages
+from modules.search import get_search_index, normalize
+from modules.utils import get_language
+from modules.constants import MAIN_MENU
+from modules.conversation import main_menu, save_data
+
+# Separator of the /add command fields: item; location; category; price; seller
+FIELD_SEPARATOR = ';'
+FIELD_COUNT = 5
+
+# Values of the optional fields meaning "no filter"
+ANY_VALUES = {'', '-', '*'}
+
+PRICE_RANGE = re.compile(r'^(\d*)\s*-\s*(\d*)$')
+
+SELLER_WORDS = {
+    'yksityinen': ['yksityinen', 'private'],
+    'yritys': ['yritys', 'company', 'business']
+}
+
+class AddCommand(NamedTuple):
+    '''
+    A parsed /add command. Unset optional fields are None.
+    '''
+    item: str
+    location: Optional[str]
+    category: Optional[str]
+    price_from: Optional[int]
+    price_to: Optional[int]
+    seller: Optional[str]
+
+class CommandError(Exception):
+    '''
+    An /add command that can't be parsed or resolved.
+    message_key is the key of the message explaining the problem, details its format arguments.
+    '''
+
+    def __init__(self, message_key: str, **details):
+        super().__init__(message_key)
+        self.message_key = message_key
+        self.details = details
+
+def parse_price_range(text: str) -> tuple:
+    '''
+    Parse a price range: '100-500', '100-' (minimum only), '-500' or '500' (maximum only).
+    Args:
+        text (str): The price field.
+    Returns:
+        tuple: (price_from, price_to), None for unset limits.
+    '''
+    text = text.lower().replace('€', '').replace('eur', '').strip()
+    if text in ANY_VALUES:
+        return None, None
+    if text.isdigit():
+        text = f'-{text}'
+    match = PRICE_RANGE.match(text)
+    if not match:
+        raise CommandError('add_command_invalid_price')
+    price_from, price_to = (int(value) if value else None for value in match.groups())
+    if price_from == 0 or price_to == 0 or (price_from is not None and price_to is not None and price_to < price_from):
+        raise CommandError('add_command_invalid_price')
+    return price_from, price_to
+
+def parse_add_command(text: str) -> AddCommand:
+    '''
+    Parse the arguments of an /add command (without the command itself).
+    Args:
+        text (str): 'item; location; category; price; seller', only the item is required.
+    Returns:
+        AddCommand: The parsed command.
+    '''
+    fields = [field.strip() for field in text.split(FIELD_SEPARATOR)]
+    if len(fields) > FIELD_COUNT:
+        raise CommandError('add_command_usage')
+    item, location, category, price, seller = fields + [''] * (FIELD_COUNT - len(fields))
+    if not (3 <= len(item) <= 64):
+        raise CommandError('invalid_item')
+    price_from, price_to = parse_price_range(price)
+    return AddCommand(
+        item=item,
+        location=None if location in ANY_VALUES else location,
+        category=None if category in ANY_VALUES else category,
+        price_from=price_from,
+        price_to=price_to,
+        seller=None if seller in ANY_VALUES else seller
+    )
+
+def resolve_name(text: str, kind: str, language: str) -> str:
+    '''
+    Resolve a location or category name of an /add command through the catalog search index.
+    Args:
+        text (str): The typed name or path.
+        kind (str): 'categories' or 'locations'.
+        language (str): The user's language.
+    Returns:
+        str: Catalog code of the node.
+    '''
+    match, suggestions = get_search_index().resolve(text, kind, language)
+    if match is not None:
+        return match.code
+    if suggestions:
+        raise CommandError('add_command_ambiguous', text=text, options='\n'.join(suggestion.path for suggestion in suggestions))
+    raise CommandError('add_command_not_found', text=text)
+
+def resolve_seller(text: str, messages: dict) -> list:
+    '''
+    Resolve the seller type of an /add command: a button label of any seller type or one of SELLER_WORDS.
+    Args:
+        text (str): The typed seller type.
+        messages (dict): Message templates in the user's language.
+    Returns:
+        list: Dealer segments.
+    '''
+    query = normalize(text)
+    for segment, words in SELLER_WORDS.items():
+        if any(normalize(word).startswith(query) for word in words + [messages[f'dealer_segment_{segment}']]):
+            return [segment]
+    if normalize(messages['dealer_segment_all']).startswith(query):
+        return ['yksityinen', 'yritys']
+    options = ', '.join(messages[f'dealer_segment_{segment}'] for segment in ('yksityinen', 'yritys', 'all'))
+    raise CommandError('add_command_invalid_seller', options=options)
+
+def resolve_add_command(command: AddCommand, language: str) -> dict:
+    '''
+    Resolve a parsed /add command into the data collected by the wizard.
+    Args:
+        command (AddCommand): The parsed command.
+        language (str): The user's language.
+    Returns:
+        dict: item, categories, locations, dealer_segments, shipping_types, price_from and price_to
+            (categories and locations as filter codes, as save_data expects them).
+    '''
+    category = None if command.category is None else resolve_name(command.category, 'categories', language)
+    location = None if command.location is None else resolve_name(command.location, 'locations', language)
+
+    dealer_segments = ['yksityinen', 'yritys']
+    if command.seller is not None:
+        dealer_segments = resolve_seller(command.seller, load_messages(language))
+
+    return {
+        'item': command.item,
+        'categories': [category],
+        'locations': [location],
+        'dealer_segments': dealer_segments,
+        'shipping_types': ['all'],
+        'price_from': command.price_from,
+        'price_to': command.price_to
+    }
+
+async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    '''
+    Add an item with a single /add command instead of the wizard.
+    Args:
+        update (Update): The update object containing the user's message.
+        context (ContextTypes.DEFAULT_TYPE): The context object for maintaining conversation state.
+    Returns:
+        int: Next state for the conversation:
+            Default: save_data;
+            Without arguments, if the command is invalid or there's more than 10 items on the list: MAIN_MENU.
+    '''
+    telegram_id = update.message.from_user.id
+    language = get_language(telegram_id)
+    messages = load_messages(language)
+
+    arguments = update.message.text.partition(' ')[2].strip()
+    if not arguments:
+        await update.message.reply_text(messages['add_command_usage'], parse_mode='HTML')
+        return MAIN_MENU
+
+    session = get_session()
+    user_item_count = session.query(ToriItem).filter_by(telegram_id=telegram_id).count()
+    session.close()
+
+    if user_item_count >= 10:  # Limiting user to 10 items to avoid spam
+        await update.message.reply_text(messages['more_10'])
+        return await main_menu(update, context)
+
+    try:
+        data = resolve_add_command(parse_add_command(arguments), language)
+    except CommandError as e:
+        details = {key: html.escape(value) for key, value in e.details.items()}
+        await update.message.reply_text(messages[e.message_key].format(**details), parse_mode='HTML')
+        return MAIN_MENU
+
+    for key in ('category', 'subcategory', 'product_category', 'region', 'city', 'area'):
+        context.user_data.pop(key, None)
+    context.user_data.update(data)
+    return await save_data(update, context)
@@ -12,7 +12,10 @@ ADMIN_ID = int(os.getenv('ADMIN_ID')) if os.getenv('ADMIN_ID') else None
  MORE_LOCATIONS, MORE_CATEGORIES, ADDITIONAL_FILTERS, DEALER_SEGMENT,
  SHIPPING_TYPES, PRICE_FROM, PRICE_TO, MAIN_MENU, SETTINGS_MENU, CONFIRMATION,
  ADMIN_MENU, ADMIN_BROADCAST_SELECT_LANGUAGE, ADMIN_BROADCAST_MESSAGE,
- ADMIN_BROADCAST_CONFIRM) = range(22)
+ ADMIN_BROADCAST_CONFIRM, NOTIFICATIONS_MENU) = range(23)
+
+# Supported languages
+LANGUAGES = ['🇬🇧 English', '🇺🇦 Українська', '🇷🇺 Русский', '🇫🇮 Suomi']
 
 # Other constants
 ALL_CATEGORIES = ['kaikki kategoriat', 'all categories', 'все категории', 'всі категорії']
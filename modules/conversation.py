@@ -1,10 +1,15 @@
-from telegram import ReplyKeyboardMarkup, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from modules.database import get_session
 from modules.load import load_categories, load_locations, load_messages
-from modules.models import UserPreferences, ToriItem
+from modules.models import UserPreferences, ToriItem, ItemCategory, ItemLocation
 from modules.constants import *
-from modules.utils import get_language, update_categories_list, format_helsinki_time
+from modules.registry import registry
+from modules.query import QuerySpec
+from modules.keyboards import get_keyboard
+from modules.delivery import DIGEST_INTERVALS, QUIET_HOURS, get_delivery_preferences, save_delivery_preferences
+from modules.outbox import reschedule
+from modules.utils import get_language, invalidate_language, update_filter_codes, get_filter_tree, format_helsinki_time, format_categories, format_locations, get_category_code
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     '''
@@ -83,11 +88,12 @@ async def select_language(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     telegram_id = update.message.from_user.id
     session = get_session()
     user_preferences = session.query(UserPreferences).filter_by(telegram_id=telegram_id).first()
+    session.close()
 
-    if user_preferences:
+    if user_preferences and user_preferences.language:
         context.user_data['language'] = user_preferences.language
     else:
-        await update.message.reply_text('💬 Please select your preferred language:', reply_markup=ReplyKeyboardMarkup([['🇬🇧 English', '🇺🇦 Українська', '🇷🇺 Русский', '🇫🇮 Suomi']], one_time_keyboard=True))
+        await update.message.reply_text('💬 Please select your preferred language:', reply_markup=get_keyboard(None, 'languages'))
         return LANGUAGE
 
     return await main_menu(update, context)
@@ -103,11 +109,9 @@ async def select_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     '''
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
-    categories_data = load_categories(language)
     messages = load_messages(language)
 
-    keyboard = [[category] for category in categories_data]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'categories')
     await update.message.reply_text(messages['select_category'], reply_markup=reply_markup)
 
     return CATEGORY
@@ -123,12 +127,9 @@ async def select_subcategory(update: Update, context: ContextTypes.DEFAULT_TYPE)
     '''
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
-    categories_data = load_categories(language)
     messages = load_messages(language)
 
-    subcategories = categories_data[context.user_data['category']]['subcategories']
-    keyboard = [[subcategory] for subcategory in subcategories]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'subcategories', context.user_data['category'])
     await update.message.reply_text(messages['select_subcategory'], reply_markup=reply_markup)
 
     return SUBCATEGORY
@@ -164,19 +165,19 @@ async def select_product_category(update: Update, context: ContextTypes.DEFAULT_
         elif language == '🇷🇺 Русский':
             context.user_data['product_category'] = 'Все категории товаров'
 
-        if 'categories' not in context.user_data:
-            context.user_data['categories'] = []
-
         new_category = {
             'category': context.user_data.pop('category'),
             'subcategory': context.user_data.pop('subcategory'),
             'product_category': context.user_data.pop('product_category')
         }
-        context.user_data['categories'].append(new_category)
+        context.user_data['categories'] = update_filter_codes(
+            telegram_id, 'categories',
+            context.user_data.get('categories', []),
+            get_category_code(categories_data, new_category)
+        )
         return await add_more_categories(update, context)
     
-    keyboard = [[product_category] for product_category in product_categories]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'product_categories', (context.user_data['category'], context.user_data['subcategory']))
     await update.message.reply_text(messages['select_product_category'], reply_markup=reply_markup)
 
     return PRODUCT_CATEGORY
@@ -192,11 +193,9 @@ async def select_region(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     '''
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
-    locations_data = load_locations(language)
     messages = load_messages(language)
     
-    keyboard = [[region] for region in locations_data]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'regions')
     await update.message.reply_text(messages['select_region'], reply_markup=reply_markup)
 
     return REGION
@@ -212,12 +211,9 @@ async def select_city(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     '''
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
-    locations_data = load_locations(language)
     messages = load_messages(language)
 
-    cities = locations_data[context.user_data['region']]['cities']
-    keyboard = [[city] for city in cities]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'cities', context.user_data['region'])
     await update.message.reply_text(messages['select_city'], reply_markup=reply_markup)
 
     return CITY
@@ -240,8 +236,7 @@ async def select_area(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     if not areas:
         return await add_more_locations(update, context)
     
-    keyboard = [[area] for area in areas]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'areas', (context.user_data['region'], context.user_data['city']))
     await update.message.reply_text(messages['select_area'], reply_markup=reply_markup)
 
     return AREA
@@ -261,8 +256,7 @@ async def add_more_locations(update: Update, context: ContextTypes.DEFAULT_TYPE)
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [[messages['yes'], messages['no']]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'yes_no')
     await update.message.reply_text(messages['add_more_locations'], reply_markup=reply_markup)
 
     return MORE_LOCATIONS
@@ -272,8 +266,7 @@ async def add_more_categories(update: Update, context: ContextTypes.DEFAULT_TYPE
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [[messages['yes'], messages['no']]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'yes_no')
     await update.message.reply_text(messages['add_more_categories'], reply_markup=reply_markup)
 
     return MORE_CATEGORIES
@@ -291,8 +284,7 @@ async def select_additional_filters(update: Update, context: ContextTypes.DEFAUL
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [[messages['yes'], messages['no']]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+    reply_markup = get_keyboard(language, 'additional_filters')
     await update.message.reply_text(messages['add_additional_filters'], reply_markup=reply_markup)
 
     return ADDITIONAL_FILTERS
@@ -310,12 +302,7 @@ async def select_dealer_segment(update: Update, context: ContextTypes.DEFAULT_TY
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [
-        [messages['dealer_segment_yksityinen']],
-        [messages['dealer_segment_yritys']],
-        [messages['dealer_segment_all']]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'dealer_segment')
     await update.message.reply_text(messages['select_dealer_segment'], reply_markup=reply_markup)
 
     return DEALER_SEGMENT
@@ -333,11 +320,7 @@ async def select_shipping_types(update: Update, context: ContextTypes.DEFAULT_TY
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [
-        [messages['shipping_types_toridiili']],
-        [messages['shipping_types_all']]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'shipping_types')
     await update.message.reply_text(messages['select_shipping_types'], reply_markup=reply_markup)
 
     return SHIPPING_TYPES
@@ -355,8 +338,7 @@ async def select_price_from(update: Update, context: ContextTypes.DEFAULT_TYPE)
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [[messages['skip_price_from']]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'price_from')
     await update.message.reply_text(messages['select_price_from'], reply_markup=reply_markup)
 
     return PRICE_FROM
@@ -374,8 +356,7 @@ async def select_price_to(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [[messages['skip_price_to']]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
+    reply_markup = get_keyboard(language, 'price_to')
     await update.message.reply_text(messages['select_price_to'], reply_markup=reply_markup)
 
     return PRICE_TO
@@ -393,11 +374,7 @@ async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [
-        [messages['add_item'], messages['items']],
-        [messages['settings']]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=False, resize_keyboard=True)
+    reply_markup = get_keyboard(language, 'main_menu')
     await update.message.reply_text(messages['menu'], reply_markup=reply_markup)
 
     return MAIN_MENU
@@ -440,13 +417,7 @@ async def show_settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     language = get_language(telegram_id)
     messages = load_messages(language)
 
-    keyboard = [
-        [messages['change_language']],
-        [messages['contact_developer']],
-        [messages['back']]
-    ]
-
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=False)
+    reply_markup = get_keyboard(language, 'settings_menu')
     message = await update.message.reply_text(messages['settings_menu'], reply_markup=reply_markup)
     context.user_data['settings_menu_message_id'] = message.message_id
 
@@ -461,6 +432,7 @@ async def settings_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYP
     Returns:
         int: The next state in the conversation based on user choice:
             'change_language': select_language;
+            'notifications': show_notifications_menu;
             'contact_developer': messages a prompt 'contact_developer_prompt';
             'back': main_menu;
             'invalid_choice': show_settings_menu.
@@ -474,10 +446,15 @@ async def settings_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYP
     if choice == messages['change_language']:
         await update.message.reply_text(messages['change_language_prompt'])
         session = get_session()
-        session.query(UserPreferences).filter_by(telegram_id=telegram_id).delete()
+        # Only the language is reset: the other preferences stay
+        session.query(UserPreferences).filter_by(telegram_id=telegram_id).update({'language': None})
         session.commit()
         session.close()
+        registry.set_language(telegram_id, None)
+        invalidate_language(telegram_id)
         return await select_language(update, context)
+    elif choice == messages['notifications']:
+        return await show_notifications_menu(update, context)
     elif choice == messages['contact_developer']:
         await update.message.reply_text(messages['contact_developer_prompt'], parse_mode='HTML')
     elif choice == messages['back']:
@@ -486,6 +463,74 @@ async def settings_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text(messages['invalid_choice'])
         return await show_settings_menu(update, context)
 
+async def show_notifications_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    '''
+    Display the notification settings: the current delivery mode and quiet hours, with options to change them.
+    Args:
+        update (Update): The update object containing the user's message.
+        context (CallbackContext): The context object for maintaining conversation state.
+    Returns:
+        int: The next state in the conversation (NOTIFICATIONS_MENU).
+    '''
+    telegram_id = update.message.from_user.id
+    language = get_language(telegram_id)
+    messages = load_messages(language)
+    preferences = get_delivery_preferences(telegram_id)
+
+    if not preferences.is_digest:
+        delivery = messages['delivery_immediate']
+    elif preferences.digest_interval == DIGEST_INTERVALS[0]:
+        delivery = messages['delivery_digest_hourly']
+    else:
+        delivery = messages['delivery_digest_3h']
+    quiet_hours = messages['quiet_hours_on'] if preferences.quiet_start is not None else messages['quiet_hours_off']
+
+    reply_markup = get_keyboard(language, 'notifications_menu')
+    await update.message.reply_text(messages['notifications_menu'].format(delivery=delivery, quiet_hours=quiet_hours),
+                                    reply_markup=reply_markup, parse_mode='HTML')
+
+    return NOTIFICATIONS_MENU
+
+async def notifications_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    '''
+    Handle the user's choice from the notification settings. The pending notifications of the user
+    are rescheduled with the new settings.
+    Args:
+        update (Update): The update object containing the user's message.
+        context (CallbackContext): The context object for maintaining conversation state.
+    Returns:
+        int: The next state in the conversation based on user choice:
+            'back': show_settings_menu;
+            otherwise: show_notifications_menu.
+    '''
+    telegram_id = update.message.from_user.id
+    language = get_language(telegram_id)
+    messages = load_messages(language)
+
+    choice = update.message.text
+
+    if choice == messages['back']:
+        return await show_settings_menu(update, context)
+
+    if choice == messages['delivery_immediate']:
+        changes = {'mode': 'immediate'}
+    elif choice == messages['delivery_digest_hourly']:
+        changes = {'mode': 'digest', 'digest_interval': DIGEST_INTERVALS[0]}
+    elif choice == messages['delivery_digest_3h']:
+        changes = {'mode': 'digest', 'digest_interval': DIGEST_INTERVALS[1]}
+    elif choice == messages['quiet_hours_on']:
+        changes = {'quiet_start': QUIET_HOURS[0], 'quiet_end': QUIET_HOURS[1]}
+    elif choice == messages['quiet_hours_off']:
+        changes = {'quiet_start': None, 'quiet_end': None}
+    else:
+        await update.message.reply_text(messages['invalid_choice'])
+        return await show_notifications_menu(update, context)
+
+    save_delivery_preferences(telegram_id, **changes)
+    reschedule(telegram_id)
+    await update.message.reply_text(messages['notifications_saved'])
+    return await show_notifications_menu(update, context)
+
 async def show_items(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     '''
     Display the list of items added by the user with options to remove them.
@@ -508,38 +553,10 @@ async def show_items(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         for item in user_items:
             items_message = messages['item'].format(item=item.item)
             
-            has_all_categories = any(cat['category'].lower() in ALL_CATEGORIES for cat in item.categories)
             items_message += messages['categories_header']
-            if has_all_categories:
-                for cat in item.categories:
-                    if cat['category'].lower() in ALL_CATEGORIES:
-                        items_message += "  🏷️ " + cat['category']
-                        items_message += "\n"
-                        break
-            else:
-                for cat in item.categories:
-                    items_message += "  🏷️ " + cat['category']
-                    if cat['subcategory'].lower() not in ALL_SUBCATEGORIES:
-                        items_message += f" > {cat['subcategory']}"
-                        if cat['product_category'].lower() not in ALL_PRODUCT_CATEGORIES:
-                            items_message += f" > {cat['product_category']}"
-                    items_message += "\n"
-                    
-            has_whole_finland = any(loc['region'].lower() in WHOLE_FINLAND for loc in item.locations)
+            items_message += format_categories(item.categories, language)
             items_message += messages['locations_header']
-            if has_whole_finland:
-                for loc in item.locations:
-                    if loc['region'].lower() in WHOLE_FINLAND:
-                        items_message += f"  📍 {loc['region']}\n"
-                        break
-            else:
-                for loc in item.locations:
-                    items_message += "  📍 " + loc['region']
-                    if loc['city'].lower() not in ALL_CITIES:
-                        items_message += f", {loc['city']}"
-                    if 'area' in loc and loc['area'].lower() not in ALL_AREAS:
-                        items_message += f", {loc['area']}"
-                    items_message += "\n"
+            items_message += format_locations(item.locations, language)
 
             dealer_segments = item.dealer_segments if item.dealer_segments else ['yksityinen', 'yritys']
             dealer_segment_display = ""
@@ -588,7 +605,7 @@ async def show_items(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def save_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     '''
-    Save the user data and generate the search link.
+    Save the user data and start tracking the item.
     Args:
         update (Update): The update object containing the user's message.
         context (CallbackContext): The context object for maintaining conversation state.
@@ -597,8 +614,6 @@ async def save_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     '''
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
-    categories_data = load_categories(language)
-    locations_data = load_locations(language)
     messages = load_messages(language)
 
     session = get_session()
@@ -611,132 +626,42 @@ async def save_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return ConversationHandler.END
 
     item = context.user_data['item']
-    categories = context.user_data['categories']
-    
-    categories.sort(key=lambda x: (
-        x['category'].lower() in ALL_CATEGORIES,
-        x['subcategory'].lower() in ALL_SUBCATEGORIES,
-        x['product_category'].lower() in ALL_PRODUCT_CATEGORIES
-    ))
-    
-    locations = context.user_data['locations']
-    locations.sort(key=lambda x: (
-        x['region'].lower() in WHOLE_FINLAND, 
-        x['city'].lower() in ALL_CITIES,      
-        x.get('area', '').lower() in ALL_AREAS
-    ))
-    
-    tori_link = f'https://www.tori.fi/recommerce/forsale/search/api/search/SEARCH_ID_BAP_COMMON?q={item.lower()}'
-
-    has_all_categories = any(cat['category'].lower() in ALL_CATEGORIES for cat in categories)
-    if not has_all_categories:
-        for cat in categories:
-            if cat['category'].lower() not in ALL_CATEGORIES:
-                if cat['subcategory'].lower() not in ALL_SUBCATEGORIES:
-                    if cat['product_category'].lower() not in ALL_PRODUCT_CATEGORIES:
-                        product_category_code = categories_data[cat['category']]['subcategories'][cat['subcategory']]['product_categories'][cat['product_category']]
-                        tori_link += f'&product_category={product_category_code}'
-                    else:
-                        subcategory_code = categories_data[cat['category']]['subcategories'][cat['subcategory']]['subcategory_code']
-                        tori_link += f'&sub_category={subcategory_code}'
-                else:
-                    category_code = categories_data[cat['category']]['category_code']
-                    tori_link += f'&category={category_code}'
-
-    has_whole_finland = any(loc['region'].lower() in WHOLE_FINLAND for loc in locations)
-    if not has_whole_finland:
-        for loc in locations:
-            region = loc['region']
-            city = loc['city']
-            area = loc.get('area')
-            
-            if region.lower() not in WHOLE_FINLAND:
-                if city.lower() not in ALL_CITIES:
-                    if area and area.lower() not in ALL_AREAS:
-                        area_code = locations_data[region]['cities'][city]['areas'][area]
-                        tori_link += f'&location={area_code}'
-                    else:
-                        city_code = locations_data[region]['cities'][city]['city_code']
-                        tori_link += f'&location={city_code}'
-                else:
-                    region_code = locations_data[region]['region_code']
-                    tori_link += f'&location={region_code}'
 
-    dealer_segments = context.user_data.get('dealer_segments', ['yksityinen', 'yritys'])
+    category_codes = get_filter_tree(telegram_id, 'categories', context.user_data['categories']).codes()
+    has_all_categories = category_codes == [None]
 
-    # Добавляем dealer_segment только если выбран один конкретный тип
-    if len(dealer_segments) == 1:
-        if dealer_segments[0] == 'yksityinen':
-            tori_link += '&dealer_segment=1'
-        elif dealer_segments[0] == 'yritys':
-            tori_link += '&dealer_segment=3'
-    # Если выбраны оба типа - не добавляем параметр вообще
+    location_codes = get_filter_tree(telegram_id, 'locations', context.user_data['locations']).codes()
+    has_whole_finland = location_codes == [None]
 
+    dealer_segments = context.user_data.get('dealer_segments', ['yksityinen', 'yritys'])
     shipping_types = context.user_data.get('shipping_types', ['all'])
-
-    # Добавляем shipping_types=0 только если выбран ToriDiili
-    if 'toridiili' in shipping_types:
-        tori_link += '&shipping_types=0'
-    # Если выбран "all" - не добавляем параметр
-
     price_from = context.user_data.get('price_from')
     price_to = context.user_data.get('price_to')
 
-    # Добавляем параметры цены только если они указаны
-    if price_from is not None:
-        tori_link += f'&price_from={price_from}'
-    if price_to is not None:
-        tori_link += f'&price_to={price_to}'
-
-    tori_link += '&sort=PUBLISHED_DESC'
-
     new_item = ToriItem(
         item=item,
-        categories=categories,
-        locations=locations,
+        categories=[] if has_all_categories else category_codes,
+        locations=[] if has_whole_finland else location_codes,
         dealer_segments=dealer_segments,
         shipping_types=shipping_types,
         price_from=price_from,
         price_to=price_to,
         telegram_id=telegram_id,
-        link=tori_link
+        category_filters=[ItemCategory(code=code) for code in category_codes],
+        location_filters=[ItemLocation(code=code) for code in location_codes]
     )
     
     session.add(new_item)
     session.commit()
+    registry.add(new_item.id, telegram_id, QuerySpec.from_item(new_item), new_item.added_time)
 
     message = messages['item_added']
     message += messages['item'].format(item=item)
     
     message += messages['categories_header']
-    if has_all_categories:
-        for cat in categories:
-            if cat['category'].lower() in ALL_CATEGORIES:
-                message += f"  🏷️ {cat['category']}\n"
-                break
-    else:
-        for cat in categories:
-            message += "  🏷️ " + cat['category']
-            if cat['subcategory'].lower() not in ALL_SUBCATEGORIES:
-                message += f" > {cat['subcategory']}"
-                if cat['product_category'].lower() not in ALL_PRODUCT_CATEGORIES:
-                    message += f" > {cat['product_category']}"
-            message += "\n"
-    
+    message += format_categories(new_item.categories, language)
     message += messages['locations_header']
-    if has_whole_finland:
-        for loc in locations:
-            if loc['region'].lower() in WHOLE_FINLAND:
-                message += f"  📍 {loc['region']}\n"
-                break
-    else:
-        for loc in locations:
-            message += "  📍 " + loc['region']
-            if loc['city'].lower() not in ALL_CITIES:
-                message += f", {loc['city']}"
-            if 'area' in loc and loc['area'].lower() not in ALL_AREAS:
-                message += f", {loc['area']}"
-            message += "\n"
+    message += format_locations(new_item.locations, language)
 
     dealer_segment_display = ""
     if len(dealer_segments) == 2:
@@ -768,7 +693,6 @@ async def save_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         message += messages['price_range_label'].format(price_range=price_range_display)
 
     message += f"{messages['added_time'].format(time=format_helsinki_time(new_item.added_time))}"
-    #message += f'The search link for the item: {tori_link}'
     
     await update.message.reply_text(message, parse_mode='HTML')
     
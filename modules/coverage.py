@@ -0,0 +1,92 @@
+from typing import Iterable, Optional
+
+class CoverageTree:
+    '''
+    A set of category or location filter codes that keeps only the most general ones.
+    Codes are hierarchical ('0.76' ⊃ '1.76.5177' ⊃ '2.76.5177.385', None covers everything), so they are
+    stored in a tree keyed by the parts of the code: adding a code or checking whether a code is covered
+    walks at most one node per level, however many filters there are.
+    '''
+
+    def __init__(self, codes: Iterable[Optional[str]] = ()):
+        self._root = {}         # code part -> child node; a node is a dict with the same shape
+        self._codes = {}        # codes of the set in the order they were added (values unused)
+        self._everything = False
+        for code in codes:
+            self.add(code)
+
+    def __len__(self) -> int:
+        return 1 if self._everything else len(self._codes)
+
+    def __iter__(self):
+        return iter(self.codes())
+
+    @staticmethod
+    def path(code: str) -> list:
+        '''
+        Split a code into the keys of its tree path, e.g. '1.76.5177' -> ['76', '5177'] (the level prefix is dropped).
+        '''
+        return code.split('.')[1:]
+
+    def covers(self, code: Optional[str]) -> bool:
+        '''
+        Check if a code is covered by the set (equal to or below one of its codes).
+        Args:
+            code (str | None): A category or location code, None for all categories / the whole Finland.
+        Returns:
+            bool: True if the code is covered.
+        '''
+        if self._everything:
+            return True
+        if code is None:
+            return False
+        node = self._root
+        for part in self.path(code):
+            node = node.get(part)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def add(self, code: Optional[str]) -> bool:
+        '''
+        Add a code, unless it is already covered. The codes it covers are removed.
+        Args:
+            code (str | None): A category or location code, None for all categories / the whole Finland.
+        Returns:
+            bool: True if the set changed.
+        '''
+        if self.covers(code):
+            return False
+        if code is None:
+            self._everything = True
+            self._root = {}
+            self._codes = {}
+            return True
+
+        node = self._root
+        for part in self.path(code):
+            node = node.setdefault(part, {})
+        self._remove_below(node)
+        node.clear()
+        node[None] = code       # the None key marks a code of the set: its whole subtree is covered
+        self._codes[code] = None
+        return True
+
+    def _remove_below(self, node: dict):
+        for part, child in node.items():
+            if part is None:
+                del self._codes[child]
+            else:
+                self._remove_below(child)
+
+    def codes(self) -> list:
+        '''
+        Get the codes of the set.
+        Returns:
+            list: The codes in the order they were added, or [None] if the set covers everything.
+        '''
+        if self._everything:
+            return [None]
+        return list(self._codes)
@@ -0,0 +1,133 @@
+import pytz
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from modules.models import UserPreferences
+from modules.database import get_session
+from modules.cache import LRUCache
+from modules.utils import convert_to_helsinki_time
+
+# Maximum number of users whose delivery preferences are kept in memory
+DELIVERY_CACHE_SIZE = 10000
+
+# Digest intervals offered in the settings, in minutes
+DIGEST_INTERVALS = (60, 180)
+
+# Quiet hours offered in the settings (Helsinki time)
+QUIET_HOURS = (23, 8)
+
+HELSINKI = pytz.timezone('Europe/Helsinki')
+
+class DeliveryPreferences(NamedTuple):
+    '''
+    How a user wants to get the notifications (see UserPreferences).
+    '''
+    mode: str = 'immediate'
+    digest_interval: int = DIGEST_INTERVALS[0]
+    quiet_start: Optional[int] = None
+    quiet_end: Optional[int] = None
+
+    @property
+    def is_digest(self) -> bool:
+        return self.mode == 'digest'
+
+DEFAULT_DELIVERY = DeliveryPreferences()
+
+delivery_cache = LRUCache(DELIVERY_CACHE_SIZE)
+
+def get_delivery_preferences(telegram_id: int) -> DeliveryPreferences:
+    '''
+    Get the user's delivery preferences.
+    Preferences are cached in memory; save_delivery_preferences keeps the cache up to date.
+    Args:
+        telegram_id (int): The user's Telegram ID.
+    Returns:
+        DeliveryPreferences: The user's preferences, or DEFAULT_DELIVERY if they have none.
+    '''
+    preferences = delivery_cache.get(telegram_id)
+    if preferences is not None:
+        return preferences
+
+    session = get_session()
+    row = (session.query(UserPreferences.delivery_mode, UserPreferences.digest_interval,
+                         UserPreferences.quiet_start, UserPreferences.quiet_end)
+           .filter_by(telegram_id=telegram_id)
+           .first())
+    session.close()
+    preferences = DEFAULT_DELIVERY
+    if row is not None:
+        preferences = DeliveryPreferences(
+            mode=row.delivery_mode or DEFAULT_DELIVERY.mode,
+            digest_interval=row.digest_interval or DEFAULT_DELIVERY.digest_interval,
+            quiet_start=row.quiet_start,
+            quiet_end=row.quiet_end
+        )
+    delivery_cache.put(telegram_id, preferences)
+    return preferences
+
+def save_delivery_preferences(telegram_id: int, **changes) -> DeliveryPreferences:
+    '''
+    Change some of the user's delivery preferences.
+    Args:
+        telegram_id (int): The user's Telegram ID.
+        **changes: New values of DeliveryPreferences fields.
+    Returns:
+        DeliveryPreferences: The updated preferences.
+    '''
+    preferences = get_delivery_preferences(telegram_id)._replace(**changes)
+    session = get_session()
+    user_preferences = session.query(UserPreferences).filter_by(telegram_id=telegram_id).first()
+    if user_preferences is None:
+        user_preferences = UserPreferences(telegram_id=telegram_id)
+        session.add(user_preferences)
+    user_preferences.delivery_mode = preferences.mode
+    user_preferences.digest_interval = preferences.digest_interval
+    user_preferences.quiet_start = preferences.quiet_start
+    user_preferences.quiet_end = preferences.quiet_end
+    session.commit()
+    session.close()
+    delivery_cache.put(telegram_id, preferences)
+    return preferences
+
+def is_quiet(preferences: DeliveryPreferences, helsinki_time: datetime) -> bool:
+    '''
+    Check if a time falls in the user's quiet hours.
+    Args:
+        preferences (DeliveryPreferences): The user's preferences.
+        helsinki_time (datetime): The time in Helsinki.
+    Returns:
+        bool: True if notifications have to wait.
+    '''
+    start, end = preferences.quiet_start, preferences.quiet_end
+    if start is None or end is None or start == end:
+        return False
+    hour = helsinki_time.hour
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+def get_delivery_time(preferences: DeliveryPreferences, now: Optional[datetime] = None) -> datetime:
+    '''
+    Get the time a notification queued now should be sent at: right away, at the next digest
+    (digests are aligned to the interval from midnight in Helsinki, e.g. 9:00, 12:00, 15:00 for 3 hours),
+    and in both cases after the quiet hours if it falls in them.
+    Args:
+        preferences (DeliveryPreferences): The user's preferences.
+        now (datetime): The current local time (by default datetime.now()).
+    Returns:
+        datetime: The local time to send at.
+    '''
+    now = now or datetime.now()
+    wall_time = convert_to_helsinki_time(now).replace(tzinfo=None)
+    delivery_time = wall_time
+    if preferences.is_digest:
+        interval = timedelta(minutes=preferences.digest_interval)
+        midnight = wall_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        delivery_time = midnight + ((wall_time - midnight) // interval + 1) * interval
+    if is_quiet(preferences, delivery_time):
+        quiet_end = delivery_time.replace(hour=preferences.quiet_end, minute=0, second=0, microsecond=0)
+        if quiet_end <= delivery_time:
+            quiet_end += timedelta(days=1)
+        delivery_time = quiet_end
+    if delivery_time == wall_time:
+        return now
+    return HELSINKI.localize(delivery_time).astimezone().replace(tzinfo=None)
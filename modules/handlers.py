@@ -1,13 +1,17 @@
-from telegram.ext import Application, CommandHandler, MessageHandler, ConversationHandler, CallbackQueryHandler, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, ConversationHandler, CallbackQueryHandler, InlineQueryHandler, filters
 from modules.utils import remove_item, cancel
+from modules.inline import inline_search
+from modules.command import add_command
+from modules.broadcast import CANCEL_CALLBACK
+from modules.router import TEXT, build_conversation
 from modules.constants import *
 from modules.admin import (
     admin_panel,
     admin_menu_choice,
-    select_broadcast_language,
     save_broadcast_language,
     save_broadcast_message,
     confirm_broadcast,
+    cancel_broadcast,
     cancel_admin
 )
 from modules.save import (
@@ -27,114 +31,52 @@ from modules.save import (
     save_price_from,
     save_price_to
 )
-from modules.conversation import start, start_again, save_data, main_menu_choice, settings_menu_choice, show_items, main_menu, show_settings_menu
+from modules.conversation import start, start_again, save_data, main_menu_choice, settings_menu_choice, notifications_menu_choice, show_items, main_menu, show_settings_menu
 
-def setup_handlers(application: Application):
-    new_user_handler = ConversationHandler(
-        entry_points=[MessageHandler(filters.TEXT & ~filters.COMMAND, start),
-                      CommandHandler('start', start)],
-        states={
-            SETTINGS_MENU: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, settings_menu_choice),
-                CommandHandler('menu', main_menu),
-                CommandHandler('settings', show_settings_menu),
-                CommandHandler('items', show_items)
-            ],
-            MAIN_MENU: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu_choice),
-                CommandHandler('menu', main_menu),
-                CommandHandler('settings', show_settings_menu),
-                CommandHandler('items', show_items)
-            ],
-            LANGUAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_language)],
-            ITEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_item_name)],
-            CATEGORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_category)],
-            SUBCATEGORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_subcategory)],
-            PRODUCT_CATEGORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_product_category)],
-            REGION: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_region)],
-            CITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_city)],
-            AREA: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_area)],
-            MORE_LOCATIONS: [MessageHandler(filters.TEXT & ~filters.COMMAND, more_locations_response)],
-            MORE_CATEGORIES: [MessageHandler(filters.TEXT & ~filters.COMMAND, more_categories_response)],
-            ADDITIONAL_FILTERS: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_additional_filters_choice)],
-            DEALER_SEGMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_dealer_segment)],
-            SHIPPING_TYPES: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_shipping_types)],
-            PRICE_FROM: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_price_from)],
-            PRICE_TO: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_price_to)],
-            CONFIRMATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_data)],
-        },
-        fallbacks=[CommandHandler('cancel', cancel)],
-        name="new_user_conversation"
-    )
+# The user conversation as a transition table: what each message does in each state.
+# Plain text is handled by the callback of the current state; the commands work in every state.
+TEXT_ROUTES = {
+    MAIN_MENU: main_menu_choice,
+    SETTINGS_MENU: settings_menu_choice,
+    NOTIFICATIONS_MENU: notifications_menu_choice,
+    LANGUAGE: save_language,
+    ITEM: save_item_name,
+    CATEGORY: save_category,
+    SUBCATEGORY: save_subcategory,
+    PRODUCT_CATEGORY: save_product_category,
+    REGION: save_region,
+    CITY: save_city,
+    AREA: save_area,
+    MORE_LOCATIONS: more_locations_response,
+    MORE_CATEGORIES: more_categories_response,
+    ADDITIONAL_FILTERS: save_additional_filters_choice,
+    DEALER_SEGMENT: save_dealer_segment,
+    SHIPPING_TYPES: save_shipping_types,
+    PRICE_FROM: save_price_from,
+    PRICE_TO: save_price_to,
+    CONFIRMATION: save_data,
+}
 
-    returning_user_handler = ConversationHandler(
-        entry_points=[MessageHandler(filters.TEXT & ~filters.COMMAND, start_again),
-                      CommandHandler('start', start_again)],
-        states={
-            SETTINGS_MENU: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, settings_menu_choice),
-                CommandHandler('menu', main_menu),
-                CommandHandler('settings', show_settings_menu),
-                CommandHandler('items', show_items)
-            ],
-            MAIN_MENU: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu_choice),
-                CommandHandler('menu', main_menu),
-                CommandHandler('settings', show_settings_menu),
-                CommandHandler('items', show_items)
-            ],
-            LANGUAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_language)],
-            ITEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_item_name)],
-            CATEGORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_category)],
-            SUBCATEGORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_subcategory)],
-            PRODUCT_CATEGORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_product_category)],
-            REGION: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_region)],
-            CITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_city)],
-            AREA: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_area)],
-            MORE_LOCATIONS: [MessageHandler(filters.TEXT & ~filters.COMMAND, more_locations_response)],
-            MORE_CATEGORIES: [MessageHandler(filters.TEXT & ~filters.COMMAND, more_categories_response)],
-            ADDITIONAL_FILTERS: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_additional_filters_choice)],
-            DEALER_SEGMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_dealer_segment)],
-            SHIPPING_TYPES: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_shipping_types)],
-            PRICE_FROM: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_price_from)],
-            PRICE_TO: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_price_to)],
-            CONFIRMATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_data)],
-        },
-        fallbacks=[CommandHandler('cancel', cancel)],
-        name="returning_user_conversation",
-        allow_reentry=True
-    )
+COMMAND_ROUTES = {
+    'start': start_again,
+    'menu': main_menu,
+    'settings': show_settings_menu,
+    'items': show_items,
+    'add': add_command,
+    'cancel': cancel,
+}
 
-    application.add_handler(new_user_handler)
-    application.add_handler(returning_user_handler)
-
-    fallback_handler = ConversationHandler(
-        entry_points=[
-            CommandHandler('menu', main_menu),
-            CommandHandler('settings', show_settings_menu),
-            CommandHandler('items', show_items)
-        ],
-        states={
-            SETTINGS_MENU: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, settings_menu_choice),
-                CommandHandler('menu', main_menu),
-                CommandHandler('settings', show_settings_menu),
-                CommandHandler('items', show_items)
-            ],
-            MAIN_MENU: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu_choice),
-                CommandHandler('menu', main_menu),
-                CommandHandler('settings', show_settings_menu),
-                CommandHandler('items', show_items)
-            ]
-        },
-        fallbacks=[CommandHandler('cancel', cancel)],
-        name="fallback_conversation",
-        allow_reentry=True
-    )
-    
-    application.add_handler(fallback_handler)
+# Messages of a user who is not in the conversation (new, or after /cancel)
+ENTRY_ROUTES = {
+    TEXT: start,
+    'start': start,
+    'menu': main_menu,
+    'settings': show_settings_menu,
+    'items': show_items,
+    'add': add_command,
+}
 
+def setup_handlers(application: Application):
     # Admin panel handler
     admin_handler = ConversationHandler(
         entry_points=[CommandHandler('admin', admin_panel)],
@@ -154,8 +96,13 @@ def setup_handlers(application: Application):
         },
         fallbacks=[CommandHandler('cancel', cancel_admin)],
         name="admin_conversation",
-        allow_reentry=True
+        allow_reentry=True,
+        persistent=True
     )
 
+    # The admin conversation goes first: while the admin is in it, it takes their messages before the user conversation
     application.add_handler(admin_handler)
-    application.add_handler(CallbackQueryHandler(remove_item))
\ No newline at end of file
+    application.add_handler(build_conversation('user_conversation', ENTRY_ROUTES, COMMAND_ROUTES, TEXT_ROUTES, persistent=True))
+    application.add_handler(CallbackQueryHandler(cancel_broadcast, pattern=f'^{CANCEL_CALLBACK}$'))
+    application.add_handler(CallbackQueryHandler(remove_item))
+    application.add_handler(InlineQueryHandler(inline_search))
\ No newline at end of file
@@ -0,0 +1,51 @@
+from telegram import Update, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import ContextTypes
+from modules.search import get_search_index
+from modules.utils import get_language
+
+# Maximum number of results in an inline answer (Telegram accepts up to 50)
+INLINE_RESULTS_LIMIT = 20
+
+# Seconds Telegram may cache an inline answer
+INLINE_CACHE_TIME = 300
+
+INLINE_ICONS = {
+    'categories': '🗂',
+    'locations': '📍'
+}
+
+def build_inline_results(text: str, language: str, limit: int = INLINE_RESULTS_LIMIT) -> list:
+    '''
+    Search the category and location catalogs for an inline query.
+    Args:
+        text (str): The query typed by the user.
+        language (str): The user's language.
+        limit (int): Maximum number of results.
+    Returns:
+        list: InlineQueryResultArticle objects, best match first. Choosing one sends the full path of
+            the node (e.g. 'Uusimaa › Helsinki'), which the region and category steps of the wizard accept.
+    '''
+    results = []
+    for match in get_search_index().search(text, None, language, limit=limit):
+        results.append(InlineQueryResultArticle(
+            id=f'{match.kind}:{match.code}',
+            title=f'{INLINE_ICONS[match.kind]} {match.label}',
+            description=match.path if len(match.names) > 1 else None,
+            input_message_content=InputTextMessageContent(match.path)
+        ))
+    return results
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    '''
+    Answer an inline query with the matching categories and locations.
+    Args:
+        update (Update): The update object containing the inline query.
+        context (ContextTypes.DEFAULT_TYPE): The context object.
+    '''
+    query = update.inline_query
+    if not query.query.strip():
+        await query.answer([], cache_time=INLINE_CACHE_TIME)
+        return
+
+    language = get_language(query.from_user.id)
+    await query.answer(build_inline_results(query.query, language), cache_time=INLINE_CACHE_TIME, is_personal=True)
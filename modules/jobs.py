@@ -1,31 +1,49 @@
+import asyncio
 import requests
-from telegram import Update
 from telegram.ext import ContextTypes
-from telegram.error import Forbidden, BadRequest
+from sqlalchemy import update
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
-from modules.load import load_messages
 from modules.models import ToriItem
 from modules.database import get_session
-from modules.utils import get_language
+from modules.registry import registry, SubscriptionRegistry
+from modules.query import build_url
+from modules.broadcast import resume_broadcasts
+from modules.outbox import OUTBOX_INTERVAL, outbox_entry, enqueue, deliver_outbox, prune_outbox
+
+# Interval of the slow consistency check of the subscription registry against the database
+REGISTRY_RECONCILE_INTERVAL = 3600
+
+# Interval of the deletion of old notifications from the outbox
+OUTBOX_PRUNE_INTERVAL = 3600
+
+# Seconds to wait for the tori API (connecting, and then for the response)
+TORI_API_TIMEOUT = (5, 30)
 
 async def check_for_new_items(context: ContextTypes.DEFAULT_TYPE):
     '''
-    Check for new items on the external API and notify the user if there are any.
+    Check for new items on the external API and queue notifications about them in the outbox.
+    Subscriptions come from the in-memory registry; items sharing the same query spec are fetched once.
+    A spec's notifications and the new latest times of its items are committed together, so an ad is
+    neither lost nor queued twice if the bot stops midway; the outbox worker then delivers them.
     Args:
         context (ContextTypes.DEFAULT_TYPE): The context object for accessing bot and job queue.
     '''
     session = get_session()
+    checked_count = 0
+    matched_count = 0
     try:
-        items = session.query(ToriItem).all()
-        print(f"Checking {len(items)} items")
-        for item in items:
-            print(f"Processing item: {item.item}, URL: {item.link}")
-            telegram_id = item.telegram_id
-            language = get_language(telegram_id)
-            messages = load_messages(language)
-
-            response = requests.get(item.link)
+        for spec, subscriptions in registry.queries():
+            checked_count += len(subscriptions)
+
+            link = build_url(spec)
+            print(f"Processing {len(subscriptions)} item(s), URL: {link}")
+            try:
+                # In a thread, so the handlers keep running while the API answers
+                response = await asyncio.to_thread(requests.get, link, timeout=TORI_API_TIMEOUT)
+            except requests.RequestException as e:
+                print(f"API request failed: {e}")
+                continue
             print(f"API response status: {response.status_code}")
 
             if response.status_code != 200:
@@ -46,67 +64,61 @@ async def check_for_new_items(context: ContextTypes.DEFAULT_TYPE):
             if not new_items:
                 continue
 
-            latest_time = item.latest_time or item.added_time
-            #print(f"Latest time from DB: {latest_time}")
-            latest_item_time = None
-
-            for ad in new_items:
-                timestamp = ad.get('timestamp')
-                if timestamp is None:
-                    #print("Missing timestamp, skipping item")
-                    continue
-
-                item_time = datetime.fromtimestamp(timestamp / 1000.0)
-                #print(f"Item time: {item_time}, Compare result: {item_time > latest_time}")
-
-                if item_time <= latest_time:
-                    #print("Item is not new, skipping")
-                    continue
-                
-                itemname = ad.get('heading')
-                #print(f"Name field: {itemname}")
-                region = ad.get('location')
-                #print(f"Region: {region}")
-                canonical_url = ad.get('canonical_url')
-                #print(f"URL: {canonical_url}")
-                price = ad.get('price', {}).get('amount')
-                #print(f"Price: {price}")
-                image = ad.get('image')
-                image_url = image.get('url') if image else None
-                #print(f"Image URL: {image_url}")
-                message = messages['new_item'].format(itemname=itemname, region=region, price=price, canonical_url=canonical_url)
-                
-                try:
-                    if image_url:
-                        await context.bot.send_photo(item.telegram_id, photo=image_url, caption=message, parse_mode='HTML')
-                    else:
-                        await context.bot.send_message(item.telegram_id, text=message, parse_mode='HTML')
-                except Forbidden:
-                    print(f"User {item.telegram_id} has blocked the bot. Removing their items from the database.")
-                    session.query(ToriItem).filter_by(telegram_id=item.telegram_id).delete()
-                    session.commit()
-                    break
-                except BadRequest as e:
-                    print(f"Bad request for user {item.telegram_id}: {e}")
-                    continue
-                except Exception as e:
-                    print(f"Unexpected error for user {item.telegram_id}: {e}")
-                    continue
-
-                if latest_item_time is None or item_time > latest_item_time:
-                    latest_item_time = item_time
-
-            if latest_item_time:
-                latest_time = latest_item_time
-                item.latest_time = latest_time
-                session.add(item)
+            entries = []
+            latest_time_updates = []
+            for item_id, telegram_id, latest_time in subscriptions:
+                latest_item_time = None
+
+                for ad in new_items:
+                    timestamp = ad.get('timestamp')
+                    if timestamp is None:
+                        #print("Missing timestamp, skipping item")
+                        continue
+
+                    item_time = datetime.fromtimestamp(timestamp / 1000.0)
+                    #print(f"Item time: {item_time}, Compare result: {item_time > latest_time}")
+
+                    if item_time <= latest_time:
+                        #print("Item is not new, skipping")
+                        continue
+
+                    entries.append(outbox_entry(telegram_id, item_id, ad, spec.text))
+                    if latest_item_time is None or item_time > latest_item_time:
+                        latest_item_time = item_time
+
+                if latest_item_time:
+                    latest_time_updates.append({'id': item_id, 'latest_time': latest_item_time})
+
+            if latest_time_updates:
+                matched_count += enqueue(session, entries)
+                session.execute(update(ToriItem), latest_time_updates)
                 session.commit()
-    
+                for latest_time_update in latest_time_updates:
+                    registry.set_latest_time(latest_time_update['id'], latest_time_update['latest_time'])
+
+        print(f"Checked {checked_count} items, matched {matched_count} new ad(s)")
+
     except SQLAlchemyError as e:
+        session.rollback()
         print(f"Database error: {e}")
     finally:
         session.close()
-    session.close()
+
+    await deliver_outbox(context)
+
+async def reconcile_registry(context: ContextTypes.DEFAULT_TYPE):
+    '''
+    Check the in-memory subscription registry against the database and rebuild it if they differ.
+    The database is read in a thread, so the handlers keep running; the registries are compared and swapped here.
+    Args:
+        context (ContextTypes.DEFAULT_TYPE): The context object for accessing bot and job queue.
+    '''
+    try:
+        version = registry.version
+        fresh = await asyncio.to_thread(SubscriptionRegistry.from_database)
+        registry.reconcile(fresh, version)
+    except SQLAlchemyError as e:
+        print(f"Database error: {e}")
 
 def setup_jobs(job_queue):
     '''
@@ -116,5 +128,13 @@ def setup_jobs(job_queue):
     '''
     async def wrapper(context):
         await check_for_new_items(context)
+
+    registry.load()
+    print(f"Loaded {len(registry)} items into the subscription registry")
+
     # interval is in seconds; 300 seconds = 5 minutes; please don't put it lower than thst, it's pointless.
     job_queue.run_repeating(check_for_new_items, interval=300, first=0)
+    job_queue.run_repeating(reconcile_registry, interval=REGISTRY_RECONCILE_INTERVAL, first=REGISTRY_RECONCILE_INTERVAL)
+    job_queue.run_once(resume_broadcasts, when=0)
+    job_queue.run_repeating(deliver_outbox, interval=OUTBOX_INTERVAL, first=OUTBOX_INTERVAL)
+    job_queue.run_repeating(prune_outbox, interval=OUTBOX_PRUNE_INTERVAL, first=OUTBOX_PRUNE_INTERVAL)
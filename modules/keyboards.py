@@ -0,0 +1,109 @@
+from telegram import ReplyKeyboardMarkup
+from modules.cache import LRUCache
+from modules.constants import LANGUAGES
+from modules.load import load_categories, load_locations, load_messages
+
+# Maximum number of prebuilt keyboards kept in memory
+KEYBOARD_CACHE_SIZE = 4096
+
+keyboard_cache = LRUCache(KEYBOARD_CACHE_SIZE)
+
+def _column(buttons) -> list:
+    return [[button] for button in buttons]
+
+def _build_keyboard(menu: str, node, categories: dict = None, locations: dict = None, messages: dict = None) -> ReplyKeyboardMarkup:
+    '''
+    Build a reply keyboard from the catalogs.
+    Args:
+        menu (str): Menu name (see get_keyboard).
+        node: Catalog node the menu is shown for (category/region name or (parent, child) names), None for flat menus.
+        categories (dict): Category data.
+        locations (dict): Location data.
+        messages (dict): Message templates.
+    Returns:
+        ReplyKeyboardMarkup: The keyboard.
+    '''
+    if menu == 'languages':
+        return ReplyKeyboardMarkup([LANGUAGES], one_time_keyboard=True)
+    if menu == 'categories':
+        return ReplyKeyboardMarkup(_column(categories), one_time_keyboard=True)
+    if menu == 'subcategories':
+        return ReplyKeyboardMarkup(_column(categories[node]['subcategories']), one_time_keyboard=True)
+    if menu == 'product_categories':
+        category, subcategory = node
+        return ReplyKeyboardMarkup(_column(categories[category]['subcategories'][subcategory]['product_categories']), one_time_keyboard=True)
+    if menu == 'regions':
+        return ReplyKeyboardMarkup(_column(locations), one_time_keyboard=True)
+    if menu == 'cities':
+        return ReplyKeyboardMarkup(_column(locations[node]['cities']), one_time_keyboard=True)
+    if menu == 'areas':
+        region, city = node
+        return ReplyKeyboardMarkup(_column(locations[region]['cities'][city]['areas']), one_time_keyboard=True)
+    if menu == 'yes_no':
+        return ReplyKeyboardMarkup([[messages['yes'], messages['no']]], one_time_keyboard=True)
+    if menu == 'additional_filters':
+        return ReplyKeyboardMarkup([[messages['yes'], messages['no']]], one_time_keyboard=True, resize_keyboard=True)
+    if menu == 'dealer_segment':
+        return ReplyKeyboardMarkup([
+            [messages['dealer_segment_yksityinen']],
+            [messages['dealer_segment_yritys']],
+            [messages['dealer_segment_all']]
+        ], one_time_keyboard=True)
+    if menu == 'shipping_types':
+        return ReplyKeyboardMarkup([
+            [messages['shipping_types_toridiili']],
+            [messages['shipping_types_all']]
+        ], one_time_keyboard=True)
+    if menu == 'price_from':
+        return ReplyKeyboardMarkup([[messages['skip_price_from']]], one_time_keyboard=True)
+    if menu == 'price_to':
+        return ReplyKeyboardMarkup([[messages['skip_price_to']]], one_time_keyboard=True)
+    if menu == 'main_menu':
+        return ReplyKeyboardMarkup([
+            [messages['add_item'], messages['items']],
+            [messages['settings']]
+        ], one_time_keyboard=False, resize_keyboard=True)
+    if menu == 'settings_menu':
+        return ReplyKeyboardMarkup([
+            [messages['change_language']],
+            [messages['notifications']],
+            [messages['contact_developer']],
+            [messages['back']]
+        ], one_time_keyboard=False)
+    if menu == 'notifications_menu':
+        return ReplyKeyboardMarkup([
+            [messages['delivery_immediate']],
+            [messages['delivery_digest_hourly'], messages['delivery_digest_3h']],
+            [messages['quiet_hours_on'], messages['quiet_hours_off']],
+            [messages['back']]
+        ], one_time_keyboard=False, resize_keyboard=True)
+    raise ValueError(f"Unknown keyboard '{menu}'")
+
+def get_keyboard(language: str, menu: str, node=None) -> ReplyKeyboardMarkup:
+    '''
+    Get a reply keyboard, built on first use and reused afterwards (keyboards are immutable, so one
+    instance can be sent to any number of users). A cached keyboard is rebuilt only if the catalogs
+    it was built from have been reloaded.
+    Args:
+        language (str): The user's language (ignored for 'languages').
+        menu (str): Menu name: 'languages', 'categories', 'subcategories', 'product_categories', 'regions',
+            'cities', 'areas', 'yes_no', 'additional_filters', 'dealer_segment', 'shipping_types',
+            'price_from', 'price_to', 'main_menu', 'settings_menu' or 'notifications_menu'.
+        node: Catalog node for the nested menus: the category name for 'subcategories', (category, subcategory)
+            for 'product_categories', the region name for 'cities' and (region, city) for 'areas'.
+    Returns:
+        ReplyKeyboardMarkup: The keyboard.
+    '''
+    if menu == 'languages':
+        language = None
+        catalogs = ()
+    else:
+        catalogs = (load_categories(language), load_locations(language), load_messages(language))
+    key = (language, menu, node)
+    cached = keyboard_cache.get(key)
+    if cached is not None and all(old is new for old, new in zip(cached[0], catalogs)):
+        return cached[1]
+
+    reply_markup = _build_keyboard(menu, node, *catalogs)
+    keyboard_cache.put(key, (catalogs, reply_markup))
+    return reply_markup
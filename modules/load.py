@@ -1,47 +1,147 @@
 import json
 import os
+from functools import lru_cache
+from types import MappingProxyType
+from modules.constants import LANGUAGES
 
-def load_categories(language: str) -> dict:
+CATALOG_NAMES = {
+    'categories': 'Category',
+    'locations': 'Location',
+    'messages': 'Messages'
+}
+
+def freeze(value):
+    '''
+    Recursively turn parsed JSON into read-only structures (dicts become mappingproxies, lists become tuples),
+    so one copy of a catalog can be shared by all handlers.
+    Args:
+        value: Parsed JSON value.
+    Returns:
+        The read-only value.
     '''
-    Load category data from a JSON file based on the specified language.
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+@lru_cache(maxsize=None)
+def load_catalog(kind: str, language: str):
+    '''
+    Load a catalog from its JSON file, once per (kind, language); later calls return the cached copy.
     Args:
+        kind (str): Catalog kind ('categories', 'locations' or 'messages').
         language (str): Language code.
     Returns:
-        dict: Category data.
+        MappingProxyType: Read-only catalog data.
     '''
-    file_path = f'jsons/categories/{language}.json'
+    file_path = f'jsons/{kind}/{language}.json'
     if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Category file for language '{language}' not found.")
+        raise FileNotFoundError(f"{CATALOG_NAMES[kind]} file for language '{language}' not found.")
     with open(file_path, encoding='utf-8') as f:
-        categories_data = json.load(f)
-    return categories_data
+        return freeze(json.load(f))
+
+def iter_catalog_nodes(kind: str, data: dict):
+    '''
+    Walk a category or location catalog. The "all ..." nodes have no code and are skipped.
+    Args:
+        kind (str): 'categories' or 'locations'.
+        data (dict): Catalog data in one language.
+    Yields:
+        tuple: (code, names) where names is the path of the node from the top level down.
+    '''
+    if kind == 'categories':
+        levels = (('category_code', 'subcategories'), ('subcategory_code', 'product_categories'))
+    else:
+        levels = (('region_code', 'cities'), ('city_code', 'areas'))
+
+    def walk(nodes, depth, parents):
+        for name, node in (nodes or {}).items():
+            if node is None:
+                continue
+            if isinstance(node, str):
+                yield node, parents + (name,)
+                continue
+            code_key, children_key = levels[depth]
+            yield node[code_key], parents + (name,)
+            yield from walk(node.get(children_key), depth + 1, parents + (name,))
+
+    yield from walk(data, 0, ())
+
+def preload_catalogs() -> None:
+    '''
+    Load the catalogs of all supported languages, so the first updates don't pay for parsing them.
+    '''
+    for language in LANGUAGES:
+        for kind in CATALOG_NAMES:
+            load_catalog(kind, language)
+
+def load_categories(language: str) -> dict:
+    '''
+    Load category data based on the specified language.
+    Args:
+        language (str): Language code.
+    Returns:
+        dict: Category data (read-only, shared between callers).
+    '''
+    return load_catalog('categories', language)
 
 def load_locations(language: str) -> dict:
     '''
-    Load location data from a JSON file based on the specified language.
+    Load location data based on the specified language.
     Args:
         language (str): Language code.
     Returns:
-        dict: Location data.
+        dict: Location data (read-only, shared between callers).
     '''
-    file_path = f'jsons/locations/{language}.json'
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Location file for language '{language}' not found.")
-    with open(file_path, encoding='utf-8') as f:
-        locations_data = json.load(f)
-    return locations_data
+    return load_catalog('locations', language)
 
 def load_messages(language: str) -> dict:
     '''
-    Load message templates from a JSON file based on the specified language.
+    Load message templates based on the specified language.
     Args:
         language (str): Language code.
     Returns:
-        dict: Message templates.
+        dict: Message templates (read-only, shared between callers).
     '''
-    file_path = f'jsons/messages/{language}.json'
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Messages file for language '{language}' not found.")
-    with open(file_path, encoding='utf-8') as f:
-        messages_data = json.load(f)
-    return messages_data
+    return load_catalog('messages', language)
+
+@lru_cache(maxsize=None)
+def get_catalog_names(kind: str, language: str) -> dict:
+    '''
+    Index a category or location catalog by code.
+    Args:
+        kind (str): 'categories' or 'locations'.
+        language (str): Language code.
+    Returns:
+        dict: {code: names of the node and its parents from the top level down}.
+    '''
+    return dict(iter_catalog_nodes(kind, load_catalog(kind, language)))
+
+@lru_cache(maxsize=None)
+def get_all_labels(language: str) -> dict:
+    '''
+    Get the names of the "all ..." catalog entries (the ones without a code) in a language.
+    Args:
+        language (str): Language code.
+    Returns:
+        dict: Names for 'category', 'subcategory', 'product_category', 'region', 'city' and 'area'.
+    '''
+    def all_label(nodes: dict) -> str:
+        return next(name for name, node in nodes.items() if node is None)
+
+    categories_data = load_categories(language)
+    locations_data = load_locations(language)
+    subcategories = [category['subcategories'] for category in categories_data.values() if category]
+    product_categories = [subcategory['product_categories'] for nodes in subcategories for subcategory in nodes.values()
+                          if subcategory and subcategory['product_categories']]
+    cities = [region['cities'] for region in locations_data.values() if region]
+    areas = [city['areas'] for nodes in cities for city in nodes.values() if city and city['areas']]
+    return {
+        'category': all_label(categories_data),
+        'subcategory': all_label(subcategories[0]),
+        'product_category': all_label(product_categories[0]),
+        'region': all_label(locations_data),
+        'city': all_label(cities[0]),
+        'area': all_label(areas[0])
+    }
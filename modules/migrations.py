@@ -0,0 +1,454 @@
+import logging
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from sqlalchemy import (Table, Column, Integer, BigInteger, String, DateTime, MetaData, ForeignKey, Index, inspect, select,
+                        update, insert, text, bindparam, func)
+from modules.database import engine
+from modules.models import Base, SchemaMigration, JSONType
+from modules.constants import LANGUAGES
+from modules.load import load_categories, load_locations
+
+logger = logging.getLogger(__name__)
+
+# Number of rows read and rewritten at once by the data migrations
+MIGRATION_BATCH_SIZE = 1000
+
+# Registered migrations as (version, name, function) tuples
+MIGRATIONS = []
+
+def migration(version: int, name: str):
+    '''
+    Register a function as a schema migration.
+    Every migration gets a connection with an open transaction; the transaction is committed together
+    with the record of the applied version, so a failing migration leaves the database untouched.
+    Migrations have to use Core statements on explicit columns (not the ORM models), because the models
+    describe the latest schema, not the one the migration runs against.
+    Args:
+        version (int): Unique, increasing version number.
+        name (str): Short description of the migration.
+    '''
+    def register(function):
+        MIGRATIONS.append((version, name, function))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return function
+    return register
+
+def get_table(connection, name: str) -> Table:
+    '''
+    Reflect a table as it currently exists in the database.
+    Args:
+        connection (Connection): The database connection.
+        name (str): Table name.
+    Returns:
+        Table: The reflected table.
+    '''
+    return Table(name, MetaData(), autoload_with=connection)
+
+def column_exists(connection, table_name: str, column_name: str) -> bool:
+    '''
+    Check if a column exists in a table.
+    Args:
+        connection (Connection): The database connection.
+        table_name (str): Table name.
+        column_name (str): Column name.
+    Returns:
+        bool: True if the column exists.
+    '''
+    return column_name in [column['name'] for column in inspect(connection).get_columns(table_name)]
+
+def add_column(connection, table_name: str, column: Column) -> bool:
+    '''
+    Add a column to a table unless it already exists.
+    Args:
+        connection (Connection): The database connection.
+        table_name (str): Table name.
+        column (Column): The column to add; its type is compiled for the current database.
+    Returns:
+        bool: True if the column was added.
+    '''
+    if column_exists(connection, table_name, column.name):
+        return False
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}'))
+    return True
+
+def iter_batches(connection, table: Table, columns: list, batch_size: int = MIGRATION_BATCH_SIZE):
+    '''
+    Read a table in bounded batches using keyset pagination on the id column.
+    Args:
+        connection (Connection): The database connection.
+        table (Table): The table to read.
+        columns (list): Columns to select in addition to id.
+        batch_size (int): Number of rows per batch.
+    Yields:
+        list: A batch of rows.
+    '''
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(table.c.id, *columns).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+def iter_id_ranges(connection, table: Table, batch_size: int = MIGRATION_BATCH_SIZE):
+    '''
+    Split a table into ranges of at most batch_size rows by the id column, for updating it in bounded batches.
+    Args:
+        connection (Connection): The database connection.
+        table (Table): The table to split.
+        batch_size (int): Number of rows per range.
+    Yields:
+        tuple: The first and the last id of a range.
+    '''
+    for rows in iter_batches(connection, table, [], batch_size):
+        yield rows[0].id, rows[-1].id
+
+@migration(1, 'multiple locations and categories')
+def migrate_multiple_filters(connection):
+    '''
+    Convert the old one-location/one-category tori_items table to JSON lists of locations and categories.
+    The old table is kept as tori_items_backup.
+    '''
+    if not column_exists(connection, 'tori_items', 'category'):
+        return
+
+    old_items = get_table(connection, 'tori_items')
+    new_items = Table(
+        'new_tori_items', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('item', String),
+        Column('categories', JSONType),
+        Column('locations', JSONType),
+        Column('telegram_id', Integer),
+        Column('added_time', DateTime),
+        Column('link', String),
+        Column('latest_time', DateTime)
+    )
+    new_items.create(connection)
+
+    def as_string(value):
+        return str(value) if value is not None else None
+
+    columns = [old_items.c[name] for name in ('item', 'category', 'subcategory', 'product_category', 'region',
+                                               'city', 'area', 'telegram_id', 'added_time', 'link', 'latest_time')]
+    for rows in iter_batches(connection, old_items, columns):
+        connection.execute(insert(new_items), [{
+            'item': row.item,
+            'categories': [{
+                'category': as_string(row.category),
+                'subcategory': as_string(row.subcategory),
+                'product_category': as_string(row.product_category)
+            }],
+            'locations': [{
+                'region': as_string(row.region),
+                'city': as_string(row.city),
+                'area': as_string(row.area)
+            }],
+            'telegram_id': row.telegram_id,
+            'added_time': row.added_time,
+            'link': row.link,
+            'latest_time': row.latest_time
+        } for row in rows])
+
+    connection.execute(text('ALTER TABLE tori_items RENAME TO tori_items_backup'))
+    connection.execute(text('ALTER TABLE new_tori_items RENAME TO tori_items'))
+
+@migration(2, 'recommerce search API URLs')
+def migrate_recommerce_urls(connection):
+    '''
+    Move the search links from /recommerce-search-page/api/search/ to /recommerce/forsale/search/api/search/.
+    '''
+    items = Table('tori_items', MetaData(), Column('id', Integer, primary_key=True), Column('link', String))
+    for first_id, last_id in iter_id_ranges(connection, items):
+        connection.execute(update(items).where(
+            items.c.id.between(first_id, last_id), items.c.link.like('%recommerce-search-page/api/search/%')
+        ).values(link=func.replace(
+            items.c.link,
+            'https://www.tori.fi/recommerce-search-page/api/search/',
+            'https://www.tori.fi/recommerce/forsale/search/api/search/'
+        )))
+
+@migration(3, 'dealer segments')
+def migrate_dealer_segments(connection):
+    '''
+    Add the dealer_segments column; existing items search from all sellers.
+    (Their links stay the same: the dealer_segment parameter is only added for a single seller type.)
+    '''
+    if not add_column(connection, 'tori_items', Column('dealer_segments', JSONType)):
+        return
+    items = Table('tori_items', MetaData(), Column('id', Integer, primary_key=True), Column('dealer_segments', JSONType))
+    for first_id, last_id in iter_id_ranges(connection, items):
+        connection.execute(update(items).where(
+            items.c.id.between(first_id, last_id), items.c.dealer_segments.is_(None)
+        ).values(dealer_segments=['yksityinen', 'yritys']))
+
+@migration(4, 'shipping types and pole-position API')
+def migrate_shipping_types(connection):
+    '''
+    Add the shipping_types column (existing items search all items) and move the links
+    of those items from /api/search/ to /api/pole-position/.
+    '''
+    if not add_column(connection, 'tori_items', Column('shipping_types', JSONType)):
+        return
+    items = Table(
+        'tori_items', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('shipping_types', JSONType),
+        Column('link', String)
+    )
+    for first_id, last_id in iter_id_ranges(connection, items):
+        in_range = items.c.id.between(first_id, last_id)
+        connection.execute(update(items).where(in_range, items.c.shipping_types.is_(None)).values(shipping_types=['all']))
+        connection.execute(update(items).where(in_range, items.c.link.like('%/api/search/%')).values(
+            link=func.replace(items.c.link, '/api/search/', '/api/pole-position/')
+        ))
+
+@migration(5, 'price range')
+def migrate_price_range(connection):
+    '''
+    Add the price_from and price_to columns; existing items have no price limits.
+    '''
+    add_column(connection, 'tori_items', Column('price_from', Integer))
+    add_column(connection, 'tori_items', Column('price_to', Integer))
+
+@migration(6, 'filter code tables')
+def migrate_filter_tables(connection):
+    '''
+    Create the item_categories and item_locations tables and fill them with the catalog codes
+    of the existing items. The names are resolved in the user's current language first and then
+    in the other languages, since the user may have changed it after adding the item.
+    '''
+    metadata = MetaData()
+    Table('tori_items', metadata, Column('id', Integer, primary_key=True))
+    filter_tables = {}
+    for kind, table_name in (('categories', 'item_categories'), ('locations', 'item_locations')):
+        filter_tables[kind] = Table(
+            table_name, metadata,
+            Column('id', Integer, primary_key=True),
+            Column('item_id', Integer, ForeignKey('tori_items.id', ondelete='CASCADE'), nullable=False, index=True),
+            Column('code', String),
+            Index(f'ix_{table_name}_code_item_id', 'code', 'item_id')
+        )
+    metadata.create_all(connection, tables=list(filter_tables.values()))
+
+    # The names of the "all ..." entries in all languages, as the items were saved with them
+    all_names = {
+        'category': ('kaikki kategoriat', 'all categories', 'все категории', 'всі категорії'),
+        'subcategory': ('kaikki alaluokat', 'all subcategories', 'все подкатегории', 'всі підкатегорії'),
+        'product_category': ('kaikki tuoteluokat', 'all product categories', 'все категории товаров', 'всі категорії товарів'),
+        'region': ('koko suomi', 'whole finland', 'вся финляндия', 'вся фінляндія'),
+        'city': ('kaikki kaupungit', 'all cities', 'все города', 'всі міста'),
+        'area': ('kaikki alueet', 'all areas', 'все области', 'всі райони')
+    }
+
+    def is_all(name, level: str) -> bool:
+        return name.lower() in all_names[level]
+
+    def category_code(data: dict, category: dict):
+        # The most specific code of a selection, None for all categories
+        if is_all(category['category'], 'category'):
+            return None
+        category_data = data[category['category']]
+        if is_all(category['subcategory'], 'subcategory'):
+            return category_data['category_code']
+        subcategory_data = category_data['subcategories'][category['subcategory']]
+        if is_all(category['product_category'], 'product_category'):
+            return subcategory_data['subcategory_code']
+        return subcategory_data['product_categories'][category['product_category']]
+
+    def location_code(data: dict, location: dict):
+        # The most specific code of a selection, None for the whole Finland
+        if is_all(location['region'], 'region'):
+            return None
+        region_data = data[location['region']]
+        if is_all(location['city'], 'city'):
+            return region_data['region_code']
+        city_data = region_data['cities'][location['city']]
+        area = location.get('area')
+        if area and not is_all(area, 'area'):
+            return city_data['areas'][area]
+        return city_data['city_code']
+
+    def unique_codes(codes: list) -> list:
+        # A selection of everything covers the others
+        return [None] if None in codes else list(dict.fromkeys(codes))
+
+    items = get_table(connection, 'tori_items')
+    users = get_table(connection, 'user_preferences')
+    item_categories = filter_tables['categories']
+    item_locations = filter_tables['locations']
+    already_filled = select(item_categories.c.item_id).union(select(item_locations.c.item_id))
+    filled_ids = {row.item_id for row in connection.execute(already_filled)}
+    unresolved = []
+
+    for rows in iter_batches(connection, items, [items.c.telegram_id, items.c.categories, items.c.locations]):
+        telegram_ids = {row.telegram_id for row in rows}
+        languages = dict(connection.execute(
+            select(users.c.telegram_id, users.c.language).where(users.c.telegram_id.in_(telegram_ids))
+        ).all())
+
+        category_rows = []
+        location_rows = []
+        for row in rows:
+            if row.id in filled_ids:
+                continue
+            language = languages.get(row.telegram_id, '🇬🇧 English')
+            for candidate in [language] + [lang for lang in LANGUAGES if lang != language]:
+                try:
+                    categories_data = load_categories(candidate)
+                    locations_data = load_locations(candidate)
+                    category_codes = unique_codes([category_code(categories_data, cat) for cat in row.categories])
+                    location_codes = unique_codes([location_code(locations_data, loc) for loc in row.locations])
+                except (KeyError, TypeError, AttributeError):
+                    continue
+                category_rows += [{'item_id': row.id, 'code': code} for code in category_codes]
+                location_rows += [{'item_id': row.id, 'code': code} for code in location_codes]
+                break
+            else:
+                unresolved.append(row.id)
+
+        if category_rows:
+            connection.execute(insert(item_categories), category_rows)
+        if location_rows:
+            connection.execute(insert(item_locations), location_rows)
+
+    if unresolved:
+        logger.warning("Could not resolve the filters of %d items: %s", len(unresolved), unresolved[:10])
+
+@migration(7, 'tori_items.telegram_id index')
+def migrate_telegram_id_index(connection):
+    '''
+    Index tori_items.telegram_id (tables created before it was declared on the model lack it).
+    '''
+    items = Table('tori_items', MetaData(), Column('id', Integer, primary_key=True), Column('telegram_id', BigInteger))
+    Index('ix_tori_items_telegram_id', items.c.telegram_id).create(connection, checkfirst=True)
+
+@migration(8, 'category codes with commas')
+def migrate_category_code_commas(connection):
+    '''
+    The Russian and Ukrainian category catalogs had the top-level codes written as '0,76' instead of '0.76';
+    fix the codes stored for the items and the category parameter of their links.
+    '''
+    item_categories = Table('item_categories', MetaData(), Column('id', Integer, primary_key=True), Column('code', String))
+    for first_id, last_id in iter_id_ranges(connection, item_categories):
+        connection.execute(update(item_categories).where(
+            item_categories.c.id.between(first_id, last_id), item_categories.c.code.like('%,%')
+        ).values(code=func.replace(item_categories.c.code, ',', '.')))
+
+    items = Table('tori_items', MetaData(), Column('id', Integer, primary_key=True), Column('link', String))
+    for first_id, last_id in iter_id_ranges(connection, items):
+        connection.execute(update(items).where(
+            items.c.id.between(first_id, last_id), items.c.link.like('%category=0,%')
+        ).values(link=func.replace(items.c.link, 'category=0,', 'category=0.')))
+
+@migration(9, 'filter codes instead of names')
+def migrate_filter_codes(connection):
+    '''
+    Store the categories and locations of the items as catalog codes instead of names in the user's language
+    (an empty list means all categories / the whole Finland). The codes come from the item_categories and
+    item_locations tables, or from the item's link if the names could not be resolved when they were filled.
+    '''
+    items = Table(
+        'tori_items', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('categories', JSONType),
+        Column('locations', JSONType),
+        Column('link', String)
+    )
+    item_categories = get_table(connection, 'item_categories')
+    item_locations = get_table(connection, 'item_locations')
+
+    def is_converted(values) -> bool:
+        return isinstance(values, list) and all(isinstance(value, str) for value in values)
+
+    def codes_from_link(link: str, parameters: tuple) -> list:
+        query = parse_qs(urlsplit(link or '').query)
+        return [code for parameter in parameters for code in query.get(parameter, [])]
+
+    for rows in iter_batches(connection, items, [items.c.categories, items.c.locations, items.c.link]):
+        rows = [row for row in rows if not (is_converted(row.categories) and is_converted(row.locations))]
+        if not rows:
+            continue
+        item_ids = [row.id for row in rows]
+        filters = {}
+        for table, kind in ((item_categories, 'categories'), (item_locations, 'locations')):
+            for item_id, code in connection.execute(select(table.c.item_id, table.c.code).where(table.c.item_id.in_(item_ids))):
+                filters.setdefault((item_id, kind), []).append(code)
+
+        values = []
+        missing = {'categories': [], 'locations': []}
+        for row in rows:
+            converted = {'b_id': row.id}
+            for kind, parameters in (('categories', ('category', 'sub_category', 'product_category')), ('locations', ('location',))):
+                if (row.id, kind) in filters:
+                    codes = filters[(row.id, kind)]
+                else:
+                    codes = codes_from_link(row.link, parameters)
+                    missing[kind] += [{'item_id': row.id, 'code': code} for code in codes or [None]]
+                converted[f'b_{kind}'] = [] if None in codes else codes
+            values.append(converted)
+
+        connection.execute(
+            update(items).where(items.c.id == bindparam('b_id')).values(categories=bindparam('b_categories'), locations=bindparam('b_locations')),
+            values
+        )
+        for table, kind in ((item_categories, 'categories'), (item_locations, 'locations')):
+            if missing[kind]:
+                connection.execute(insert(table), missing[kind])
+
+@migration(10, 'delivery preferences')
+def migrate_delivery_preferences(connection):
+    '''
+    Add the delivery preference columns of the users; existing users get every ad right away, without quiet hours.
+    '''
+    add_column(connection, 'user_preferences', Column('delivery_mode', String))
+    add_column(connection, 'user_preferences', Column('digest_interval', Integer))
+    add_column(connection, 'user_preferences', Column('quiet_start', Integer))
+    add_column(connection, 'user_preferences', Column('quiet_end', Integer))
+
+def get_applied_versions(connection) -> set:
+    '''
+    Get the versions of the migrations applied to the database.
+    Args:
+        connection (Connection): The database connection.
+    Returns:
+        set: Applied versions.
+    '''
+    return set(connection.execute(select(SchemaMigration.version)).scalars())
+
+def run_migrations(bind=engine) -> list:
+    '''
+    Bring the database schema up to date. Called at startup.
+    A new database gets the current schema and all migrations are recorded as applied.
+    Otherwise every pending migration runs in its own transaction, in version order.
+    Args:
+        bind (Engine): The engine to migrate.
+    Returns:
+        list: Names of the migrations that were applied.
+    '''
+    is_new_database = not inspect(bind).has_table('tori_items')
+    SchemaMigration.__table__.create(bind, checkfirst=True)
+
+    with bind.connect() as connection:
+        applied_versions = get_applied_versions(connection)
+
+    applied = []
+    for version, name, function in MIGRATIONS:
+        if version in applied_versions:
+            continue
+        with bind.begin() as connection:
+            if not is_new_database:
+                logger.info("Applying migration %d: %s", version, name)
+                function(connection)
+            connection.execute(insert(SchemaMigration.__table__), {
+                'version': version, 'name': name, 'applied_at': datetime.now()
+            })
+        if not is_new_database:
+            applied.append(name)
+
+    # Create the tables that are not managed by migrations yet
+    Base.metadata.create_all(bind)
+    return applied
@@ -1,22 +1,35 @@
 from datetime import datetime
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, Index, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
+# Plain JSON on SQLite, JSONB on PostgreSQL so the filter columns can be GIN-indexed.
+JSONType = JSON().with_variant(JSONB(), 'postgresql')
+
 class UserPreferences(Base):
     '''
     SQLAlchemy model for user preferences.
     Attributes:
         id (int): Primary key.
         telegram_id (int): The user's Telegram ID.
-        language (str): Preferred language of the user.
+        language (str): Preferred language of the user (None while the user is choosing a new one).
+        delivery_mode (str): 'immediate' to get every ad right away or 'digest' for one summary per digest_interval.
+        digest_interval (int): Minutes between the digests.
+        quiet_start (int): Hour (Helsinki time) when the quiet hours start, None for no quiet hours.
+        quiet_end (int): Hour (Helsinki time) when the quiet hours end.
     '''
     __tablename__ = 'user_preferences'
 
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True)
+    telegram_id = Column(BigInteger, unique=True)
     language = Column(String)
+    delivery_mode = Column(String, default='immediate')
+    digest_interval = Column(Integer)
+    quiet_start = Column(Integer)
+    quiet_end = Column(Integer)
 
 class ToriItem(Base):
     '''
@@ -24,28 +37,187 @@ class ToriItem(Base):
     Attributes:
         id (int): Primary key.
         item (str): Name of the item.
-        categories (JSON): List of category dictionaries containing category, subcategory, and product_category.
-        locations (JSON): List of location dictionaries.
+        categories (JSON): List of category, subcategory or product category codes (empty for all categories).
+        locations (JSON): List of region, city or area codes (empty for the whole Finland).
         dealer_segments (JSON): List of dealer segment types (yksityinen, yritys).
         shipping_types (JSON): Shipping type filter (toridiili or all).
         price_from (Integer): Minimum price filter (optional).
         price_to (Integer): Maximum price filter (optional).
         telegram_id (int): The user's Telegram ID.
         added_time (datetime): Time when the item was added.
-        link (str): URL link to the item on Tori.fi.
+        link (str): Search link of items added before the links were built from the filters (no longer used, see modules/query.py).
         latest_time (datetime): Latest time the item was checked.
     '''
     __tablename__ = 'tori_items'
 
     id = Column(Integer, primary_key=True)
     item = Column(String)
-    categories = Column(JSON)
-    locations = Column(JSON)
-    dealer_segments = Column(JSON)
-    shipping_types = Column(JSON)
+    categories = Column(JSONType)
+    locations = Column(JSONType)
+    dealer_segments = Column(JSONType)
+    shipping_types = Column(JSONType)
     price_from = Column(Integer)
     price_to = Column(Integer)
-    telegram_id = Column(Integer)
+    telegram_id = Column(BigInteger, index=True)
     added_time = Column(DateTime, default=datetime.now)
     link = Column(String)
-    latest_time = Column(DateTime)
\ No newline at end of file
+    latest_time = Column(DateTime)
+
+    # One row per filter code, kept in sync with the JSON lists above (deleted by ON DELETE CASCADE)
+    category_filters = relationship('ItemCategory', cascade='all, delete-orphan', passive_deletes=True)
+    location_filters = relationship('ItemLocation', cascade='all, delete-orphan', passive_deletes=True)
+
+    # GIN indexes only exist on PostgreSQL; SQLite keeps the JSON columns unindexed.
+    __table_args__ = tuple(
+        Index(f'ix_tori_items_{column}_gin', column, postgresql_using='gin',
+              postgresql_ops={column: 'jsonb_path_ops'}).ddl_if(dialect='postgresql')
+        for column in ('categories', 'locations', 'dealer_segments', 'shipping_types')
+    )
+
+
+class SchemaMigration(Base):
+    '''
+    SQLAlchemy model for the applied schema migrations (see modules/migrations.py).
+    Attributes:
+        version (int): Migration version.
+        name (str): Migration name.
+        applied_at (datetime): Time when the migration was applied.
+    '''
+    __tablename__ = 'schema_migrations'
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String)
+    applied_at = Column(DateTime, default=datetime.now)
+
+class ItemCategory(Base):
+    '''
+    SQLAlchemy model for the category filters of a tracked item, one row per catalog code.
+    Attributes:
+        id (int): Primary key.
+        item_id (int): ID of the ToriItem the filter belongs to.
+        code (str): Category, subcategory or product category code (e.g. '0.76', '1.76.5177'); NULL means all categories.
+    '''
+    __tablename__ = 'item_categories'
+
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey('tori_items.id', ondelete='CASCADE'), nullable=False, index=True)
+    code = Column(String)
+
+    __table_args__ = (Index('ix_item_categories_code_item_id', 'code', 'item_id'),)
+
+class ItemLocation(Base):
+    '''
+    SQLAlchemy model for the location filters of a tracked item, one row per catalog code.
+    Attributes:
+        id (int): Primary key.
+        item_id (int): ID of the ToriItem the filter belongs to.
+        code (str): Region, city or area code (e.g. '0.100018', '1.100018.110091'); NULL means the whole Finland.
+    '''
+    __tablename__ = 'item_locations'
+
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey('tori_items.id', ondelete='CASCADE'), nullable=False, index=True)
+    code = Column(String)
+
+    __table_args__ = (Index('ix_item_locations_code_item_id', 'code', 'item_id'),)
+
+class BroadcastJob(Base):
+    '''
+    SQLAlchemy model for the admin broadcasts, kept so that a broadcast resumes after a restart (see modules/broadcast.py).
+    Attributes:
+        id (int): Primary key.
+        text (str): The message in HTML.
+        language (str): Language of the recipients, or 'all'.
+        chat_id (int): Chat of the progress message (the admin's).
+        message_id (int): ID of the progress message.
+        status (str): 'running', 'finished' or 'cancelled'.
+        cursor (int): user_preferences.id up to which every recipient has been processed.
+        total (int): Number of recipients when the broadcast started.
+        sent (int): Number of delivered messages.
+        blocked (int): Number of recipients who blocked the bot.
+        failed (int): Number of messages that could not be delivered for another reason.
+        created_at (datetime): Time when the broadcast was started.
+        finished_at (datetime): Time when the broadcast finished or was cancelled.
+    '''
+    __tablename__ = 'broadcast_jobs'
+
+    id = Column(Integer, primary_key=True)
+    text = Column(String, nullable=False)
+    language = Column(String, nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger)
+    status = Column(String, nullable=False, default='running', index=True)
+    cursor = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime)
+
+class OutboxMessage(Base):
+    '''
+    SQLAlchemy model for the notifications waiting to be delivered (see modules/outbox.py).
+    The poller writes a row per (user, ad) and the delivery worker sends it, so a failed send is retried
+    instead of lost, and an ad matched by several searches of a user is delivered once.
+    Attributes:
+        id (int): Primary key.
+        telegram_id (int): The recipient's Telegram ID.
+        ad_key (str): ID of the ad on Tori.fi.
+        item_id (int): ID of the ToriItem that matched the ad.
+        payload (JSON): The fields of the ad the notification is rendered from.
+        status (str): 'pending', 'sent' or 'failed'.
+        attempts (int): Number of failed delivery attempts.
+        next_attempt_at (datetime): Time when the notification is due (again).
+        last_error (str): Error of the last failed attempt.
+        created_at (datetime): Time when the notification was queued.
+        sent_at (datetime): Time when the notification was delivered.
+    '''
+    __tablename__ = 'outbox'
+
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(BigInteger, nullable=False)
+    ad_key = Column(String, nullable=False)
+    item_id = Column(Integer)
+    payload = Column(JSONType, nullable=False)
+    status = Column(String, nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.now)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint('telegram_id', 'ad_key', name='uq_outbox_telegram_id_ad_key'),
+        Index('ix_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class ConversationState(Base):
+    '''
+    SQLAlchemy model for the state of a user in a persistent conversation (see modules/persistence.py).
+    Attributes:
+        name (str): Name of the conversation.
+        key (str): The conversation key (chat and user IDs) as a JSON list.
+        state (int): The state the user is in.
+        updated_at (datetime): Time when the state was saved.
+    '''
+    __tablename__ = 'conversation_states'
+
+    name = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    state = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now)
+
+class UserData(Base):
+    '''
+    SQLAlchemy model for the user_data of a user (the item being added, see modules/persistence.py).
+    Attributes:
+        telegram_id (int): The user's Telegram ID.
+        data (JSON): The contents of context.user_data.
+        updated_at (datetime): Time when the data was saved.
+    '''
+    __tablename__ = 'user_data'
+
+    telegram_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    data = Column(JSONType, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now)
@@ -0,0 +1,378 @@
+import asyncio
+import html
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, delete, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from telegram.error import RetryAfter, Forbidden, BadRequest
+from modules.load import load_messages
+from modules.cache import LRUCache, RotatingSet
+from modules.models import ToriItem, OutboxMessage
+from modules.database import get_session
+from modules.registry import registry
+from modules.broadcast import RateLimiter
+from modules.delivery import get_delivery_preferences, get_delivery_time
+
+logger = logging.getLogger(__name__)
+
+# Number of ad photos whose Telegram file_id is kept, and of rendered captions (per ad and language)
+PHOTO_CACHE_SIZE = 2048
+CAPTION_CACHE_SIZE = 8192
+
+# Photo URL of an ad -> file_id of the photo once Telegram has fetched it, so later recipients don't make it fetch it again
+photo_cache = LRUCache(PHOTO_CACHE_SIZE)
+
+# (ad id, ad timestamp, language, matched searches) -> notification text
+caption_cache = LRUCache(CAPTION_CACHE_SIZE)
+
+# Number of (user, ad) pairs remembered as recently queued
+RECENT_NOTIFICATIONS_SIZE = 100000
+
+# (telegram_id, ad_key) of the recently queued notifications: a pair seen again is an ad matched by
+# another search of the same user, whose name is merged into the queued notification
+recent_notifications = RotatingSet(RECENT_NOTIFICATIONS_SIZE)
+
+# Fields of an ad kept in the outbox, enough to render and send the notification
+AD_FIELDS = ('id', 'timestamp', 'heading', 'location', 'price', 'canonical_url', 'image')
+
+# Number of notifications read from the outbox at once
+OUTBOX_BATCH_SIZE = 200
+
+# Seconds between the runs of the delivery worker
+OUTBOX_INTERVAL = 15
+
+# Notifications per second, below Telegram's limit of about 30
+OUTBOX_RATE = 25
+
+# Retries of a notification that failed with a temporary error, and the backoff between them (doubled every attempt)
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF = timedelta(seconds=30)
+OUTBOX_MAX_BACKOFF = timedelta(hours=1)
+
+# Maximum number of ads in one digest message (a message holds at most 4096 characters)
+DIGEST_SIZE = 10
+
+# How long delivered and failed notifications are kept (they keep deduplicating the same ad meanwhile)
+OUTBOX_TTL = timedelta(days=7)
+
+def render_caption(ad: dict, language: str) -> str:
+    '''
+    Render the notification about an ad, cached per ad and language.
+    An ad that matched several searches of the user lists them.
+    Args:
+        ad (dict): The ad from the search API (or an outbox payload, with the matched 'searches').
+        language (str): The user's language.
+    Returns:
+        str: The notification text in HTML.
+    '''
+    searches = tuple(ad.get('searches') or ())
+    key = (ad.get('id'), ad.get('timestamp'), language, searches)
+    caption = caption_cache.get(key)
+    if caption is None:
+        messages = load_messages(language)
+        price = (ad.get('price') or {}).get('amount')
+        caption = messages['new_item'].format(
+            itemname=ad.get('heading'), region=ad.get('location'), price=price, canonical_url=ad.get('canonical_url')
+        )
+        if len(searches) > 1:
+            caption += messages['matched_searches'].format(searches=', '.join(html.escape(search) for search in searches))
+        if key[0] is not None:
+            caption_cache.put(key, caption)
+    return caption
+
+async def send_ad(bot, telegram_id: int, ad: dict, language: str):
+    '''
+    Notify a user about an ad, with its photo if it has one. The first send of a photo passes its URL
+    (Telegram downloads it); the returned file_id is reused for the next recipients of the same ad.
+    Args:
+        bot (Bot): The bot sending the notification.
+        telegram_id (int): The user's Telegram ID.
+        ad (dict): The ad from the search API.
+        language (str): The user's language.
+    '''
+    caption = render_caption(ad, language)
+    image = ad.get('image')
+    image_url = image.get('url') if image else None
+    if not image_url:
+        await bot.send_message(telegram_id, text=caption, parse_mode='HTML')
+        return
+
+    file_id = photo_cache.get(image_url)
+    if file_id is not None:
+        try:
+            await bot.send_photo(telegram_id, photo=file_id, caption=caption, parse_mode='HTML')
+            return
+        except BadRequest as e:
+            # file_ids don't expire in practice, but fall back to the URL rather than lose the notification
+            logger.warning("Cached photo of %s was rejected (%s), sending it by URL", image_url, e)
+            photo_cache.invalidate(image_url)
+
+    message = await bot.send_photo(telegram_id, photo=image_url, caption=caption, parse_mode='HTML')
+    if message.photo:
+        photo_cache.put(image_url, message.photo[-1].file_id)
+
+def render_digest(ads: list, language: str) -> str:
+    '''
+    Render a digest of several ads.
+    Args:
+        ads (list): The ads (outbox payloads), at most DIGEST_SIZE.
+        language (str): The user's language.
+    Returns:
+        str: The digest text in HTML.
+    '''
+    messages = load_messages(language)
+    parts = [messages['digest_header'].format(count=len(ads))]
+    for ad in ads:
+        parts.append(messages['digest_item'].format(
+            itemname=ad.get('heading'), region=ad.get('location'), price=(ad.get('price') or {}).get('amount'),
+            canonical_url=ad.get('canonical_url')
+        ))
+    return ''.join(parts)
+
+def get_ad_key(ad: dict) -> str:
+    '''
+    Get the key an ad is deduplicated by.
+    Args:
+        ad (dict): The ad from the search API.
+    Returns:
+        str: The ad ID (or its URL if it has none).
+    '''
+    return str(ad.get('id') or ad.get('canonical_url'))
+
+def outbox_entry(telegram_id: int, item_id: int, ad: dict, search: str) -> dict:
+    '''
+    Build the outbox row of a notification.
+    Args:
+        telegram_id (int): The recipient's Telegram ID.
+        item_id (int): ID of the ToriItem that matched the ad.
+        ad (dict): The ad from the search API.
+        search (str): The searched text of the item.
+    Returns:
+        dict: Values of the OutboxMessage row.
+    '''
+    now = datetime.now()
+    payload = {field: ad.get(field) for field in AD_FIELDS}
+    payload['searches'] = [search]
+    return {
+        'telegram_id': telegram_id,
+        'ad_key': get_ad_key(ad),
+        'item_id': item_id,
+        'payload': payload,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now
+    }
+
+def enqueue(session, entries: list) -> int:
+    '''
+    Queue notifications in the session's transaction, due when the user wants to get them (see get_delivery_time),
+    once per user and ad:
+    - entries for the same user and ad (several searches of the user matched it) become one notification naming the searches;
+    - an ad queued earlier for the user (by another search, or an earlier round) is not queued again. If that
+      notification is still pending and was queued recently, the new searches are added to it instead.
+    Args:
+        session (Session): The SQLAlchemy session (the caller commits).
+        entries (list): Rows built by outbox_entry.
+    Returns:
+        int: Number of notifications after merging the entries.
+    '''
+    merged = {}
+    for entry in entries:
+        key = (entry['telegram_id'], entry['ad_key'])
+        if key in merged:
+            _add_searches(merged[key]['payload']['searches'], entry['payload']['searches'])
+        else:
+            merged[key] = entry
+    if not merged:
+        return 0
+
+    delivery_times = {}
+    for entry in merged.values():
+        telegram_id = entry['telegram_id']
+        if telegram_id not in delivery_times:
+            delivery_times[telegram_id] = get_delivery_time(get_delivery_preferences(telegram_id), entry['next_attempt_at'])
+        entry['next_attempt_at'] = delivery_times[telegram_id]
+
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert(OutboxMessage.__table__).on_conflict_do_nothing(index_elements=['telegram_id', 'ad_key'])
+    session.execute(statement, list(merged.values()))
+
+    # The insert skipped the pairs already in the outbox; the recent ones may still be waiting to be sent
+    recent = [key for key in merged if key in recent_notifications]
+    if recent:
+        pending = session.query(OutboxMessage).filter(
+            tuple_(OutboxMessage.telegram_id, OutboxMessage.ad_key).in_(recent), OutboxMessage.status == 'pending'
+        )
+        for message in pending:
+            searches = list(message.payload.get('searches') or [])
+            if _add_searches(searches, merged[(message.telegram_id, message.ad_key)]['payload']['searches']):
+                message.payload = {**message.payload, 'searches': searches}
+    for key in merged:
+        recent_notifications.add(key)
+    return len(merged)
+
+def _add_searches(searches: list, new_searches: list) -> bool:
+    added = False
+    for search in new_searches:
+        if search not in searches:
+            searches.append(search)
+            added = True
+    return added
+
+def reschedule(telegram_id: int):
+    '''
+    Move the user's pending notifications to the time they are due with the current delivery preferences,
+    after the preferences have changed.
+    Args:
+        telegram_id (int): The user's Telegram ID.
+    '''
+    delivery_time = get_delivery_time(get_delivery_preferences(telegram_id))
+    session = get_session()
+    try:
+        session.query(OutboxMessage).filter(
+            OutboxMessage.telegram_id == telegram_id, OutboxMessage.status == 'pending', OutboxMessage.attempts == 0
+        ).update({'next_attempt_at': delivery_time}, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+def get_backoff(attempts: int) -> timedelta:
+    '''
+    Get the delay before the next attempt of a notification.
+    Args:
+        attempts (int): Number of failed attempts so far.
+    Returns:
+        timedelta: OUTBOX_BACKOFF doubled per attempt, at most OUTBOX_MAX_BACKOFF.
+    '''
+    return min(OUTBOX_BACKOFF * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF)
+
+# Only one delivery run at a time: the repeating job and the poller both start one
+delivery_lock = asyncio.Lock()
+delivery_limiter = RateLimiter(OUTBOX_RATE)
+
+async def deliver_outbox(context):
+    '''
+    Send the due notifications from the outbox. Delivery is at least once: a notification is marked
+    as sent after Telegram accepted it, so a crash in between sends it again after the restart.
+    Args:
+        context (ContextTypes.DEFAULT_TYPE): The context object for accessing the bot.
+    '''
+    if delivery_lock.locked():
+        return
+    async with delivery_lock:
+        while True:
+            session = get_session()
+            try:
+                batch = (session.query(OutboxMessage.id, OutboxMessage.telegram_id, OutboxMessage.payload, OutboxMessage.attempts)
+                         .filter(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= datetime.now())
+                         .order_by(OutboxMessage.id)
+                         .limit(OUTBOX_BATCH_SIZE)
+                         .all())
+            finally:
+                session.close()
+            if not batch:
+                return
+
+            results, blocked_users, flooded = await _send_batch(context.bot, batch)
+            _save_results(results, blocked_users)
+            if flooded or len(batch) < OUTBOX_BATCH_SIZE:
+                return
+
+def group_deliveries(batch: list) -> list:
+    '''
+    Group due notifications into messages: one message per notification, except for the users who chose
+    digests, whose notifications are combined into digests of up to DIGEST_SIZE ads.
+    Args:
+        batch (list): Outbox rows in the order they were queued.
+    Returns:
+        list: Lists of rows, one per message.
+    '''
+    deliveries = []
+    digests = {}
+    for row in batch:
+        if not get_delivery_preferences(row.telegram_id).is_digest:
+            deliveries.append([row])
+            continue
+        digest = digests.get(row.telegram_id)
+        if digest is None or len(digest) >= DIGEST_SIZE:
+            digest = digests[row.telegram_id] = []
+            deliveries.append(digest)
+        digest.append(row)
+    return deliveries
+
+async def _send_batch(bot, batch: list) -> tuple:
+    results = []
+    blocked_users = set()
+    deliveries = group_deliveries(batch)
+    for position, rows in enumerate(deliveries):
+        telegram_id = rows[0].telegram_id
+        if telegram_id in blocked_users:
+            continue
+        now = datetime.now()
+        language = registry.get_language(telegram_id)
+        await delivery_limiter.wait()
+        try:
+            if len(rows) == 1:
+                await send_ad(bot, telegram_id, rows[0].payload, language)
+            else:
+                await bot.send_message(telegram_id, text=render_digest([row.payload for row in rows], language), parse_mode='HTML')
+            results += [{'id': row.id, 'status': 'sent', 'sent_at': now} for row in rows]
+        except RetryAfter as e:
+            # Telegram wants everyone to slow down: retry this and the rest of the batch later, without counting an attempt
+            logger.warning("Flood limit hit while delivering notifications, pausing for %s s", e.retry_after)
+            delivery_limiter.pause(e.retry_after)
+            retry_at = now + timedelta(seconds=e.retry_after)
+            results += [{'id': row.id, 'next_attempt_at': retry_at}
+                        for rest in deliveries[position:] if rest[0].telegram_id not in blocked_users for row in rest]
+            return results, blocked_users, True
+        except Forbidden:
+            logger.info("User %s has blocked the bot, removing their items", telegram_id)
+            blocked_users.add(telegram_id)
+        except BadRequest as e:
+            # The message itself is rejected, retrying won't help
+            logger.warning("Notification %d to %s rejected: %s", rows[0].id, telegram_id, e)
+            results += [{'id': row.id, 'status': 'failed', 'attempts': row.attempts + 1, 'last_error': str(e)[:500]} for row in rows]
+        except Exception as e:
+            logger.warning("Notification %d to %s failed: %s", rows[0].id, telegram_id, e)
+            for row in rows:
+                attempts = row.attempts + 1
+                status = 'failed' if attempts >= OUTBOX_MAX_ATTEMPTS else 'pending'
+                results.append({'id': row.id, 'status': status, 'attempts': attempts, 'last_error': str(e)[:500],
+                                'next_attempt_at': now + get_backoff(attempts)})
+    return results, blocked_users, False
+
+def _save_results(results: list, blocked_users: set):
+    session = get_session()
+    try:
+        if results:
+            session.execute(update(OutboxMessage), results)
+        if blocked_users:
+            session.query(ToriItem).filter(ToriItem.telegram_id.in_(blocked_users)).delete(synchronize_session=False)
+            session.query(OutboxMessage).filter(
+                OutboxMessage.telegram_id.in_(blocked_users), OutboxMessage.status == 'pending'
+            ).update({'status': 'failed', 'last_error': 'blocked'}, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+    for telegram_id in blocked_users:
+        registry.remove_user(telegram_id)
+
+async def prune_outbox(context):
+    '''
+    Delete the delivered and failed notifications older than OUTBOX_TTL.
+    Args:
+        context (ContextTypes.DEFAULT_TYPE): The context object.
+    '''
+    session = get_session()
+    try:
+        result = session.execute(delete(OutboxMessage).where(
+            OutboxMessage.status.in_(('sent', 'failed')),
+            OutboxMessage.created_at < datetime.now() - OUTBOX_TTL
+        ))
+        session.commit()
+        if result.rowcount:
+            logger.info("Pruned %d old notifications from the outbox", result.rowcount)
+    finally:
+        session.close()
@@ -0,0 +1,230 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import delete, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from telegram.ext import BasePersistence, PersistenceInput
+from modules.models import ConversationState, UserData
+from modules.database import get_session
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the saves of the changed conversations and user_data (PERSISTENCE_INTERVAL).
+# On a normal stop everything is saved; after a crash the changes of the last interval are lost
+DEFAULT_PERSISTENCE_INTERVAL = 10
+
+class DatabasePersistence(BasePersistence):
+    '''
+    Keeps the conversation states and user_data in the bot's database, so a restart doesn't drop the users
+    out of the item wizard.
+    - Only what changed is written: PTB hands over every conversation and user_data touched since the last
+      save, and the ones equal to what is already stored are skipped.
+    - The changes of an interval are written together in one transaction, in a thread, so saving doesn't
+      hold up the handlers.
+    - user_data is loaded per user when their first update after the start arrives, instead of all at startup
+      (only the IDs of the users who have some are).
+      The conversation states are small and loaded at startup, as ConversationHandler needs them.
+    Bot data, chat data and callback data aren't used by the bot and aren't stored.
+    '''
+
+    def __init__(self, update_interval: float = DEFAULT_PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self._stored_states = {}        # conversation name -> {key: state} as in the database
+        self._stored_user_data = {}     # telegram_id -> user_data as JSON as in the database (missing if empty)
+        self._unloaded_users = set()    # users with stored user_data not loaded yet
+        self._pending_states = {}       # (conversation name, key) -> state to save, None to delete
+        self._pending_user_data = {}    # telegram_id -> user_data to save, None to delete
+        self._writer = None
+        self._write_lock = None
+
+    @staticmethod
+    def encode_user_data(user_data: dict) -> Optional[str]:
+        '''
+        Serialize user_data for comparing it with the stored one.
+        Args:
+            user_data (dict): The user_data.
+        Returns:
+            str | None: The JSON, None for empty user_data (which isn't stored).
+        '''
+        return json.dumps(user_data, sort_keys=True, ensure_ascii=False) if user_data else None
+
+    async def get_conversations(self, name: str) -> dict:
+        states = await asyncio.to_thread(self._load_conversations, name)
+        self._stored_states[name] = dict(states)
+        logger.info("Loaded %d users in conversation %s", len(states), name)
+        return states
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        stored = self._stored_states.setdefault(name, {})
+        if stored.get(key) == new_state:
+            return
+        if new_state is None:
+            stored.pop(key, None)
+        else:
+            stored[key] = new_state
+        self._pending_states[(name, key)] = new_state
+        await self._schedule_write()
+
+    async def get_user_data(self) -> dict:
+        # Only the IDs: the data is loaded by refresh_user_data, and the users without any aren't looked up
+        self._unloaded_users = await asyncio.to_thread(self._load_user_ids)
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id not in self._unloaded_users:
+            return
+        data = await asyncio.to_thread(self._load_user_data, user_id)
+        self._unloaded_users.discard(user_id)
+        if data:
+            self._stored_user_data[user_id] = self.encode_user_data(data)
+            for key, value in data.items():
+                user_data.setdefault(key, value)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        try:
+            encoded = self.encode_user_data(data)
+        except (TypeError, ValueError) as e:
+            logger.warning("Not saving user_data of %s: %s", user_id, e)
+            return
+        if self._stored_user_data.get(user_id) == encoded:
+            return
+        if encoded is None:
+            self._stored_user_data.pop(user_id, None)
+        else:
+            self._stored_user_data[user_id] = encoded
+        self._pending_user_data[user_id] = data or None
+        await self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stored_user_data.pop(user_id, None)
+        self._pending_user_data[user_id] = None
+        await self._schedule_write()
+
+    async def flush(self) -> None:
+        if self._writer is not None:
+            await self._writer
+        await self._write_pending()
+
+    async def _schedule_write(self) -> None:
+        # The updates of one save run are handed over concurrently: the first one starts a write, which runs
+        # after all of them have queued their changes and writes them at once
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_pending())
+        await self._writer
+
+    async def _write_pending(self) -> None:
+        self._writer = None
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            states, self._pending_states = self._pending_states, {}
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            if not states and not user_data:
+                return
+            try:
+                await asyncio.to_thread(self._save, states, user_data)
+            except Exception:
+                # Keep the changes for the next save, unless they have been changed again since
+                self._pending_states = {**states, **self._pending_states}
+                self._pending_user_data = {**user_data, **self._pending_user_data}
+                logger.exception("Failed to save %d conversation states and %d user_data", len(states), len(user_data))
+                return
+        logger.debug("Saved %d conversation states and %d user_data", len(states), len(user_data))
+
+    def _load_conversations(self, name: str) -> dict:
+        session = get_session()
+        rows = session.query(ConversationState.key, ConversationState.state).filter_by(name=name).all()
+        session.close()
+        return {tuple(json.loads(row.key)): row.state for row in rows}
+
+    def _load_user_ids(self) -> set:
+        session = get_session()
+        user_ids = {row.telegram_id for row in session.query(UserData.telegram_id)}
+        session.close()
+        return user_ids
+
+    def _load_user_data(self, user_id: int) -> Optional[dict]:
+        session = get_session()
+        data = session.query(UserData.data).filter_by(telegram_id=user_id).scalar()
+        session.close()
+        return data
+
+    def _save(self, states: dict, user_data: dict) -> None:
+        now = datetime.now()
+        session = get_session()
+        try:
+            insert = postgresql.insert if session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+
+            saved_states = [{'name': name, 'key': json.dumps(list(key)), 'state': state, 'updated_at': now}
+                            for (name, key), state in states.items() if state is not None]
+            if saved_states:
+                statement = insert(ConversationState.__table__)
+                session.execute(statement.on_conflict_do_update(
+                    index_elements=['name', 'key'],
+                    set_={'state': statement.excluded.state, 'updated_at': statement.excluded.updated_at}
+                ), saved_states)
+            ended = [(name, json.dumps(list(key))) for (name, key), state in states.items() if state is None]
+            if ended:
+                session.execute(delete(ConversationState).where(tuple_(ConversationState.name, ConversationState.key).in_(ended)))
+
+            saved_data = [{'telegram_id': user_id, 'data': data, 'updated_at': now}
+                          for user_id, data in user_data.items() if data is not None]
+            if saved_data:
+                statement = insert(UserData.__table__)
+                session.execute(statement.on_conflict_do_update(
+                    index_elements=['telegram_id'],
+                    set_={'data': statement.excluded.data, 'updated_at': statement.excluded.updated_at}
+                ), saved_data)
+            dropped = [user_id for user_id, data in user_data.items() if data is None]
+            if dropped:
+                session.execute(delete(UserData).where(UserData.telegram_id.in_(dropped)))
+
+            session.commit()
+        finally:
+            session.close()
+
+    # Not stored (see store_data)
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+def create_persistence() -> DatabasePersistence:
+    '''
+    Create the persistence, saving every PERSISTENCE_INTERVAL seconds.
+    Returns:
+        DatabasePersistence: The persistence for ApplicationBuilder.persistence.
+    '''
+    interval = float(os.getenv('PERSISTENCE_INTERVAL', str(DEFAULT_PERSISTENCE_INTERVAL)))
+    if interval <= 0:
+        raise ValueError("PERSISTENCE_INTERVAL must be positive")
+    return DatabasePersistence(interval)
@@ -0,0 +1,154 @@
+import os
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from urllib.parse import quote
+from modules.cache import LRUCache
+
+# Number of built URLs kept per API generation
+URL_CACHE_SIZE = 65536
+
+class ApiGeneration(NamedTuple):
+    '''
+    An endpoint generation of the tori search API: where searches are sent and how the filters are spelled.
+    '''
+    base_url: str
+    category_parameters: tuple = ('category', 'sub_category', 'product_category')  # by code level
+    location_parameter: str = 'location'
+    dealer_segment_values: tuple = (('yksityinen', '1'), ('yritys', '3'))
+    toridiili_parameter: str = 'shipping_types=0'
+    sort: str = 'PUBLISHED_DESC'
+
+# Known API generations, selected with the TORI_API_VERSION environment variable.
+# When tori moves its API, add a generation here and switch the variable: the stored items don't change.
+API_GENERATIONS = {
+    'search-page': ApiGeneration('https://www.tori.fi/recommerce-search-page/api/search/SEARCH_ID_BAP_COMMON'),
+    'forsale': ApiGeneration('https://www.tori.fi/recommerce/forsale/search/api/search/SEARCH_ID_BAP_COMMON'),
+    'pole-position': ApiGeneration('https://www.tori.fi/recommerce/forsale/search/api/pole-position/SEARCH_ID_BAP_COMMON')
+}
+DEFAULT_API_VERSION = 'forsale'
+
+class QuerySpec(NamedTuple):
+    '''
+    The filters of a tracked item in canonical form: equivalent searches have equal specs,
+    so a spec is both the key that groups subscriptions and the input of the URL builder.
+    Unset filters are empty tuples or None.
+    '''
+    text: str
+    categories: tuple
+    locations: tuple
+    dealer_segment: Optional[str]
+    toridiili: bool
+    price_from: Optional[int]
+    price_to: Optional[int]
+
+    @classmethod
+    def from_filters(cls, item: str, categories: list, locations: list, dealer_segments: Optional[list] = None,
+                     shipping_types: Optional[list] = None, price_from: Optional[int] = None,
+                     price_to: Optional[int] = None) -> 'QuerySpec':
+        '''
+        Build the spec of a tracked item from its stored filters.
+        Args:
+            item (str): The searched text.
+            categories (list): Category codes, empty (or [None]) for all categories.
+            locations (list): Location codes, empty (or [None]) for the whole Finland.
+            dealer_segments (list): Dealer segments, both or none for all sellers.
+            shipping_types (list): Shipping types ('toridiili' or 'all').
+            price_from (int): Minimum price.
+            price_to (int): Maximum price.
+        Returns:
+            QuerySpec: The canonical spec.
+        '''
+        dealer_segments = dealer_segments or []
+        return cls(
+            text=item.strip().lower(),
+            categories=tuple(sorted({code for code in categories or [] if code})),
+            locations=tuple(sorted({code for code in locations or [] if code})),
+            dealer_segment=dealer_segments[0] if len(dealer_segments) == 1 else None,
+            toridiili='toridiili' in (shipping_types or []),
+            price_from=price_from,
+            price_to=price_to
+        )
+
+    @classmethod
+    def from_item(cls, item) -> 'QuerySpec':
+        '''
+        Build the spec of a ToriItem (or a row with the same columns).
+        Args:
+            item (ToriItem): The tracked item.
+        Returns:
+            QuerySpec: The canonical spec.
+        '''
+        return cls.from_filters(item.item, item.categories, item.locations, item.dealer_segments,
+                                item.shipping_types, item.price_from, item.price_to)
+
+class URLBuilder:
+    '''
+    Builds the fetch URLs of one API generation. The parts that don't depend on the spec are
+    prepared once, and the URL of each spec is cached, so the poller doesn't rebuild it every round.
+    '''
+
+    def __init__(self, version: str, generation: ApiGeneration, cache_size: int = URL_CACHE_SIZE):
+        self.version = version
+        self.generation = generation
+        self.cache = LRUCache(cache_size)
+        self._prefix = f'{generation.base_url}?q='
+        self._suffix = f'&sort={generation.sort}'
+        self._dealer_segments = {segment: f'&dealer_segment={value}' for segment, value in generation.dealer_segment_values}
+
+    def build(self, spec: QuerySpec) -> str:
+        '''
+        Get the fetch URL of a spec.
+        Args:
+            spec (QuerySpec): The canonical spec.
+        Returns:
+            str: The search API URL, newest ads first.
+        '''
+        url = self.cache.get(spec)
+        if url is None:
+            url = self._build(spec)
+            self.cache.put(spec, url)
+        return url
+
+    def _build(self, spec: QuerySpec) -> str:
+        generation = self.generation
+        parts = [self._prefix, quote(spec.text, safe='')]
+        for code in spec.categories:
+            # The level prefix of a code tells which query parameter it belongs to
+            parts.append(f'&{generation.category_parameters[int(code[0])]}={code}')
+        for code in spec.locations:
+            parts.append(f'&{generation.location_parameter}={code}')
+        if spec.dealer_segment is not None:
+            parts.append(self._dealer_segments[spec.dealer_segment])
+        if spec.toridiili:
+            parts.append(f'&{generation.toridiili_parameter}')
+        if spec.price_from is not None:
+            parts.append(f'&price_from={spec.price_from}')
+        if spec.price_to is not None:
+            parts.append(f'&price_to={spec.price_to}')
+        parts.append(self._suffix)
+        return ''.join(parts)
+
+@lru_cache(maxsize=None)
+def get_url_builder(version: Optional[str] = None) -> URLBuilder:
+    '''
+    Get the URL builder of an API generation.
+    Args:
+        version (str): Name of the generation in API_GENERATIONS; by default the TORI_API_VERSION
+            environment variable, or DEFAULT_API_VERSION if it is not set.
+    Returns:
+        URLBuilder: The shared builder of the generation.
+    '''
+    version = version or os.getenv('TORI_API_VERSION', DEFAULT_API_VERSION)
+    if version not in API_GENERATIONS:
+        raise ValueError(f"Unknown TORI_API_VERSION {version!r}, expected one of: {', '.join(API_GENERATIONS)}")
+    return URLBuilder(version, API_GENERATIONS[version])
+
+def build_url(spec: QuerySpec) -> str:
+    '''
+    Build the fetch URL of a spec with the configured API generation.
+    Args:
+        spec (QuerySpec): The canonical spec.
+    Returns:
+        str: The search API URL.
+    '''
+    return get_url_builder().build(spec)
@@ -0,0 +1,325 @@
+import json
+import logging
+from array import array
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+from sqlalchemy import String, type_coerce
+from modules.database import get_session
+from modules.models import ToriItem, UserPreferences
+from modules.query import QuerySpec
+
+logger = logging.getLogger(__name__)
+
+# Number of rows fetched from the database at once when (re)building the registry
+POLL_BATCH_SIZE = 500
+
+# Number of distinct filter values kept decoded while (re)building the registry
+FILTER_CACHE_SIZE = 4096
+
+# Filter columns of the tracked items, selected as JSON text (see decode_filter)
+FILTER_COLUMNS = ('categories', 'locations', 'dealer_segments', 'shipping_types')
+
+def iter_subscriptions(session, batch_size: int = POLL_BATCH_SIZE):
+    '''
+    Stream the tracked items in bounded batches using keyset pagination on the primary key.
+    Only the columns the poller needs are selected, so no ORM objects are built and memory
+    stays flat no matter how large the table is. Each batch is fetched completely before it is
+    yielded, so the session can be committed while iterating.
+    Args:
+        session (Session): The SQLAlchemy session.
+        batch_size (int): Number of rows fetched per query.
+    Yields:
+        Row: A row with id, telegram_id, latest_time, added_time and the filters of the item
+            (item, price_from, price_to and the FILTER_COLUMNS, which have to be passed through decode_filter).
+    '''
+    filter_columns = [type_coerce(getattr(ToriItem, name), String).label(name) for name in FILTER_COLUMNS]
+    last_id = 0
+    while True:
+        rows = (session.query(ToriItem.id, ToriItem.telegram_id, ToriItem.latest_time, ToriItem.added_time,
+                              ToriItem.item, ToriItem.price_from, ToriItem.price_to, *filter_columns)
+                .filter(ToriItem.id > last_id)
+                .order_by(ToriItem.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _decode_json(text: str):
+    return json.loads(text)
+
+def decode_filter(value):
+    '''
+    Decode a filter column selected by iter_subscriptions. Most items share the same few filter values,
+    so each distinct JSON text is decoded once instead of once per row.
+    Args:
+        value: The JSON text, or the decoded value if the database driver already decoded it (PostgreSQL JSONB).
+    Returns:
+        The decoded value (shared between rows, must not be modified).
+    '''
+    if isinstance(value, str):
+        return _decode_json(value)
+    return value
+
+def iter_languages(session, batch_size: int = POLL_BATCH_SIZE):
+    '''
+    Stream (telegram_id, language) pairs of all users in bounded batches.
+    Args:
+        session (Session): The SQLAlchemy session.
+        batch_size (int): Number of rows fetched per query.
+    Yields:
+        Row: A row with id, telegram_id and language.
+    '''
+    last_id = 0
+    while True:
+        rows = (session.query(UserPreferences.id, UserPreferences.telegram_id, UserPreferences.language)
+                .filter(UserPreferences.id > last_id)
+                .order_by(UserPreferences.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+
+class SubscriptionRegistry:
+    '''
+    Compact in-memory registry of the tracked items, grouped by query spec.
+    Subscriptions are kept in parallel typed arrays (one slot per item); removing an item moves the
+    last slot into its place, so the arrays never have holes. The registry is built once at startup
+    and kept in sync by the handlers, so the poller never has to read the tori_items table.
+    '''
+
+    def __init__(self):
+        self._item_ids = array('q')
+        self._telegram_ids = array('q')
+        self._latest_times = array('d')
+        self._query_ids = array('l')
+        self._slots = {}            # item id -> slot
+        self._query_index = {}      # query spec -> query id
+        self._query_specs = []      # query id -> query spec
+        self._query_slots = []      # query id -> set of slots
+        self._free_query_ids = []
+        self._languages = {}        # telegram id -> language
+        self.version = 0            # incremented by every change of the items or languages
+
+    def __len__(self) -> int:
+        return len(self._item_ids)
+
+    def add(self, item_id: int, telegram_id: int, spec: QuerySpec, latest_time: datetime):
+        '''
+        Add a tracked item to the registry (or replace it if it is already there).
+        Args:
+            item_id (int): ID of the ToriItem.
+            telegram_id (int): The user's Telegram ID.
+            spec (QuerySpec): The filters of the item.
+            latest_time (datetime): Time of the latest ad the user was notified about.
+        '''
+        if item_id in self._slots:
+            self.remove(item_id)
+
+        self.version += 1
+        query_id = self._query_index.get(spec)
+        if query_id is None:
+            if self._free_query_ids:
+                query_id = self._free_query_ids.pop()
+                self._query_specs[query_id] = spec
+                self._query_slots[query_id] = set()
+            else:
+                query_id = len(self._query_specs)
+                self._query_specs.append(spec)
+                self._query_slots.append(set())
+            self._query_index[spec] = query_id
+
+        slot = len(self._item_ids)
+        self._item_ids.append(item_id)
+        self._telegram_ids.append(telegram_id)
+        self._latest_times.append(latest_time.timestamp())
+        self._query_ids.append(query_id)
+        self._slots[item_id] = slot
+        self._query_slots[query_id].add(slot)
+
+    def remove(self, item_id: int) -> bool:
+        '''
+        Remove a tracked item from the registry.
+        Args:
+            item_id (int): ID of the ToriItem.
+        Returns:
+            bool: True if the item was in the registry.
+        '''
+        slot = self._slots.pop(item_id, None)
+        if slot is None:
+            return False
+
+        self.version += 1
+        query_id = self._query_ids[slot]
+        query_slots = self._query_slots[query_id]
+        query_slots.discard(slot)
+        if not query_slots:
+            del self._query_index[self._query_specs[query_id]]
+            self._query_specs[query_id] = None
+            self._free_query_ids.append(query_id)
+
+        last = len(self._item_ids) - 1
+        if slot != last:
+            # Move the last subscription into the freed slot
+            moved_item_id = self._item_ids[last]
+            moved_query_id = self._query_ids[last]
+            self._item_ids[slot] = moved_item_id
+            self._telegram_ids[slot] = self._telegram_ids[last]
+            self._latest_times[slot] = self._latest_times[last]
+            self._query_ids[slot] = moved_query_id
+            self._slots[moved_item_id] = slot
+            self._query_slots[moved_query_id].discard(last)
+            self._query_slots[moved_query_id].add(slot)
+
+        for column in (self._item_ids, self._telegram_ids, self._latest_times, self._query_ids):
+            column.pop()
+        return True
+
+    def remove_user(self, telegram_id: int):
+        '''
+        Remove all tracked items of a user (e.g. when they blocked the bot). Their language is kept,
+        as their preferences stay in the database.
+        Args:
+            telegram_id (int): The user's Telegram ID.
+        '''
+        item_ids = [self._item_ids[slot] for slot in range(len(self._item_ids)) if self._telegram_ids[slot] == telegram_id]
+        for item_id in item_ids:
+            self.remove(item_id)
+
+    def set_language(self, telegram_id: int, language: Optional[str]):
+        '''
+        Update the language the user's notifications are rendered in.
+        Args:
+            telegram_id (int): The user's Telegram ID.
+            language (str | None): The new language, or None if the user has no language set.
+        '''
+        self.version += 1
+        if language is None:
+            self._languages.pop(telegram_id, None)
+        else:
+            self._languages[telegram_id] = language
+
+    def get_language(self, telegram_id: int) -> str:
+        '''
+        Get the user's language known to the registry.
+        Args:
+            telegram_id (int): The user's Telegram ID.
+        Returns:
+            str: The user's language or the default language ('🇬🇧 English').
+        '''
+        return self._languages.get(telegram_id, '🇬🇧 English')
+
+    def set_latest_time(self, item_id: int, latest_time: datetime):
+        '''
+        Update the time of the latest ad the user was notified about.
+        Args:
+            item_id (int): ID of the ToriItem.
+            latest_time (datetime): The new latest time.
+        '''
+        slot = self._slots.get(item_id)
+        if slot is not None:
+            self._latest_times[slot] = latest_time.timestamp()
+
+    def queries(self) -> list:
+        '''
+        Take a snapshot of the registry grouped by query, safe to iterate while handlers modify the registry.
+        Returns:
+            list: (spec, subscriptions) tuples where subscriptions is a list of
+                (item_id, telegram_id, latest_time) tuples sharing that query spec.
+        '''
+        snapshot = []
+        for spec, slots in zip(self._query_specs, self._query_slots):
+            if spec is None:
+                continue
+            snapshot.append((spec, [
+                (self._item_ids[slot], self._telegram_ids[slot], datetime.fromtimestamp(self._latest_times[slot]))
+                for slot in slots
+            ]))
+        return snapshot
+
+    def state(self) -> tuple:
+        '''
+        Get a comparable view of the registry contents.
+        Returns:
+            tuple: ({item_id: (telegram_id, query spec)}, {telegram_id: language}).
+        '''
+        items = {
+            self._item_ids[slot]: (self._telegram_ids[slot], self._query_specs[self._query_ids[slot]])
+            for slot in range(len(self._item_ids))
+        }
+        return items, dict(self._languages)
+
+    @classmethod
+    def from_database(cls) -> 'SubscriptionRegistry':
+        '''
+        Build a new registry from the database, streaming the tables in batches.
+        Only touches the new registry, so it can run in a thread while the shared one is in use.
+        Returns:
+            SubscriptionRegistry: The registry.
+        '''
+        fresh = cls()
+        session = get_session()
+        try:
+            for row in iter_languages(session):
+                fresh.set_language(row.telegram_id, row.language)
+            for row in iter_subscriptions(session):
+                spec = QuerySpec.from_filters(row.item, *(decode_filter(getattr(row, name)) for name in FILTER_COLUMNS),
+                                              row.price_from, row.price_to)
+                fresh.add(row.id, row.telegram_id, spec, row.latest_time or row.added_time)
+        finally:
+            session.close()
+        return fresh
+
+    def load(self):
+        '''
+        (Re)build the registry from the database.
+        '''
+        version = self.version
+        self.__dict__.update(self.from_database().__dict__)
+        self.version = version + 1
+
+    def reconcile(self, fresh: Optional['SubscriptionRegistry'] = None, version: Optional[int] = None) -> bool:
+        '''
+        Check the registry against the database and rebuild it if they have drifted apart.
+        Args:
+            fresh (SubscriptionRegistry | None): The registry built from the database (see from_database);
+                loaded here if not given.
+            version (int | None): The version of this registry when fresh was loaded. If it has changed
+                since, fresh may be missing the changes, so the check is skipped until the next time.
+        Returns:
+            bool: True if the registry was out of sync.
+        '''
+        if fresh is None:
+            version, fresh = self.version, self.from_database()
+        if version is not None and version != self.version:
+            logger.info("Subscription registry changed while it was being checked, checking it next time")
+            return False
+        current_items, current_languages = self.state()
+        fresh_items, fresh_languages = fresh.state()
+        if current_items == fresh_items and current_languages == fresh_languages:
+            return False
+
+        logger.warning(
+            "Subscription registry drifted from the database: %d missing, %d stale, %d changed languages. Rebuilding.",
+            len(fresh_items.keys() - current_items.keys()),
+            len(current_items.keys() - fresh_items.keys()),
+            len(set(fresh_languages.items()) ^ set(current_languages.items()))
+        )
+        # Keep the in-memory latest times: they may be ahead of a database write still in flight
+        latest_times = {item_id: self._latest_times[slot] for item_id, slot in self._slots.items()}
+        version = self.version
+        self.__dict__.update(fresh.__dict__)
+        self.version = version + 1
+        for item_id, timestamp in latest_times.items():
+            slot = self._slots.get(item_id)
+            if slot is not None:
+                self._latest_times[slot] = max(self._latest_times[slot], timestamp)
+        return True
+
+# The registry shared by the handlers and the poller
+registry = SubscriptionRegistry()
@@ -0,0 +1,66 @@
+from typing import Optional
+from telegram import Update, MessageEntity
+from telegram.ext import BaseHandler, ConversationHandler
+
+# Route key of plain text messages; the other keys are command names, which can't contain '#'
+TEXT = '#text'
+
+def get_route_key(update: object) -> Optional[str]:
+    '''
+    Classify a message for routing.
+    Args:
+        update (object): The update.
+    Returns:
+        str | None: The command name for a command ('add' for '/add ...' and '/add@ToriScan_bot ...'),
+            TEXT for plain text, or None if the update is not a text message or is addressed to another bot.
+    '''
+    if not isinstance(update, Update) or update.message is None or update.message.text is None:
+        return None
+    message = update.message
+    entity = message.entities[0] if message.entities else None
+    if entity is None or entity.type != MessageEntity.BOT_COMMAND or entity.offset != 0:
+        return TEXT
+    command, _, username = message.text[1:entity.length].lower().partition('@')
+    if username and username != message.get_bot().username.lower():
+        return None
+    return command
+
+class Router(BaseHandler):
+    '''
+    Handler that routes a message to the callback of its route key (see get_route_key) with a single
+    dictionary lookup, instead of checking a list of handlers one by one.
+    '''
+
+    def __init__(self, routes: dict):
+        super().__init__(self._unused_callback)
+        self.routes = routes
+
+    @staticmethod
+    async def _unused_callback(update, context):
+        raise RuntimeError("Router calls the callback of the route")
+
+    def check_update(self, update: object):
+        return self.routes.get(get_route_key(update))
+
+    async def handle_update(self, update, application, check_result, context):
+        return await check_result(update, context)
+
+def build_conversation(name: str, entry_routes: dict, command_routes: dict, text_routes: dict, persistent: bool = False) -> ConversationHandler:
+    '''
+    Build a conversation from its transition table.
+    Args:
+        name (str): Name of the conversation.
+        entry_routes (dict): Route key -> callback starting the conversation for a user who is not in it.
+        command_routes (dict): Command -> callback, available in every state.
+        text_routes (dict): State -> callback handling the plain text messages in that state.
+        persistent (bool): Whether the states are kept across restarts (the application needs a persistence).
+    Returns:
+        ConversationHandler: A conversation with one Router per state.
+    '''
+    return ConversationHandler(
+        entry_points=[Router(entry_routes)],
+        states={state: [Router({**command_routes, TEXT: callback})] for state, callback in text_routes.items()},
+        fallbacks=[],
+        name=name,
+        persistent=persistent
+    )
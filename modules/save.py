@@ -1,9 +1,12 @@
-from telegram import Update
+from telegram import ReplyKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 from modules.models import UserPreferences
 from modules.load import load_messages, load_categories, load_locations
 from modules.database import get_session
-from modules.utils import get_language, update_locations_list, update_categories_list, ALL_CATEGORIES, ALL_SUBCATEGORIES, WHOLE_FINLAND, ALL_CITIES
+from modules.constants import LANGUAGES, CATEGORY, SUBCATEGORY, REGION, CITY, AREA
+from modules.registry import registry
+from modules.search import get_search_index, children_scope
+from modules.utils import get_language, invalidate_language, update_filter_codes, get_category_code, get_location_code, ALL_CATEGORIES, ALL_SUBCATEGORIES, WHOLE_FINLAND, ALL_CITIES
 from modules.conversation import (
     main_menu,
     select_language,
@@ -24,6 +27,47 @@ from modules.conversation import (
     save_data
 )
 
+def resolve_choice(text: str, kind: str, language: str, parent_code: str = None, any_level: bool = False):
+    '''
+    Resolve a typed name that isn't one of the keyboard buttons through the catalog search index.
+    Args:
+        text (str): The text typed by the user.
+        kind (str): 'categories' or 'locations'.
+        language (str): The user's language.
+        parent_code (str): Code of the node whose children are being selected, None for the top level.
+        any_level (bool): Match nodes on every level (e.g. a city at the region step) instead of the children only.
+    Returns:
+        tuple: (names of the matching node and its parents in the user's language or None, suggestions).
+            Suggestions are full paths when any_level is set, names otherwise.
+    '''
+    scope = None if any_level else children_scope(parent_code)
+    match, suggestions = get_search_index().resolve(text, kind, language, scope)
+    if any_level:
+        return (match.names if match else None), [suggestion.path for suggestion in suggestions]
+    return (match.label if match else None), [suggestion.label for suggestion in suggestions]
+
+async def reject_choice(update: Update, context: ContextTypes.DEFAULT_TYPE, messages: dict, invalid_message: str,
+                        suggestions: list, state: int, select_menu) -> int:
+    '''
+    Reply to a name that couldn't be resolved: suggest the closest names, or show the menu again if there are none.
+    Args:
+        update (Update): The update object containing the user's message.
+        context (ContextTypes.DEFAULT_TYPE): The context object for maintaining conversation state.
+        messages (dict): Message templates in the user's language.
+        invalid_message (str): Key of the message sent when nothing matched.
+        suggestions (list): Suggested names.
+        state (int): Conversation state the suggestions are answered in.
+        select_menu: Handler showing the menu again.
+    Returns:
+        int: Next state for the conversation.
+    '''
+    if suggestions:
+        reply_markup = ReplyKeyboardMarkup([[suggestion] for suggestion in suggestions], one_time_keyboard=True)
+        await update.message.reply_text(messages['did_you_mean'], reply_markup=reply_markup)
+        return state
+    await update.message.reply_text(messages[invalid_message])
+    return await select_menu(update, context)
+
 async def save_language(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     '''
     Handle the user's language selection and save it to the database.
@@ -39,14 +83,19 @@ async def save_language(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     session = get_session()
     user_preferences = session.query(UserPreferences).filter_by(telegram_id=telegram_id).first()
 
-    if user_preferences:
+    if user_preferences and user_preferences.language:
         language = user_preferences.language
     else:
         language = update.message.text
-        if language in ['🇬🇧 English', '🇺🇦 Українська', '🇷🇺 Русский', '🇫🇮 Suomi']:
-            user_preferences = UserPreferences(telegram_id=telegram_id, language=language)
-            session.add(user_preferences)
+        if language in LANGUAGES:
+            if user_preferences:
+                user_preferences.language = language
+            else:
+                user_preferences = UserPreferences(telegram_id=telegram_id, language=language)
+                session.add(user_preferences)
             session.commit()
+            registry.set_language(telegram_id, language)
+            invalidate_language(telegram_id)
         else:
             await update.message.reply_text('❗ Please select a valid language.')
             return await select_language(update, context)
@@ -86,7 +135,8 @@ async def save_category(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         int: Next state for the conversation:
             Default: select_subcategory;
             Invalid: select_category;
-            If the choice is in ALL_CATEGORIES: save_product_category.
+            If the choice is in ALL_CATEGORIES: save_product_category;
+            If a subcategory or a product category was typed: select_product_category or add_more_categories.
     '''
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
@@ -96,8 +146,17 @@ async def save_category(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     if 'category' not in context.user_data:
         user_category = update.message.text
         if user_category not in categories_data:
-            await update.message.reply_text(messages['invalid_category'])
-            return await select_category(update, context)
+            names, suggestions = resolve_choice(user_category, 'categories', language, any_level=True)
+            if names is None:
+                return await reject_choice(update, context, messages, 'invalid_category', suggestions, CATEGORY, select_category)
+            context.user_data['category'] = names[0]
+            # A subcategory or a product category answers the next steps too
+            if len(names) > 1:
+                context.user_data['subcategory'] = names[1]
+                if len(names) > 2:
+                    context.user_data['product_category'] = names[2]
+                    return await add_more_categories(update, context)
+                return await select_product_category(update, context)
         elif user_category.lower() in ALL_CATEGORIES:
             if language == '🇫🇮 Suomi':
                 context.user_data['category'] = 'Kaikki kategoriat'
@@ -147,8 +206,11 @@ async def save_subcategory(update: Update, context: ContextTypes.DEFAULT_TYPE) -
                 context.user_data['subcategory'] = 'Все подкатегории'
             return await save_product_category(update, context)
         elif user_subcategory not in categories_data[context.user_data['category']]['subcategories']:
-            await update.message.reply_text(messages['invalid_subcategory'])
-            return await select_subcategory(update, context)
+            category_code = categories_data[context.user_data['category']]['category_code']
+            user_subcategory, suggestions = resolve_choice(user_subcategory, 'categories', language, category_code)
+            if user_subcategory is None:
+                return await reject_choice(update, context, messages, 'invalid_subcategory', suggestions, SUBCATEGORY, select_subcategory)
+            context.user_data['subcategory'] = user_subcategory
         else:
             context.user_data['subcategory'] = update.message.text
 
@@ -168,11 +230,7 @@ async def save_product_category(update: Update, context: ContextTypes.DEFAULT_TY
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
     categories_data = load_categories(language)
-    messages = load_messages(language)
     
-    if 'categories' not in context.user_data:
-        context.user_data['categories'] = []
-
     context.user_data['product_category'] = update.message.text
 
     new_category = {
@@ -180,7 +238,11 @@ async def save_product_category(update: Update, context: ContextTypes.DEFAULT_TY
         'subcategory': context.user_data.pop('subcategory'),
         'product_category': context.user_data.pop('product_category')
     }
-    context.user_data['categories'].append(new_category)
+    context.user_data['categories'] = update_filter_codes(
+        telegram_id, 'categories',
+        context.user_data.get('categories', []),
+        get_category_code(categories_data, new_category)
+    )
     
     if new_category['category'].lower() in ALL_CATEGORIES:
         return await select_region(update, context)
@@ -197,7 +259,8 @@ async def save_region(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         int: Next state for the conversation:
             Default: select_city;
             Invalid: select_region;
-            If the choice is in WHOLE_FINLAND: save_data.
+            If the choice is in WHOLE_FINLAND: save_data;
+            If a city or an area was typed: select_area or add_more_locations.
     ''' 
     telegram_id = update.message.from_user.id
     language = get_language(telegram_id)
@@ -206,39 +269,24 @@ async def save_region(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
     user_region = update.message.text
     if user_region not in locations_data:
-        await update.message.reply_text(messages['invalid_region'])
-        return await select_region(update, context)
+        names, suggestions = resolve_choice(user_region, 'locations', language, any_level=True)
+        if names is None:
+            return await reject_choice(update, context, messages, 'invalid_region', suggestions, REGION, select_region)
+        user_region = names[0]
+        # A city or an area answers the next steps too
+        if len(names) > 1:
+            context.user_data['region'] = names[0]
+            context.user_data['city'] = names[1]
+            if len(names) > 2:
+                context.user_data['area'] = names[2]
+                return await add_more_locations(update, context)
+            return await select_area(update, context)
 
     if user_region.lower() in WHOLE_FINLAND:
-        context.user_data['locations'] = []
-        if language == '🇫🇮 Suomi':
-            whole_finland_location = {
-                'region': 'Koko Suomi',
-                'city': 'Kaikki kaupungit',
-                'area': 'Kaikki alueet'
-            }
-        elif language == '🇬🇧 English':
-            whole_finland_location = {
-                'region': 'Whole Finland',
-                'city': 'All cities',
-                'area': 'All areas'
-            }
-        elif language == '🇺🇦 Українська':
-            whole_finland_location = {
-                'region': 'Вся Фінляндія',
-                'city': 'Всі міста',
-                'area': 'Всі райони'
-            }
-        elif language == '🇷🇺 Русский':
-            whole_finland_location = {
-                'region': 'Вся Финляндия',
-                'city': 'Все города',
-                'area': 'Все области'
-            }
-        context.user_data['locations'] = [whole_finland_location]
+        context.user_data['locations'] = [None]
         return await select_additional_filters(update, context)
     
-    context.user_data['region'] = update.message.text
+    context.user_data['region'] = user_region
     return await select_city(update, context)
 
 async def save_city(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -276,8 +324,11 @@ async def save_city(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
                 context.user_data['city'] = 'Все города'
             return await save_area(update, context)
         elif user_city.lower() not in WHOLE_FINLAND and user_city not in locations_data[context.user_data['region']]['cities']:
-            await update.message.reply_text(messages['invalid_city'])
-            return await select_city(update, context)
+            region_code = locations_data[context.user_data['region']]['region_code']
+            user_city, suggestions = resolve_choice(user_city, 'locations', language, region_code)
+            if user_city is None:
+                return await reject_choice(update, context, messages, 'invalid_city', suggestions, CITY, select_city)
+            context.user_data['city'] = user_city
         else:
             context.user_data['city'] = update.message.text
 
@@ -311,8 +362,11 @@ async def save_area(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             elif language == '🇷🇺 Русский':
                 context.user_data['product_category'] = 'Все районы'
         if user_area.lower() not in WHOLE_FINLAND and user_area not in locations_data[context.user_data['region']]['cities'][context.user_data['city']]['areas']:
-            await update.message.reply_text(messages['invalid_area'])
-            return await select_area(update, context)
+            city_code = locations_data[context.user_data['region']]['cities'][context.user_data['city']]['city_code']
+            user_area, suggestions = resolve_choice(user_area, 'locations', language, city_code)
+            if user_area is None:
+                return await reject_choice(update, context, messages, 'invalid_area', suggestions, AREA, select_area)
+            context.user_data['area'] = user_area
         else:
             context.user_data['area'] = update.message.text
 
@@ -343,9 +397,10 @@ async def more_locations_response(update: Update, context: ContextTypes.DEFAULT_
             'area': context.user_data.pop('area')
         }
         
-        context.user_data['locations'] = update_locations_list(
-            context.user_data['locations'], 
-            current_location
+        context.user_data['locations'] = update_filter_codes(
+            telegram_id, 'locations',
+            context.user_data['locations'],
+            get_location_code(load_locations(language), current_location)
         )
 
     if update.message.text == messages['yes']:
@@ -370,14 +425,12 @@ async def more_categories_response(update: Update, context: ContextTypes.DEFAULT
             'subcategory': context.user_data.pop('subcategory'),
             'product_category': context.user_data.pop('product_category')
         }
-        
-        if not any(
-            cat['category'] == new_category['category'] and
-            cat['subcategory'] == new_category['subcategory'] and
-            cat['product_category'] == new_category['product_category']
-            for cat in context.user_data['categories']
-        ):
-            context.user_data['categories'].append(new_category)
+
+        context.user_data['categories'] = update_filter_codes(
+            telegram_id, 'categories',
+            context.user_data['categories'],
+            get_category_code(load_categories(language), new_category)
+        )
 
     if update.message.text == messages['yes']:
         return await select_category(update, context)
@@ -0,0 +1,423 @@
+import heapq
+import logging
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import NamedTuple, Optional
+from modules.cache import LRUCache
+from modules.constants import LANGUAGES
+from modules.load import load_categories, load_locations, iter_catalog_nodes
+
+logger = logging.getLogger(__name__)
+
+# Catalogs covered by the index
+SEARCH_KINDS = ('categories', 'locations')
+
+# Default number of results returned by a search
+SEARCH_LIMIT = 10
+
+# Number of recent searches whose results are kept (short prefixes repeat a lot in inline mode)
+SEARCH_CACHE_SIZE = 4096
+
+# Texts up to this length tolerate two typos; longer ones one, which keeps the deletion
+# dictionary small (the names of the index are deleted twice up to this length + 2, once above)
+MAX_DOUBLE_DELETE_LENGTH = 12
+
+# Queries up to this length are answered from lists of the matching names ordered by rank, which are
+# read only until the best results are known (short prefixes match thousands of names)
+SHORT_PREFIX_LENGTH = 3
+
+# Shorter texts are never resolved to a single node, only suggested
+MIN_RESOLVE_LENGTH = 3
+
+# Separator of the node names in a full path (e.g. 'Uusimaa › Helsinki')
+PATH_SEPARATOR = ' › '
+
+# Match ranks, from the best to the worst (WORD: the match is a word inside a longer name)
+RANK_EXACT, RANK_PREFIX, RANK_WORD_PREFIX, RANK_FUZZY, RANK_WORD_FUZZY = range(5)
+
+class SearchResult(NamedTuple):
+    '''
+    A catalog node matching a search.
+    kind: 'categories' or 'locations'.
+    code: Catalog code of the node (e.g. '1.100015.110035').
+    names: Names of the node and its parents from the top level down, in the requested language.
+    score: Sort key of the match (lower is better).
+    '''
+    kind: str
+    code: str
+    names: tuple
+    score: tuple
+
+    @property
+    def label(self) -> str:
+        return self.names[-1]
+
+    @property
+    def path(self) -> str:
+        return PATH_SEPARATOR.join(self.names)
+
+def normalize(text: str) -> str:
+    '''
+    Normalize text for matching: case, diacritics, punctuation and repeated spaces are ignored.
+    Args:
+        text (str): The text.
+    Returns:
+        str: The normalized text.
+    '''
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    characters = [character if character.isalnum() else ' ' for character in decomposed if not unicodedata.combining(character)]
+    return ' '.join(''.join(characters).split())
+
+def max_distance(text: str) -> int:
+    '''
+    Get the number of typos tolerated in a normalized search text.
+    Args:
+        text (str): The normalized text.
+    Returns:
+        int: 0 for very short texts, 2 for texts of 6 to MAX_DOUBLE_DELETE_LENGTH characters and 1 otherwise.
+    '''
+    if len(text) < 3:
+        return 0
+    if 6 <= len(text) <= MAX_DOUBLE_DELETE_LENGTH:
+        return 2
+    return 1
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    '''
+    Compute the optimal string alignment distance (insertions, deletions, substitutions and
+    transpositions of adjacent characters) between two strings.
+    Args:
+        a (str): First string.
+        b (str): Second string.
+        limit (int): Distances above the limit are not computed exactly.
+    Returns:
+        int: The distance, or limit + 1 if it's greater than the limit.
+    '''
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+def deletes(text: str, count: int = 1) -> set:
+    '''
+    Get the variants of a string with up to `count` characters deleted.
+    Args:
+        text (str): The string.
+        count (int): Maximum number of deleted characters.
+    Returns:
+        set: The variants (without the string itself).
+    '''
+    variants = set()
+    current = {text}
+    for _ in range(count):
+        current = {variant[:i] + variant[i + 1:] for variant in current for i in range(len(variant))}
+        variants |= current
+    variants.discard(text)
+    return variants
+
+def children_scope(code: Optional[str] = None) -> str:
+    '''
+    Get the scope (code prefix) of the children of a catalog node.
+    Args:
+        code (Optional[str]): Code of the node, or None for the top level (regions or categories).
+    Returns:
+        str: The code prefix shared by all children of the node.
+    '''
+    if code is None:
+        return '0.'
+    level, path = code.split('.', 1)
+    return f'{int(level) + 1}.{path}.'
+
+class CatalogIndex:
+    '''
+    In-memory search index over the names of all category and location nodes in all languages.
+    Matches are exact, prefix or fuzzy (typos within max_distance edits, found through the names with
+    up to two characters deleted), of the whole name or of one of its words.
+    The deletion variants aren't kept as strings: each one is stored as its hash and the ID of its name,
+    packed into one integer of a sorted array, and the names found through it are verified with edit_distance.
+    '''
+
+    def __init__(self, catalogs: dict):
+        '''
+        Build the index.
+        Args:
+            catalogs (dict): {(kind, language): catalog data}.
+        '''
+        self.cache = LRUCache(SEARCH_CACHE_SIZE)
+        self._entries = []
+        self._entry_ids = {}
+        self._names = []
+        # normalized key -> [(entry id, language, is a word of a longer name)]
+        self._postings = {}
+
+        for (kind, language), data in catalogs.items():
+            for code, names in iter_catalog_nodes(kind, data):
+                entry_id = self._entry_ids.get((kind, code))
+                if entry_id is None:
+                    entry_id = self._entry_ids[(kind, code)] = len(self._entries)
+                    self._entries.append((kind, code))
+                    self._names.append({})
+                self._names[entry_id][language] = names
+                name = normalize(names[-1])
+                if not name:
+                    continue
+                self._add_key(name, (entry_id, language, False))
+                words = name.split(' ')
+                for position in range(1, len(words)):
+                    self._add_key(' '.join(words[position:]), (entry_id, language, True))
+
+        self._sorted_keys = sorted(self._postings)
+        self._key_bits = max(1, (len(self._sorted_keys) - 1).bit_length())
+        self._hash_mask = (1 << (63 - self._key_bits)) - 1
+        # (hash of a deletion variant << key bits) | ID of the key it was derived from, sorted.
+        # Two typos can make a text up to two characters shorter than the name
+        self._deletes = array('q', sorted(
+            ((hash(variant) & self._hash_mask) << self._key_bits) | key_id
+            for key_id, key in enumerate(self._sorted_keys)
+            for variant in deletes(key, 2 if len(key) <= MAX_DOUBLE_DELETE_LENGTH + 2 else 1)
+        ))
+
+        # prefix -> (key ID << posting bits) | posting position, ordered by rank, level, length and code
+        self._posting_bits = max(len(postings) for postings in self._postings.values()).bit_length()
+        short_prefixes = {}
+        for key_id, key in enumerate(self._sorted_keys):
+            for position, (entry_id, _, is_word) in enumerate(self._postings[key]):
+                code = self._entries[entry_id][1]
+                for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+                    rank = RANK_WORD_PREFIX if is_word else RANK_EXACT if len(key) == length else RANK_PREFIX
+                    short_prefixes.setdefault(key[:length], []).append(
+                        ((rank, code[0], len(key), code), (key_id << self._posting_bits) | position))
+        self._short_prefixes = {prefix: array('q', (item for _, item in sorted(items)))
+                                for prefix, items in short_prefixes.items()}
+
+    def _add_key(self, key: str, posting: tuple) -> None:
+        self._postings.setdefault(key, []).append(posting)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def names(self, kind: str, code: str, language: str) -> Optional[tuple]:
+        '''
+        Get the names of a node and its parents.
+        Args:
+            kind (str): 'categories' or 'locations'.
+            code (str): Catalog code of the node.
+            language (str): Language of the names.
+        Returns:
+            Optional[tuple]: The names from the top level down, or None if the code is unknown.
+        '''
+        entry_id = self._entry_ids.get((kind, code))
+        if entry_id is None:
+            return None
+        names = self._names[entry_id]
+        return names.get(language) or next(iter(names.values()))
+
+    def _prefix_keys(self, query: str):
+        '''
+        Iterate over the keys starting with a normalized query (including the query itself).
+        '''
+        position = bisect_left(self._sorted_keys, query)
+        while position < len(self._sorted_keys) and self._sorted_keys[position].startswith(query):
+            yield self._sorted_keys[position]
+            position += 1
+
+    def _fuzzy_keys(self, query: str) -> dict:
+        '''
+        Collect the keys within max_distance of a normalized query, except the ones starting with it.
+        Returns:
+            dict: {key: distance}.
+        '''
+        matches = {}
+        limit = max_distance(query)
+        if not limit:
+            return matches
+        key_mask = (1 << self._key_bits) - 1
+        for variant in {query} | deletes(query, limit):
+            keys = []
+            if variant in self._postings:
+                keys.append(variant)
+            low = (hash(variant) & self._hash_mask) << self._key_bits
+            position = bisect_left(self._deletes, low)
+            while position < len(self._deletes) and self._deletes[position] <= low | key_mask:
+                keys.append(self._sorted_keys[self._deletes[position] & key_mask])
+                position += 1
+            for key in keys:
+                if key in matches or key.startswith(query):
+                    continue
+                distance = edit_distance(query, key, limit)
+                if distance <= limit:
+                    matches[key] = distance
+        return matches
+
+    def _add_matches(self, best: dict, key: str, rank: int, distance: int, kind: Optional[str], language: Optional[str],
+                     scope: Optional[str]) -> None:
+        '''
+        Score the nodes named by a matching key, keeping the best score of each node in `best`.
+        '''
+        for entry_id, entry_language, is_word in self._postings[key]:
+            entry_kind, code = self._entries[entry_id]
+            if (kind is not None and entry_kind != kind) or (scope is not None and not code.startswith(scope)):
+                continue
+            match_rank = rank
+            if is_word:
+                match_rank = RANK_WORD_FUZZY if rank == RANK_FUZZY else RANK_WORD_PREFIX
+            score = (match_rank, distance, code[0], entry_language != language, len(key))
+            if entry_id not in best or score < best[entry_id]:
+                best[entry_id] = score
+
+    def _add_short_prefix_matches(self, best: dict, query: str, kind: Optional[str], language: Optional[str],
+                                  scope: Optional[str], limit: int) -> bool:
+        '''
+        Score the nodes whose names start with a query of up to SHORT_PREFIX_LENGTH characters, in the order of
+        the scores, until the best `limit` nodes are known: the ones of a group (rank and level) rank above the
+        next groups, and inside a group the names in the requested language come in the order of their scores.
+        Returns:
+            bool: True if the best `limit` nodes are in `best`, so no fuzzy match can rank among them.
+        '''
+        posting_mask = (1 << self._posting_bits) - 1
+        group = None
+        settled = 0         # nodes of the previous groups
+        preferred = set()   # nodes of the current group matching in the requested language
+        for item in self._short_prefixes.get(query, ()):
+            key = self._sorted_keys[item >> self._posting_bits]
+            entry_id, entry_language, is_word = self._postings[key][item & posting_mask]
+            entry_kind, code = self._entries[entry_id]
+            if (kind is not None and entry_kind != kind) or (scope is not None and not code.startswith(scope)):
+                continue
+            rank = RANK_WORD_PREFIX if is_word else RANK_EXACT if key == query else RANK_PREFIX
+            if group != (rank, code[0]):
+                settled = len(best)
+                if settled >= limit:
+                    return True
+                group = (rank, code[0])
+                preferred = set()
+            score = (rank, 0, code[0], entry_language != language, len(key))
+            if entry_id not in best or score < best[entry_id]:
+                best[entry_id] = score
+                if language is None or entry_language == language:
+                    preferred.add(entry_id)
+                    if settled + len(preferred) >= limit:
+                        return True
+        return len(best) >= limit
+
+    def search(self, text: str, kind: Optional[str], language: Optional[str] = None, scope: Optional[str] = None,
+               limit: int = SEARCH_LIMIT) -> list:
+        '''
+        Search catalog nodes by name.
+        Args:
+            text (str): The text typed by the user.
+            kind (Optional[str]): 'categories', 'locations' or None for both.
+            language (Optional[str]): Language of the returned names; its matches rank first.
+            scope (Optional[str]): Only return nodes whose code starts with this prefix (see children_scope).
+            limit (int): Maximum number of results.
+        Returns:
+            list: SearchResult tuples, best first.
+        '''
+        query = normalize(text)
+        if not query:
+            return []
+        key = (query, kind, language, scope, limit)
+        results = self.cache.get(key)
+        if results is None:
+            results = self._search(query, kind, language, scope, limit)
+            self.cache.put(key, results)
+        return list(results)
+
+    def _search(self, query: str, kind: Optional[str], language: Optional[str], scope: Optional[str], limit: int) -> tuple:
+        best = {}
+        complete = False
+        if len(query) <= SHORT_PREFIX_LENGTH:
+            complete = self._add_short_prefix_matches(best, query, kind, language, scope, limit)
+        else:
+            for key in self._prefix_keys(query):
+                self._add_matches(best, key, RANK_EXACT if key == query else RANK_PREFIX, 0, kind, language, scope)
+        if not complete:
+            for key, distance in self._fuzzy_keys(query).items():
+                self._add_matches(best, key, RANK_FUZZY, distance, kind, language, scope)
+
+        ranked = heapq.nsmallest(limit, best.items(), key=lambda item: (item[1], self._entries[item[0]][1]))
+        return tuple(SearchResult(*self._entries[entry_id], self.names(*self._entries[entry_id], language), score)
+                     for entry_id, score in ranked)
+
+    def resolve(self, text: str, kind: str, language: Optional[str] = None, scope: Optional[str] = None,
+                limit: int = SEARCH_LIMIT):
+        '''
+        Resolve typed text to one catalog node.
+        An exact match is accepted when no other node on the same level matches exactly too; a prefix
+        or fuzzy match of a whole name when no other node matches as well (a match inside a longer
+        name ranks below it), and never for texts shorter than MIN_RESOLVE_LENGTH.
+        A full path (names joined with PATH_SEPARATOR, as sent from inline mode) is resolved one level at a time.
+        Args:
+            text (str): The text typed by the user.
+            kind (str): 'categories' or 'locations'.
+            language (Optional[str]): Language of the returned names.
+            scope (Optional[str]): Code prefix the node has to start with (see children_scope).
+            limit (int): Maximum number of suggestions.
+        Returns:
+            tuple: (SearchResult or None, suggestions): the resolved node, or None and the ranked
+                suggestions when the text is ambiguous (no suggestions if nothing matched).
+        '''
+        if PATH_SEPARATOR.strip() in text:
+            match, results = None, []
+            for name in text.split(PATH_SEPARATOR.strip()):
+                match, results = self.resolve(name, kind, language, scope, limit)
+                if match is None:
+                    return None, results
+                scope = children_scope(match.code)
+            return match, results
+
+        results = self.search(text, kind, language, scope, limit)
+        if not results:
+            return None, results
+        best = results[0]
+        if best.score[0] == RANK_EXACT:
+            if len(results) == 1 or best.score[:3] < results[1].score[:3]:
+                return best, results
+        elif best.score[0] in (RANK_PREFIX, RANK_FUZZY) or len(results) == 1:
+            if len(normalize(text)) >= MIN_RESOLVE_LENGTH and (len(results) == 1 or best.score[:2] < results[1].score[:2]):
+                return best, results
+        return None, results
+
+# The shared index, built once (see get_search_index)
+search_index = None
+search_index_lock = threading.Lock()
+
+def get_search_index() -> CatalogIndex:
+    '''
+    Get the catalog search index, built once from the catalogs of all supported languages.
+    If it's being built in the background (see preload_search_index), waits until it's done.
+    Returns:
+        CatalogIndex: The shared index.
+    '''
+    global search_index
+    if search_index is None:
+        with search_index_lock:
+            if search_index is None:
+                loaders = {'categories': load_categories, 'locations': load_locations}
+                search_index = CatalogIndex({(kind, language): loaders[kind](language)
+                                             for kind in SEARCH_KINDS for language in LANGUAGES})
+                logger.info("Built the catalog search index: %d nodes", len(search_index))
+    return search_index
+
+def preload_search_index() -> threading.Thread:
+    '''
+    Build the search index in a background thread, so it doesn't delay the start of the bot.
+    Returns:
+        threading.Thread: The thread building the index.
+    '''
+    thread = threading.Thread(target=get_search_index, name='search-index', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,88 @@
+import os
+import asyncio
+from typing import Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Number of updates whose handlers run at the same time (UPDATE_WORKERS)
+DEFAULT_UPDATE_WORKERS = 16
+
+# Updates in flight (running or waiting for their chat or a worker). PTB's semaphore enforces it and isn't
+# first come, first served on every Python version, so it is set high enough not to be reached in practice
+MAX_PENDING_UPDATES = 10000
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    '''
+    Processes the updates of different chats concurrently, and the updates of each chat one after another
+    in the order they arrived, so the conversation state and user_data of a chat are never changed by two
+    handlers at once and a slow handler only delays its own chat.
+    An update first waits for its chat (asyncio.Lock is first come, first served) and only then for one of
+    the workers, so updates queued behind a busy chat don't take workers from the other chats.
+    '''
+
+    def __init__(self, workers: int = DEFAULT_UPDATE_WORKERS, max_pending: int = MAX_PENDING_UPDATES):
+        super().__init__(max_pending)
+        self.workers = workers
+        self._worker_slots = asyncio.Semaphore(workers)
+        self._chats = {}        # chat key -> [lock, number of updates holding or waiting for it]
+
+    @staticmethod
+    def get_chat_key(update: object) -> Optional[int]:
+        '''
+        Get the key the updates are ordered by: the chat, or the user for updates without a chat (inline queries).
+        Args:
+            update (object): The update.
+        Returns:
+            int | None: The chat or user ID, None if the update belongs to neither.
+        '''
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = self.get_chat_key(update)
+        if key is None:
+            async with self._worker_slots:
+                await coroutine
+            return
+
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = [asyncio.Lock(), 0]
+        chat[1] += 1
+        try:
+            async with chat[0]:
+                async with self._worker_slots:
+                    await coroutine
+        finally:
+            chat[1] -= 1
+            if not chat[1]:
+                del self._chats[key]
+
+    @property
+    def active_chats(self) -> int:
+        '''
+        Number of chats with an update being processed or waiting.
+        '''
+        return len(self._chats)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+def create_update_processor() -> ChatOrderedUpdateProcessor:
+    '''
+    Create the update processor with UPDATE_WORKERS workers.
+    Returns:
+        ChatOrderedUpdateProcessor: The processor for ApplicationBuilder.concurrent_updates.
+    '''
+    workers = int(os.getenv('UPDATE_WORKERS', str(DEFAULT_UPDATE_WORKERS)))
+    if workers < 1:
+        raise ValueError("UPDATE_WORKERS must be at least 1")
+    return ChatOrderedUpdateProcessor(workers)
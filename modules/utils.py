@@ -1,12 +1,26 @@
 import pytz
+from typing import Optional
 from telegram import Update
 from telegram.ext import ConversationHandler, ContextTypes
 from modules.models import UserPreferences, ToriItem
 from modules.database import get_session
-from modules.load import load_messages
+from modules.registry import registry
+from modules.cache import LRUCache
+from modules.coverage import CoverageTree
+from modules.load import load_messages, get_catalog_names, get_all_labels
 from modules.constants import *
 from datetime import datetime
 
+# Maximum number of users whose language is kept in memory
+LANGUAGE_CACHE_SIZE = 10000
+
+language_cache = LRUCache(LANGUAGE_CACHE_SIZE)
+
+# Maximum number of wizard filter selections whose coverage tree is kept in memory
+FILTER_TREE_CACHE_SIZE = 10000
+
+filter_trees = LRUCache(FILTER_TREE_CACHE_SIZE)
+
 async def remove_item(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     '''
     Remove the selected item from the user's list.
@@ -27,6 +41,7 @@ async def remove_item(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if item:
         session.query(ToriItem).filter_by(id=item_id).delete()
         session.commit()
+        registry.remove(item_id)
         await query.message.reply_text(messages['item_removed'].format(itemname=item.item))
     else:
         await query.message.reply_text(messages['item_not_found'])
@@ -47,106 +62,148 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 def get_language(telegram_id: int) -> str:
     '''
     Get the user's preferred language.
+    Languages are cached in memory; call invalidate_language when the user's language changes.
     Args:
         telegram_id (int): The user's Telegram ID.
     Returns:
         str: The user's preferred language or the default language ('🇬🇧 English').
     '''
+    language = language_cache.get(telegram_id)
+    if language is not None:
+        return language
+
     session = get_session()
     user_preferences = session.query(UserPreferences).filter_by(telegram_id=telegram_id).first()
     session.close()
-    return user_preferences.language if user_preferences else '🇬🇧 English'
+    language = user_preferences.language if user_preferences and user_preferences.language else '🇬🇧 English'
+    language_cache.put(telegram_id, language)
+    return language
 
-def is_location_covered(new_location: dict, existing_location: dict) -> bool:
+def invalidate_language(telegram_id: int) -> None:
     '''
-    Check if a location is already covered by an existing location based on hierarchy.
+    Drop the cached language of a user after it was changed.
     Args:
-        new_location (dict): The new location to check
-        existing_location (dict): An existing location to check against 
+        telegram_id (int): The user's Telegram ID.
+    '''
+    language_cache.invalidate(telegram_id)
+
+def get_filter_tree(telegram_id: int, kind: str, codes: list) -> CoverageTree:
+    '''
+    Get the coverage tree of the filter codes a user has selected in the wizard.
+    The tree is kept in memory between the steps, so it is only built from the list again after a restart
+    or when the list was replaced.
+    Args:
+        telegram_id (int): The user's Telegram ID.
+        kind (str): 'categories' or 'locations'.
+        codes (list): The codes selected so far (context.user_data[kind]).
     Returns:
-        bool: True if the new location is already covered by the existing location
-    '''
-    if existing_location['region'].lower() in WHOLE_FINLAND:
-        return True
-    if new_location['region'] != existing_location['region']:
-        return False
-    if new_location['city'].lower() in ALL_CITIES:
-        return False
-    if existing_location['city'].lower() in ALL_CITIES:
-        return True  
-    if new_location['city'] != existing_location['city']:
-        return False
-    if new_location.get('area', '').lower() in ALL_AREAS:
-        return False 
-    if existing_location.get('area', '').lower() in ALL_AREAS:
-        return True 
-
-    return new_location.get('area') == existing_location.get('area')
-
-def update_locations_list(locations: list, new_location: dict) -> list:
-    '''
-    Update the locations list based on hierarchy rules.
+        CoverageTree: The tree of the codes.
+    '''
+    cached = filter_trees.get((telegram_id, kind))
+    if cached is not None and cached[0] is codes and cached[1] == len(codes):
+        return cached[2]
+    tree = CoverageTree(codes)
+    filter_trees.put((telegram_id, kind), (codes, len(codes), tree))
+    return tree
+
+def update_filter_codes(telegram_id: int, kind: str, codes: list, code: Optional[str]) -> list:
+    '''
+    Add a category or location filter selected in the wizard based on hierarchy rules:
+    a code that is already covered by a more general one is not added, and the codes it covers no longer count.
+    The list only grows (the codes that count are get_filter_tree(...).codes()), so a step costs one walk
+    down the tree however many filters there are.
     Args:
-        locations (list): Current list of locations
-        new_location (dict): New location to be added
+        telegram_id (int): The user's Telegram ID.
+        kind (str): 'categories' or 'locations'.
+        codes (list): The codes selected so far.
+        code (str | None): The new code, None for all categories / the whole Finland.
     Returns:
-        list: Updated list of locations
+        list: The same list, with the code appended if it wasn't covered.
     '''
-    if new_location['region'].lower() in WHOLE_FINLAND:
-        return [new_location]
-
-    if new_location['city'].lower() in ALL_CITIES:
-        return [loc for loc in locations if loc['region'] != new_location['region']] + [new_location]
+    tree = get_filter_tree(telegram_id, kind, codes)
+    if tree.add(code):
+        codes.append(code)
+        filter_trees.put((telegram_id, kind), (codes, len(codes), tree))
+    return codes
 
-    if new_location.get('area', '').lower() in ALL_AREAS:
-        return [loc for loc in locations if not (
-            loc['region'] == new_location['region'] and 
-            loc['city'] == new_location['city']
-        )] + [new_location]
-
-    for existing_location in locations:
-        if is_location_covered(new_location, existing_location):
-            return locations 
+def get_category_code(categories_data: dict, category: dict) -> Optional[str]:
+    '''
+    Get the most specific catalog code of a category selection.
+    Args:
+        categories_data (dict): Category data in the language the selection was made in.
+        category (dict): Category dictionary containing category, subcategory, and product_category names.
+    Returns:
+        Optional[str]: Category, subcategory or product category code, or None for all categories.
+    '''
+    if category['category'].lower() in ALL_CATEGORIES:
+        return None
+    category_data = categories_data[category['category']]
+    if category['subcategory'].lower() in ALL_SUBCATEGORIES:
+        return category_data['category_code']
+    subcategory_data = category_data['subcategories'][category['subcategory']]
+    if category['product_category'].lower() in ALL_PRODUCT_CATEGORIES:
+        return subcategory_data['subcategory_code']
+    return subcategory_data['product_categories'][category['product_category']]
+
+def get_location_code(locations_data: dict, location: dict) -> Optional[str]:
+    '''
+    Get the most specific catalog code of a location selection.
+    Args:
+        locations_data (dict): Location data in the language the selection was made in.
+        location (dict): Location dictionary containing region, city, and area names.
+    Returns:
+        Optional[str]: Region, city or area code, or None for the whole Finland.
+    '''
+    if location['region'].lower() in WHOLE_FINLAND:
+        return None
+    region_data = locations_data[location['region']]
+    if location['city'].lower() in ALL_CITIES:
+        return region_data['region_code']
+    city_data = region_data['cities'][location['city']]
+    area = location.get('area')
+    if area and area.lower() not in ALL_AREAS:
+        return city_data['areas'][area]
+    return city_data['city_code']
+
+def get_filter_codes(codes: list) -> list:
+    '''
+    Normalize a list of filter codes for the item_categories / item_locations tables.
+    Args:
+        codes (list): Codes as returned by get_category_code or get_location_code.
+    Returns:
+        list: Unique codes in their original order, or [None] if any of them covers everything.
+    '''
+    if None in codes:
+        return [None]
+    return list(dict.fromkeys(codes))
 
-    return locations + [new_location]
+def format_categories(codes: list, language: str) -> str:
+    '''
+    Render the category filters of an item for a message, one line per filter.
+    Args:
+        codes (list): Category, subcategory or product category codes; empty for all categories.
+        language (str): Language of the names.
+    Returns:
+        str: The lines, e.g. "  🏷️ Antiques and art > Art\n".
+    '''
+    if not codes:
+        return f"  🏷️ {get_all_labels(language)['category']}\n"
+    names = get_catalog_names('categories', language)
+    return ''.join(f"  🏷️ {' > '.join(names.get(code, (code,)))}\n" for code in codes)
 
-def update_categories_list(categories: list, new_category: dict) -> list:
+def format_locations(codes: list, language: str) -> str:
     '''
-    Update the categories list based on hierarchy rules.
+    Render the location filters of an item for a message, one line per filter.
     Args:
-        categories (list): Current list of categories
-        new_category (dict): New category to be added containing category, subcategory, and product_category
+        codes (list): Region, city or area codes; empty for the whole Finland.
+        language (str): Language of the names.
     Returns:
-        list: Updated list of categories
-    '''
-    if new_category['category'].lower() in ALL_CATEGORIES:
-        return [new_category]
-
-    if new_category['subcategory'].lower() in ALL_SUBCATEGORIES:
-        return [cat for cat in categories if cat['category'] != new_category['category']] + [new_category]
-
-    if new_category['product_category'].lower() in ALL_PRODUCT_CATEGORIES:
-        return [cat for cat in categories if not (
-            cat['category'] == new_category['category'] and 
-            cat['subcategory'] == new_category['subcategory']
-        )] + [new_category]
-
-    for existing_cat in categories:
-        if (existing_cat['category'] == new_category['category'] and
-            existing_cat['subcategory'] == new_category['subcategory'] and
-            existing_cat['product_category'] == new_category['product_category']):
-            return categories
-
-    for existing_cat in categories:
-        if (existing_cat['category'].lower() in ALL_CATEGORIES or
-            (existing_cat['category'] == new_category['category'] and 
-             existing_cat['subcategory'].lower() in ALL_SUBCATEGORIES) or
-            (existing_cat['category'] == new_category['category'] and
-             existing_cat['subcategory'] == new_category['subcategory'] and
-             existing_cat['product_category'].lower() in ALL_PRODUCT_CATEGORIES)):
-            return categories
-
-    return categories + [new_category]
+        str: The lines, e.g. "  📍 Uusimaa, Helsinki\n".
+    '''
+    if not codes:
+        return f"  📍 {get_all_labels(language)['region']}\n"
+    names = get_catalog_names('locations', language)
+    return ''.join(f"  📍 {', '.join(names.get(code, (code,)))}\n" for code in codes)
 
 def convert_to_helsinki_time(dt: datetime) -> datetime:
     helsinki_tz = pytz.timezone('Europe/Helsinki')
@@ -0,0 +1,100 @@
+import os
+import re
+import asyncio
+import logging
+import secrets
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Updates waiting to be processed; when the queue is full, the webhook server answers Telegram only
+# after there is room again (or the poller stops fetching), so a burst can't exhaust the memory
+DEFAULT_UPDATE_QUEUE_SIZE = 1000
+
+# Simultaneous HTTPS connections Telegram may open to the webhook (1-100)
+DEFAULT_MAX_CONNECTIONS = 40
+
+# Characters Telegram allows in the secret token of a webhook
+SECRET_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,256}$')
+
+class WebhookConfig(NamedTuple):
+    '''
+    Settings of the webhook mode, read from the WEBHOOK_* environment variables.
+    '''
+    url: str                # public HTTPS URL Telegram posts the updates to
+    listen: str             # address the embedded HTTP server binds to
+    port: int
+    path: str               # path of the webhook on the embedded server
+    secret_token: str       # sent by Telegram in the X-Telegram-Bot-Api-Secret-Token header of every update
+    max_connections: int
+
+def get_webhook_config() -> Optional[WebhookConfig]:
+    '''
+    Read the webhook settings. The bot runs in webhook mode when WEBHOOK_URL is set, and polls otherwise.
+    Without WEBHOOK_SECRET_TOKEN a random token is generated at every start (the webhook is registered again
+    at startup anyway); set it when several processes or a proxy have to know it.
+    Returns:
+        WebhookConfig | None: The settings, or None for polling.
+    '''
+    base_url = os.getenv('WEBHOOK_URL')
+    if not base_url:
+        return None
+
+    path = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+    secret_token = os.getenv('WEBHOOK_SECRET_TOKEN') or secrets.token_urlsafe(32)
+    if not SECRET_TOKEN_PATTERN.match(secret_token):
+        raise ValueError("WEBHOOK_SECRET_TOKEN must be 1-256 characters: letters, digits, '_' and '-'")
+    max_connections = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', str(DEFAULT_MAX_CONNECTIONS)))
+    if not 1 <= max_connections <= 100:
+        raise ValueError("WEBHOOK_MAX_CONNECTIONS must be between 1 and 100")
+
+    return WebhookConfig(
+        url=f"{base_url.rstrip('/')}/{path}",
+        listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+        port=int(os.getenv('WEBHOOK_PORT', '8443')),
+        path=path,
+        secret_token=secret_token,
+        max_connections=max_connections
+    )
+
+def create_update_queue() -> asyncio.Queue:
+    '''
+    Create the queue of incoming updates, bounded by UPDATE_QUEUE_SIZE (0 for no limit).
+    Returns:
+        asyncio.Queue: The queue for ApplicationBuilder.update_queue.
+    '''
+    return asyncio.Queue(maxsize=int(os.getenv('UPDATE_QUEUE_SIZE', str(DEFAULT_UPDATE_QUEUE_SIZE))))
+
+def webhook_parameters(config: WebhookConfig) -> dict:
+    '''
+    Get the arguments of Application.run_webhook / Updater.start_webhook for a configuration.
+    Args:
+        config (WebhookConfig): The webhook settings.
+    Returns:
+        dict: Keyword arguments.
+    '''
+    return {
+        'listen': config.listen,
+        'port': config.port,
+        'url_path': config.path,
+        'webhook_url': config.url,
+        'secret_token': config.secret_token,
+        'max_connections': config.max_connections
+    }
+
+def run_application(application, config: Optional[WebhookConfig]):
+    '''
+    Run the bot until it gets SIGINT, SIGTERM or SIGABRT, receiving the updates through the webhook if it is
+    configured and by long polling otherwise. On a stop signal the server stops accepting updates, the updates
+    already received are processed and the jobs are shut down before the process exits.
+    Args:
+        application (Application): The bot application.
+        config (WebhookConfig | None): The webhook settings, None for polling.
+    '''
+    if config is None:
+        logger.info("Receiving updates by long polling")
+        application.run_polling()
+        return
+
+    logger.info("Receiving updates through the webhook %s (listening on %s:%d)", config.url, config.listen, config.port)
+    application.run_webhook(**webhook_parameters(config))
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+# The catalogs are loaded from paths relative to the repository root
+os.chdir(ROOT)
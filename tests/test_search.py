@@ -0,0 +1,61 @@
+import tracemalloc
+import pytest
+from modules.constants import LANGUAGES
+from modules.load import load_categories, load_locations
+from modules.search import CatalogIndex, SEARCH_KINDS, SHORT_PREFIX_LENGTH, RANK_EXACT, RANK_PREFIX
+
+# The whole index (names, postings, deletion array and short prefix lists) measured with tracemalloc
+INDEX_MEMORY_LIMIT = 16 * 1024 * 1024
+
+# The deletion variants of all names
+DELETES_SIZE_LIMIT = 4 * 1024 * 1024
+
+@pytest.fixture(scope='module')
+def catalogs():
+    loaders = {'categories': load_categories, 'locations': load_locations}
+    return {(kind, language): loaders[kind](language) for kind in SEARCH_KINDS for language in LANGUAGES}
+
+@pytest.fixture(scope='module')
+def index(catalogs):
+    return CatalogIndex(catalogs)
+
+def test_index_memory(catalogs):
+    tracemalloc.start()
+    try:
+        index = CatalogIndex(catalogs)
+        memory = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(index) > 0
+    assert memory < INDEX_MEMORY_LIMIT
+
+def test_deletes_size(index):
+    assert len(index._deletes) * index._deletes.itemsize < DELETES_SIZE_LIMIT
+
+@pytest.mark.parametrize('text, label', [
+    ('Helsinki', 'Helsinki'),
+    ('helsnki', 'Helsinki'),        # a deletion
+    ('Hlesinki', 'Helsinki'),       # a transposition
+    ('Helsonko', 'Helsinki'),       # two substitutions
+    ('Tampare', 'Tampere'),
+])
+def test_resolve_typos(index, text, label):
+    match, _ = index.resolve(text, 'locations', 'fi')
+    assert match is not None
+    assert match.label == label
+
+def test_short_prefixes_match_full_scan(index):
+    # The short prefix lists are read only until the best results are known; scoring every name
+    # starting with the prefix has to give the same results
+    prefixes = sorted({key[:length] for key in index._postings for length in range(1, SHORT_PREFIX_LENGTH + 1)})
+    for prefix in prefixes[::7]:
+        for kind, language, limit in ((None, 'fi', 20), ('locations', 'en', 10), ('categories', None, 5)):
+            best = {}
+            for key in index._prefix_keys(prefix):
+                index._add_matches(best, key, RANK_EXACT if key == prefix else RANK_PREFIX, 0, kind, language, None)
+            expected = sorted(best.items(), key=lambda item: (item[1], index._entries[item[0]][1]))[:limit]
+            best = {}
+            complete = index._add_short_prefix_matches(best, prefix, kind, language, None, limit)
+            found = sorted(best.items(), key=lambda item: (item[1], index._entries[item[0]][1]))[:limit]
+            assert found == expected
+            assert complete == (len(expected) >= limit)
@@ -0,0 +1,86 @@
+"""
+Benchmark of the one-shot /add command (modules/command.py).
+
+Generates synthetic commands from random catalog entries (exact names, names with a swapped letter
+and full paths, with random price ranges and seller types) and reports how long parsing and resolving
+them takes, and how many of them resolve to a single location and category.
+
+Usage: python tools/benchmarks/add_command.py [number_of_commands]
+"""
+
+import sys
+import os
+import time
+import random
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from modules.constants import LANGUAGES
+from modules.load import preload_catalogs, load_categories, load_locations, iter_catalog_nodes
+from modules.search import get_search_index, PATH_SEPARATOR
+from modules.command import parse_add_command, resolve_add_command, CommandError
+
+def typo(name: str) -> str:
+    if len(name) < 6:
+        return name
+    position = random.randrange(1, len(name) - 2)
+    return name[:position] + name[position + 1] + name[position] + name[position + 2:]
+
+def spelling(names: tuple) -> str:
+    """One of the ways a user could write a catalog entry."""
+    style = random.random()
+    if style < 0.2:
+        return PATH_SEPARATOR.join(names)
+    if style < 0.4:
+        return typo(names[-1])
+    return names[-1]
+
+def generate_commands(count: int) -> list:
+    random.seed(0)
+    nodes = {}
+    for language in LANGUAGES:
+        nodes[language] = (
+            [names for _, names in iter_catalog_nodes('locations', load_locations(language))],
+            [names for _, names in iter_catalog_nodes('categories', load_categories(language))]
+        )
+    commands = []
+    for _ in range(count):
+        language = random.choice(LANGUAGES)
+        locations, categories = nodes[language]
+        price = random.choice(['', '100-500', '-300', '50-', '1000'])
+        seller = random.choice(['', 'private', 'company', 'yksityinen'])
+        text = f"tuote; {spelling(random.choice(locations))}; {spelling(random.choice(categories))}; {price}; {seller}"
+        commands.append((language, text))
+    return commands
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    preload_catalogs()
+    get_search_index()
+    commands = generate_commands(count)
+
+    parse_times, resolve_times = [], []
+    outcomes = {}
+    for language, text in commands:
+        started = time.perf_counter()
+        command = parse_add_command(text)
+        parsed = time.perf_counter()
+        try:
+            resolve_add_command(command, language)
+            outcome = 'resolved'
+        except CommandError as e:
+            outcome = e.message_key
+        resolve_times.append(time.perf_counter() - parsed)
+        parse_times.append(parsed - started)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    print(f"{count} commands: " + ', '.join(f"{outcome}: {number}" for outcome, number in sorted(outcomes.items())))
+    for name, timings in (('parse', parse_times), ('resolve', resolve_times)):
+        timings.sort()
+        summary = '  '.join(f"{label}: {percentile(timings, fraction) * 1000:6.3f} ms" for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)))
+        print(f"  {name:<8} {summary}  max: {timings[-1] * 1000:6.3f} ms")
@@ -0,0 +1,61 @@
+"""
+Benchmark of the catalog loading.
+
+Compares parsing the catalog JSON files on every call (what the handlers used to do) with the
+catalog registry in modules/load.py: the startup cost of preloading all languages and the per-update
+cost of the catalog lookups done by the wizard steps.
+
+Usage: python tools/benchmarks/catalogs.py [iterations]
+"""
+
+import sys
+import os
+import json
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from modules.constants import LANGUAGES
+from modules.load import load_catalog, load_categories, load_locations, load_messages, preload_catalogs
+
+def parse_from_disk(kind: str, language: str) -> dict:
+    """The old loader: check the file and parse it on every call."""
+    file_path = f'jsons/{kind}/{language}.json'
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+    with open(file_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def city_step_uncached(language: str):
+    """Catalog work of a region/city/area step: locations and messages."""
+    return parse_from_disk('locations', language), parse_from_disk('messages', language)
+
+def city_step_cached(language: str):
+    return load_locations(language), load_messages(language)
+
+def save_data_uncached(language: str):
+    """Catalog work of save_data: all three catalogs."""
+    return tuple(parse_from_disk(kind, language) for kind in ('categories', 'locations', 'messages'))
+
+def save_data_cached(language: str):
+    return load_categories(language), load_locations(language), load_messages(language)
+
+def per_call(function, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        function(LANGUAGES[i % len(LANGUAGES)])
+    return (time.perf_counter() - started) / iterations * 1000
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    load_catalog.cache_clear()
+    started = time.perf_counter()
+    preload_catalogs()
+    print(f"Startup: preloading {len(LANGUAGES)} languages x 3 catalogs took {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    print(f"\nPer-update catalog cost (average over {iterations} calls):")
+    print(f"  region/city/area step  uncached: {per_call(city_step_uncached, iterations):8.3f} ms   cached: {per_call(city_step_cached, iterations):8.4f} ms")
+    print(f"  save_data              uncached: {per_call(save_data_uncached, iterations):8.3f} ms   cached: {per_call(save_data_cached, iterations):8.4f} ms")
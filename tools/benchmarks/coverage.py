@@ -0,0 +1,248 @@
+"""
+Equivalence check and microbenchmark of the filter coverage engine (modules/coverage.py).
+
+Replays random sequences of wizard selections (regions, cities and areas, categories, subcategories
+and product categories, including the "all ..." entries) through the name-based list functions the
+wizard used before (copied below as legacy_*) and through update_filter_codes, as the wizard steps call it,
+and checks that both end up filtering the same catalog nodes and agree on which areas are covered.
+Then times adding n filters one wizard step at a time and checking coverage with both.
+
+Usage: python tools/benchmarks/coverage.py [number_of_sequences]
+"""
+
+import sys
+import os
+import time
+import random
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from modules.constants import ALL_CATEGORIES, ALL_SUBCATEGORIES, ALL_PRODUCT_CATEGORIES, WHOLE_FINLAND, ALL_CITIES, ALL_AREAS
+from modules.load import load_categories, load_locations, get_all_labels
+from modules.utils import get_category_code, get_location_code, update_filter_codes, get_filter_tree
+from modules.coverage import CoverageTree
+
+LANGUAGE = '🇬🇧 English'
+
+def legacy_is_location_covered(new_location: dict, existing_location: dict) -> bool:
+    '''
+    Check if a location is already covered by an existing location based on hierarchy.
+    Args:
+        new_location (dict): The new location to check
+        existing_location (dict): An existing location to check against 
+    Returns:
+        bool: True if the new location is already covered by the existing location
+    '''
+    if existing_location['region'].lower() in WHOLE_FINLAND:
+        return True
+    if new_location['region'] != existing_location['region']:
+        return False
+    if new_location['city'].lower() in ALL_CITIES:
+        return False
+    if existing_location['city'].lower() in ALL_CITIES:
+        return True  
+    if new_location['city'] != existing_location['city']:
+        return False
+    if new_location.get('area', '').lower() in ALL_AREAS:
+        return False 
+    if existing_location.get('area', '').lower() in ALL_AREAS:
+        return True 
+
+    return new_location.get('area') == existing_location.get('area')
+
+def legacy_update_locations_list(locations: list, new_location: dict) -> list:
+    '''
+    Update the locations list based on hierarchy rules.
+    Args:
+        locations (list): Current list of locations
+        new_location (dict): New location to be added
+    Returns:
+        list: Updated list of locations
+    '''
+    if new_location['region'].lower() in WHOLE_FINLAND:
+        return [new_location]
+
+    if new_location['city'].lower() in ALL_CITIES:
+        return [loc for loc in locations if loc['region'] != new_location['region']] + [new_location]
+
+    if new_location.get('area', '').lower() in ALL_AREAS:
+        return [loc for loc in locations if not (
+            loc['region'] == new_location['region'] and 
+            loc['city'] == new_location['city']
+        )] + [new_location]
+
+    for existing_location in locations:
+        if legacy_is_location_covered(new_location, existing_location):
+            return locations 
+
+    return locations + [new_location]
+
+def legacy_update_categories_list(categories: list, new_category: dict) -> list:
+    '''
+    Update the categories list based on hierarchy rules.
+    Args:
+        categories (list): Current list of categories
+        new_category (dict): New category to be added containing category, subcategory, and product_category
+    Returns:
+        list: Updated list of categories
+    '''
+    if new_category['category'].lower() in ALL_CATEGORIES:
+        return [new_category]
+
+    if new_category['subcategory'].lower() in ALL_SUBCATEGORIES:
+        return [cat for cat in categories if cat['category'] != new_category['category']] + [new_category]
+
+    if new_category['product_category'].lower() in ALL_PRODUCT_CATEGORIES:
+        return [cat for cat in categories if not (
+            cat['category'] == new_category['category'] and 
+            cat['subcategory'] == new_category['subcategory']
+        )] + [new_category]
+
+    for existing_cat in categories:
+        if (existing_cat['category'] == new_category['category'] and
+            existing_cat['subcategory'] == new_category['subcategory'] and
+            existing_cat['product_category'] == new_category['product_category']):
+            return categories
+
+    for existing_cat in categories:
+        if (existing_cat['category'].lower() in ALL_CATEGORIES or
+            (existing_cat['category'] == new_category['category'] and 
+             existing_cat['subcategory'].lower() in ALL_SUBCATEGORIES) or
+            (existing_cat['category'] == new_category['category'] and
+             existing_cat['subcategory'] == new_category['subcategory'] and
+             existing_cat['product_category'].lower() in ALL_PRODUCT_CATEGORIES)):
+            return categories
+
+    return categories + [new_category]
+
+def location_selections() -> list:
+    """Every selection the location steps of the wizard can produce."""
+    labels = get_all_labels(LANGUAGE)
+    selections = [{'region': labels['region'], 'city': labels['city'], 'area': labels['area']}]
+    for region, region_data in load_locations(LANGUAGE).items():
+        if not region_data:
+            continue
+        selections.append({'region': region, 'city': labels['city'], 'area': labels['area']})
+        for city, city_data in region_data['cities'].items():
+            if not city_data:
+                continue
+            selections.append({'region': region, 'city': city, 'area': labels['area']})
+            selections += [{'region': region, 'city': city, 'area': area} for area, code in (city_data['areas'] or {}).items() if code]
+    return selections
+
+def category_selections() -> list:
+    """Every selection the category steps of the wizard can produce."""
+    labels = get_all_labels(LANGUAGE)
+    selections = [{'category': labels['category'], 'subcategory': labels['subcategory'], 'product_category': labels['product_category']}]
+    for category, category_data in load_categories(LANGUAGE).items():
+        if not category_data:
+            continue
+        selections.append({'category': category, 'subcategory': labels['subcategory'], 'product_category': labels['product_category']})
+        for subcategory, subcategory_data in category_data['subcategories'].items():
+            if not subcategory_data:
+                continue
+            selections.append({'category': category, 'subcategory': subcategory, 'product_category': labels['product_category']})
+            selections += [{'category': category, 'subcategory': subcategory, 'product_category': product_category}
+                           for product_category, code in (subcategory_data['product_categories'] or {}).items() if code]
+    return selections
+
+def is_below(code: str, other: str) -> bool:
+    """True if code is other or one of its descendants."""
+    return CoverageTree.path(code)[:len(CoverageTree.path(other))] == CoverageTree.path(other)
+
+def effective(codes: list) -> set:
+    """The codes that are not covered by another code of the list, i.e. what the filter actually searches."""
+    if None in codes:
+        return {None}
+    return {code for code in codes if not any(other != code and is_below(code, other) for other in codes)}
+
+def random_sequence(selections: list, length: int) -> list:
+    """
+    Random selections, mostly from below one top level node so that they overlap,
+    with an occasional selection from elsewhere or of everything.
+    """
+    top_key = next(iter(selections[0]))
+    anchor = random.choice(selections)[top_key]
+    related = [selection for selection in selections if selection[top_key] == anchor]
+    sequence = random.sample(related, min(length, len(related)))
+    sequence += random.sample(selections, random.randint(0, 2))
+    if random.random() < 0.05:
+        sequence.append(selections[0])
+    random.shuffle(sequence)
+    return sequence
+
+def check(sequences: int, selections: list, kind: str, legacy_update, to_code, length: int = 12) -> int:
+    random.seed(0)
+    failures = 0
+    for telegram_id in range(sequences):
+        legacy, codes = [], []
+        for selection in random_sequence(selections, length):
+            legacy = legacy_update(legacy, selection)
+            codes = update_filter_codes(telegram_id, kind, codes, to_code(selection))
+        if effective([to_code(selection) for selection in legacy]) != set(get_filter_tree(telegram_id, kind, codes).codes()):
+            failures += 1
+    return failures
+
+def check_covered_areas(sequences: int, selections: list, length: int = 12) -> int:
+    """
+    Compare legacy_is_location_covered with the coverage tree of the wizard for specific areas
+    (the legacy check never treats an "all ..." selection as covered: those replaced the list instead).
+    """
+    random.seed(1)
+    locations_data = load_locations(LANGUAGE)
+    areas = [selection for selection in selections if selection['area'].lower() not in ALL_AREAS]
+    failures = 0
+    for telegram_id in range(sequences):
+        legacy, codes = [], []
+        for selection in random_sequence(selections, length):
+            legacy = legacy_update_locations_list(legacy, selection)
+            codes = update_filter_codes(telegram_id, 'locations', codes, get_location_code(locations_data, selection))
+        tree = get_filter_tree(telegram_id, 'locations', codes)
+        for area in random.sample(areas, 20):
+            if any(legacy_is_location_covered(area, existing) for existing in legacy) != tree.covers(get_location_code(locations_data, area)):
+                failures += 1
+    return failures
+
+def benchmark(name: str, selections: list, legacy_update, to_code, sizes=(10, 100, 1000)):
+    random.seed(2)
+    specific = [selection for selection in selections if to_code(selection) and to_code(selection)[0] == '2']
+    for size in sizes:
+        picked = random.sample(specific, min(size, len(specific)))
+        codes = [to_code(selection) for selection in picked]
+
+        started = time.perf_counter()
+        legacy = []
+        for selection in picked:
+            legacy = legacy_update(legacy, selection)
+        legacy_time = time.perf_counter() - started
+
+        # One wizard step per filter: update_filter_codes, then the coverage check of the next selection
+        started = time.perf_counter()
+        wizard_codes = []
+        for code in codes:
+            wizard_codes = update_filter_codes(0, name, wizard_codes, code)
+            get_filter_tree(0, name, wizard_codes).covers(code)
+        tree_time = time.perf_counter() - started
+
+        print(f"  {name:<10} n={len(picked):>5}  legacy list: {legacy_time * 1000:9.3f} ms  "
+              f"update_filter_codes + covers: {tree_time * 1000:7.3f} ms ({tree_time / len(picked) * 1e6:.2f} µs per step)")
+
+if __name__ == '__main__':
+    sequences = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    locations_data = load_locations(LANGUAGE)
+    categories_data = load_categories(LANGUAGE)
+    locations = location_selections()
+    categories = category_selections()
+    to_location_code = lambda selection: get_location_code(locations_data, selection)
+    to_category_code = lambda selection: get_category_code(categories_data, selection)
+
+    print(f"Equivalence over {sequences} random sequences:")
+    print(f"  locations:      {check(sequences, locations, 'locations', legacy_update_locations_list, to_location_code)} mismatches")
+    print(f"  categories:     {check(sequences, categories, 'categories', legacy_update_categories_list, to_category_code)} mismatches")
+    print(f"  covered areas:  {check_covered_areas(sequences, locations)} mismatches")
+
+    print("Adding n filters:")
+    benchmark('locations', locations, legacy_update_locations_list, to_location_code)
+    benchmark('categories', categories, legacy_update_categories_list, to_category_code)
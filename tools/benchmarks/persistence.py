@@ -0,0 +1,120 @@
+"""
+Benchmark of the conversation persistence (modules/persistence.py).
+
+Runs a persistent two-state conversation for a number of users, each sending a few messages that change
+their state and user_data, with and without DatabasePersistence, and reports the handling latency of the
+updates, the time of a save and the rows it wrote. Then restarts the application on the same database and
+reports the startup time and the latency of the first update of a user (when their user_data is loaded).
+Uses a temporary SQLite database.
+
+Usage: python tools/benchmarks/persistence.py [users] [updates_per_user]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'persistence.db')
+
+from telegram import Update, User
+from telegram.ext import ApplicationBuilder, ExtBot, ConversationHandler, MessageHandler, filters
+from modules.migrations import run_migrations
+from modules.persistence import DatabasePersistence
+
+class LocalBot(ExtBot):
+    """A bot that initializes without a network."""
+
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(1, 'Benchmark', True, username='benchmark_bot')
+        return self._bot_user
+
+class CountingPersistence(DatabasePersistence):
+    """DatabasePersistence counting the rows it writes."""
+
+    written = 0
+
+    def _save(self, states: dict, user_data: dict) -> None:
+        super()._save(states, user_data)
+        self.written += len(states) + len(user_data)
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Benchmark'}
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'text': str(update_id),
+        'chat': {'id': chat_id, 'type': 'private'}, 'from': user
+    }}, None)
+
+async def start(update, context):
+    context.user_data['item'] = update.message.text
+    return 1
+
+async def step(update, context):
+    context.user_data.setdefault('steps', []).append(update.message.text)
+    return 2 if len(context.user_data['steps']) % 2 else 1
+
+def build_application(persistence):
+    builder = ApplicationBuilder().bot(LocalBot('1:benchmark'))
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
+    text = filters.TEXT & ~filters.COMMAND
+    application.add_handler(ConversationHandler(
+        entry_points=[MessageHandler(text, start)],
+        states={1: [MessageHandler(text, step)], 2: [MessageHandler(text, step)]},
+        fallbacks=[], name='benchmark', persistent=persistence is not None
+    ))
+    return application
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def summary(values: list) -> str:
+    values = sorted(values)
+    parts = '  '.join(f"{name}: {percentile(values, fraction) * 1000:6.2f} ms" for name, fraction in (('p50', 0.5), ('p99', 0.99)))
+    return f"{parts}  max: {values[-1] * 1000:6.2f} ms"
+
+async def process(application, updates: list) -> list:
+    latencies = []
+    for update in updates:
+        started = time.perf_counter()
+        await application.process_update(update)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+async def main(users: int, updates_per_user: int):
+    run_migrations()
+    updates = [make_update(sequence * users + user, 1000 + user) for sequence in range(updates_per_user) for user in range(users)]
+
+    for label, persistence in (('in memory', None), ('persistent', CountingPersistence())):
+        application = build_application(persistence)
+        await application.initialize()
+        latencies = await process(application, updates)
+        print(f"{label:10} {len(updates)} updates of {users} users: {summary(latencies)}")
+        if persistence is not None:
+            for _ in range(2):
+                persistence.written = 0
+                started = time.perf_counter()
+                await application.update_persistence()
+                print(f"           save: {(time.perf_counter() - started) * 1000:.1f} ms, {persistence.written} rows written")
+        await application.shutdown()
+
+    persistence = DatabasePersistence()
+    application = build_application(persistence)
+    started = time.perf_counter()
+    await application.initialize()
+    print(f"restart with {users} users in the conversation: {(time.perf_counter() - started) * 1000:.1f} ms")
+    first = await process(application, [make_update(10 ** 6 + user, 1000 + user) for user in range(users)])
+    print(f"first update of a user after the restart: {summary(first)}")
+    again = await process(application, [make_update(2 * 10 ** 6 + user, 1000 + user) for user in range(users)])
+    print(f"next updates:                             {summary(again)}")
+    await application.shutdown()
+
+if __name__ == '__main__':
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    updates_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    asyncio.run(main(users, updates_per_user))
@@ -0,0 +1,70 @@
+"""
+Benchmark of the poller's subscription loading.
+
+Creates a temporary SQLite database with synthetic subscriptions (1 000 000 by default) and compares
+the peak memory and time of loading the whole table as ORM objects (the old session.query(ToriItem).all())
+with streaming it through modules.registry.iter_subscriptions.
+
+Usage: python tools/benchmarks/poller.py [number_of_subscriptions]
+"""
+
+import sys
+import os
+import time
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+
+db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(db_dir, 'benchmark.db')}"
+
+from modules.database import engine, get_session
+from modules.models import ToriItem
+from modules.registry import iter_subscriptions
+from modules.migrations import run_migrations
+
+def populate(count: int, chunk: int = 50000):
+    """Insert synthetic subscriptions in chunks."""
+    now = datetime.now()
+    categories = ['2.76.5177.385']
+    locations = ['1.100018.110091']
+    with engine.begin() as connection:
+        for offset in range(0, count, chunk):
+            connection.execute(ToriItem.__table__.insert(), [{
+                'item': f'item {i}',
+                'categories': categories,
+                'locations': locations,
+                'dealer_segments': ['yksityinen', 'yritys'],
+                'shipping_types': ['all'],
+                'telegram_id': 100000 + i % 5000,
+                'added_time': now
+            } for i in range(offset, min(offset + chunk, count))])
+
+def measure(name: str, load):
+    """Run a loader and print its peak memory and duration."""
+    session = get_session()
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = load(session)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    session.close()
+    print(f"{name:<28} rows: {count:>9}  time: {elapsed:7.2f} s  peak memory: {peak / 1024 / 1024:8.1f} MiB")
+
+def load_all(session):
+    return len(session.query(ToriItem).all())
+
+def load_streamed(session):
+    return sum(1 for _ in iter_subscriptions(session))
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    run_migrations()
+    print(f"Populating {count} synthetic subscriptions in {db_dir}...")
+    populate(count)
+    measure('query(ToriItem).all()', load_all)
+    measure('iter_subscriptions()', load_streamed)
@@ -0,0 +1,85 @@
+"""
+Benchmark of the conversation dispatch (modules/router.py).
+
+Measures the time the application needs to find the handler of a message: going through the handlers
+of the group until one accepts the update, as Application.process_update does. Compares the user
+conversation built from the transition table with the previous layout of the same states: three
+ConversationHandlers (new user, returning user, fallback) with a MessageHandler and a CommandHandler
+per command in every state, checked one after another.
+
+Usage: python tools/benchmarks/router.py [iterations]
+"""
+
+import sys
+import os
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+
+from telegram import Update
+from telegram.ext import ConversationHandler, MessageHandler, CommandHandler, ExtBot, filters
+from modules.router import TEXT, build_conversation
+from modules.handlers import TEXT_ROUTES, COMMAND_ROUTES, ENTRY_ROUTES
+from modules.constants import PRICE_TO
+
+USERS = 1000
+
+class LocalBot(ExtBot):
+    """A bot that knows its username without a network."""
+
+    @property
+    def username(self):
+        return 'benchmark_bot'
+
+def make_update(update_id: int, chat_id: int, text: str, bot) -> Update:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Benchmark'}
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] if text.startswith('/') else []
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'text': text, 'entities': entities,
+        'chat': {'id': chat_id, 'type': 'private'}, 'from': user
+    }}, bot)
+
+def legacy_conversation(name: str) -> ConversationHandler:
+    text_filter = filters.TEXT & ~filters.COMMAND
+    commands = [CommandHandler(command, callback) for command, callback in COMMAND_ROUTES.items() if command not in ('start', 'cancel')]
+    return ConversationHandler(
+        entry_points=[MessageHandler(text_filter, ENTRY_ROUTES[TEXT]), CommandHandler('start', ENTRY_ROUTES['start'])],
+        states={state: [MessageHandler(text_filter, callback), *commands] for state, callback in TEXT_ROUTES.items()},
+        fallbacks=[CommandHandler('cancel', COMMAND_ROUTES['cancel'])],
+        name=name,
+        allow_reentry=True
+    )
+
+def find_handler(handlers: list, update: Update):
+    for handler in handlers:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            return handler
+    return None
+
+def measure(handlers: list, updates: list, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for update in updates:
+            find_handler(handlers, update)
+    return (time.perf_counter() - started) / (iterations * len(updates))
+
+def main(iterations: int):
+    bot = LocalBot('1:benchmark')
+    legacy = [legacy_conversation(name) for name in ('new_user_conversation', 'returning_user_conversation', 'fallback_conversation')]
+    table = [build_conversation('user_conversation', ENTRY_ROUTES, COMMAND_ROUTES, TEXT_ROUTES)]
+    # Every user is in the middle of the wizard
+    for chat_id in range(USERS):
+        legacy[0]._conversations[(chat_id, chat_id)] = PRICE_TO
+        table[0]._conversations[(chat_id, chat_id)] = PRICE_TO
+
+    for label, text in (('text', '100'), ('/add', '/add'), ('/menu@bot', '/menu@benchmark_bot'), ('/unknown', '/unknown')):
+        updates = [make_update(update_id, update_id % USERS, text, bot) for update_id in range(USERS)]
+        legacy_time = measure(legacy, updates, iterations)
+        table_time = measure(table, updates, iterations)
+        print(f"{label:10} three conversations: {legacy_time * 1e6:6.2f} µs  transition table: {table_time * 1e6:6.2f} µs  "
+              f"({legacy_time / table_time:.1f}x)")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,70 @@
+"""
+Benchmark of the catalog search index (modules/search.py) behind typed wizard input and inline mode.
+
+Builds the index over all category and location catalogs, then replays typing every node name
+of the full catalog keystroke by keystroke (optionally with a typo) and reports the latency of
+answering each keystroke as an inline query, i.e. the index search plus building the result objects,
+with an empty search cache (cold) and with the cache shared by all keystrokes (as in the bot).
+
+Usage: python tools/benchmarks/search.py [typo_every_nth_name]
+"""
+
+import sys
+import os
+import time
+import random
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from modules.constants import LANGUAGES
+from modules.load import preload_catalogs, load_categories, load_locations, iter_catalog_nodes
+from modules.search import get_search_index
+from modules.inline import build_inline_results
+
+def typed_queries(typo_every: int) -> list:
+    """Every prefix of every node name in every language, with a swapped letter in every nth name."""
+    random.seed(0)
+    queries = []
+    names = set()
+    for language in LANGUAGES:
+        for kind, data in (('categories', load_categories(language)), ('locations', load_locations(language))):
+            names.update((language, path[-1]) for _, path in iter_catalog_nodes(kind, data))
+    for number, (language, name) in enumerate(sorted(names)):
+        if typo_every and number % typo_every == 0 and len(name) > 3:
+            position = random.randrange(1, len(name) - 1)
+            name = name[:position] + name[position + 1] + name[position] + name[position + 2:]
+        queries += [(language, name[:length]) for length in range(1, len(name) + 1)]
+    return queries
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+if __name__ == '__main__':
+    typo_every = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    preload_catalogs()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = get_search_index()
+    build_time = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"Index: {len(index)} nodes, built in {build_time * 1000:.0f} ms, {memory / 1024 / 1024:.1f} MiB")
+
+    queries = typed_queries(typo_every)
+    print(f"Inline queries: {len(queries)} keystrokes (a typo in every {typo_every}th name)")
+    for mode in ('cold', 'cached'):
+        index.cache.clear()
+        timings = []
+        for language, text in queries:
+            if mode == 'cold':
+                index.cache.clear()
+            started = time.perf_counter()
+            build_inline_results(text, language)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        summary = '  '.join(f"{name}: {percentile(timings, fraction) * 1000:6.3f} ms" for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)))
+        print(f"  {mode:<7} {summary}  max: {timings[-1] * 1000:6.3f} ms  mean: {sum(timings) / len(timings) * 1000:6.3f} ms")
@@ -0,0 +1,98 @@
+"""
+Load test of the update processing (modules/updates.py).
+
+Simulates a number of users, each sending an update every INTERVAL seconds, to an application whose handler
+awaits HANDLER_DELAY (a Telegram API call) and checks that the updates of each chat arrive in order.
+The updates are put straight into the application's update queue, so the numbers are the processing latency
+(from the update arriving to its handler finishing) without the network. Compares processing the updates
+one at a time (PTB's default) with ChatOrderedUpdateProcessor.
+
+Usage: python tools/benchmarks/updates.py [updates_per_user] [interval_ms] [handler_delay_ms] [workers]
+"""
+
+import sys
+import os
+import time
+import random
+import asyncio
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+
+from telegram import Update, User
+from telegram.ext import ApplicationBuilder, ExtBot, SimpleUpdateProcessor, MessageHandler, filters
+from modules.updates import ChatOrderedUpdateProcessor
+
+USER_COUNTS = (1, 10, 50, 100)
+
+class LocalBot(ExtBot):
+    """A bot that initializes without a network."""
+
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(1, 'Benchmark', True, username='benchmark_bot')
+        return self._bot_user
+
+def make_update(update_id: int, chat_id: int, sequence: int) -> dict:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Benchmark'}
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'text': str(sequence),
+        'chat': {'id': chat_id, 'type': 'private'}, 'from': user
+    }}
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def run(processor, users: int, per_user: int, interval: float, handler_delay: float) -> tuple:
+    arrived = {}
+    latencies = []
+    last_sequence = {}
+    out_of_order = 0
+
+    async def on_message(update, context):
+        nonlocal out_of_order
+        chat_id, sequence = update.effective_chat.id, int(update.message.text)
+        if sequence != last_sequence.get(chat_id, -1) + 1:
+            out_of_order += 1
+        last_sequence[chat_id] = sequence
+        await asyncio.sleep(handler_delay)
+        latencies.append(time.perf_counter() - arrived[update.update_id])
+
+    application = ApplicationBuilder().bot(LocalBot('1:benchmark')).concurrent_updates(processor).build()
+    application.add_handler(MessageHandler(filters.TEXT, on_message))
+    await application.initialize()
+    await application.start()
+
+    update_ids = iter(range(1, users * per_user + 1))
+
+    async def user(chat_id: int):
+        await asyncio.sleep(random.uniform(0, interval))
+        for sequence in range(per_user):
+            update_id = next(update_ids)
+            arrived[update_id] = time.perf_counter()
+            await application.update_queue.put(Update.de_json(make_update(update_id, chat_id, sequence), application.bot))
+            await asyncio.sleep(interval)
+
+    await asyncio.gather(*(user(1000 + number) for number in range(users)))
+    await application.update_queue.join()
+    await application.stop()
+    await application.shutdown()
+    latencies.sort()
+    return latencies, out_of_order
+
+async def main(per_user: int, interval: float, handler_delay: float, workers: int):
+    random.seed(0)
+    print(f"{per_user} updates per user every {interval * 1000:.0f} ms, handler {handler_delay * 1000:.0f} ms")
+    for name, make_processor in (('one at a time', lambda: SimpleUpdateProcessor(1)),
+                                 (f'{workers} workers', lambda: ChatOrderedUpdateProcessor(workers))):
+        print(f"  {name}")
+        for users in USER_COUNTS:
+            latencies, out_of_order = await run(make_processor(), users, per_user, interval, handler_delay)
+            summary = '  '.join(f"{label}: {percentile(latencies, fraction) * 1000:8.1f} ms" for label, fraction in (('p50', 0.5), ('p99', 0.99)))
+            print(f"    {users:>4} users  {summary}  max: {latencies[-1] * 1000:8.1f} ms  out of order: {out_of_order}")
+
+if __name__ == '__main__':
+    per_user = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    interval = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.5
+    handler_delay = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 20 / 1000
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 16
+    asyncio.run(main(per_user, interval, handler_delay, workers))
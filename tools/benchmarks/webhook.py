@@ -0,0 +1,118 @@
+"""
+Benchmark of the webhook mode (modules/webhook.py).
+
+Runs the bot's embedded webhook server on localhost with a bot that never talks to Telegram, posts
+synthetic message updates to it over HTTP from a number of concurrent connections (as Telegram does,
+up to WEBHOOK_MAX_CONNECTIONS) and reports the latency of the HTTP requests and the end-to-end latency
+from posting an update to its handler running. Also checks that updates without the secret token are rejected.
+
+Usage: python tools/benchmarks/webhook.py [number_of_updates] [connections] [handler_delay_ms]
+"""
+
+import sys
+import os
+import time
+import socket
+import asyncio
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, ROOT)
+
+import httpx
+from telegram import User
+from telegram.ext import ApplicationBuilder, ExtBot, MessageHandler, filters
+
+class LocalBot(ExtBot):
+    """A bot whose Bot API calls made by the webhook setup succeed without a network."""
+
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(1, 'Benchmark', True, username='benchmark_bot')
+        return self._bot_user
+
+    async def set_webhook(self, *args, **kwargs):
+        return True
+
+    async def delete_webhook(self, *args, **kwargs):
+        return True
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Benchmark'}
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'text': 'ping',
+        'chat': {'id': chat_id, 'type': 'private'}, 'from': user
+    }}
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def summary(values: list) -> str:
+    values = sorted(values)
+    parts = '  '.join(f"{name}: {percentile(values, fraction) * 1000:7.2f} ms" for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)))
+    return f"{parts}  max: {values[-1] * 1000:7.2f} ms"
+
+async def main(count: int, connections: int, handler_delay: float):
+    os.environ.setdefault('WEBHOOK_URL', 'https://bot.example.com')
+    os.environ['WEBHOOK_LISTEN'] = '127.0.0.1'
+    os.environ['WEBHOOK_PORT'] = str(free_port())
+    from modules.webhook import get_webhook_config, create_update_queue, webhook_parameters
+    config = get_webhook_config()
+
+    posted = {}
+    handled = {}
+    done = asyncio.Event()
+
+    async def on_message(update, context):
+        handled[update.update_id] = time.perf_counter()
+        if handler_delay:
+            await asyncio.sleep(handler_delay)
+        if len(handled) == count:
+            done.set()
+
+    bot = LocalBot('1:benchmark')
+    application = ApplicationBuilder().bot(bot).update_queue(create_update_queue()).build()
+    application.add_handler(MessageHandler(filters.TEXT, on_message))
+    await application.initialize()
+    await application.updater.start_webhook(**webhook_parameters(config))
+    await application.start()
+
+    url = f"http://{config.listen}:{config.port}/{config.path}"
+    headers = {'X-Telegram-Bot-Api-Secret-Token': config.secret_token}
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    request_times = []
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        response = await client.post(url, json=make_update(0, 1), headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+        print(f"Update with a wrong secret token: HTTP {response.status_code}")
+
+        semaphore = asyncio.Semaphore(connections)
+
+        async def post(update_id: int):
+            async with semaphore:
+                posted[update_id] = started = time.perf_counter()
+                response = await client.post(url, json=make_update(update_id, 1000 + update_id % 100), headers=headers)
+                response.raise_for_status()
+                request_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(update_id) for update_id in range(1, count + 1)))
+        await asyncio.wait_for(done.wait(), timeout=60)
+        elapsed = time.perf_counter() - started
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+
+    print(f"{count} updates over {connections} connections, handler delay {handler_delay * 1000:.0f} ms: "
+          f"{elapsed:.2f} s, {count / elapsed:.0f} updates/s")
+    print(f"  HTTP request   {summary(request_times)}")
+    print(f"  post → handler {summary([handled[update_id] - posted[update_id] for update_id in posted])}")
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    connections = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    handler_delay = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0
+    asyncio.run(main(count, connections, handler_delay))
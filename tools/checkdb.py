@@ -1,96 +1,94 @@
 """
-Check script to verify the status of URLs in the ToriScan database.
-Run this before and after migration to confirm the changes.
+Check the state of the ToriScan database configured with DATABASE_URL (see modules/database.py):
+the applied and pending migrations (schema_migrations) and the search filters stored for the items.
+The script only reads the database; apply the pending migrations with tools/migrate.py.
 """
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import ToriItem
-from collections import Counter
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
 
-def check_database_urls():
-    """Check and report on the URLs in the database."""
-    
-    engine = create_engine('sqlite:///tori_data.db')
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    try:
-        items = session.query(ToriItem).all()
-        
-        if not items:
-            print("No items found in the database!")
-            return
-        
-        old_url_pattern = 'recommerce-search-page'
-        new_url_pattern = 'recommerce/forsale/search'
-        
-        old_urls = []
-        new_urls = []
-        invalid_urls = []
-        
-        for item in items:
-            if not item.link:
-                invalid_urls.append(item)
-            elif old_url_pattern in item.link:
-                old_urls.append(item)
-            elif new_url_pattern in item.link:
-                new_urls.append(item)
-            else:
-                invalid_urls.append(item)
-        
-        print("=" * 60)
-        print("ToriScan Database URL Status Report")
-        print("=" * 60)
-        print(f"Total items in database: {len(items)}")
-        print("-" * 60)
-        
-        if old_urls:
-            print(f"Items with OLD URL format: {len(old_urls)}")
-            print("   These need migration!")
-            print("   Sample items:")
-            for item in old_urls[:3]:
-                print(f"   - ID {item.id}: {item.item}")
-        else:
-            print("No items with old URL format found")
-        
-        if new_urls:
-            print(f"Items with NEW URL format: {len(new_urls)}")
-            print("   Sample items:")
-            for item in new_urls[:3]:
-                print(f"   - ID {item.id}: {item.item}")
-        else:
-            print("No items with new URL format found")
-        
-        if invalid_urls:
-            print(f"Items with invalid/missing URLs: {len(invalid_urls)}")
-            for item in invalid_urls[:3]:
-                print(f"   - ID {item.id}: {item.item}")
-        
+from sqlalchemy import inspect, select, func
+from modules.database import engine
+from modules.constants import LANGUAGES
+from modules.load import get_catalog_names
+from modules.migrations import MIGRATIONS, get_applied_versions, iter_batches
+from modules.models import ToriItem, ItemCategory, ItemLocation
+
+# Number of problem items listed per check
+SAMPLE_SIZE = 3
+
+def check_migrations(connection) -> list:
+    """Report the applied and pending migrations. Returns the pending ones."""
+    if not inspect(connection).has_table('schema_migrations'):
+        print("No schema_migrations table: the database has not been initialized yet")
+        return list(MIGRATIONS)
+    applied_versions = get_applied_versions(connection)
+    pending = [entry for entry in MIGRATIONS if entry[0] not in applied_versions]
+    print(f"Migrations applied: {len(MIGRATIONS) - len(pending)} of {len(MIGRATIONS)}")
+    for version, name, _ in pending:
+        print(f"   pending {version}: {name}")
+    unknown = sorted(applied_versions - {entry[0] for entry in MIGRATIONS})
+    if unknown:
+        print(f"   applied but unknown to this version of the bot: {unknown}")
+    return pending
+
+def check_filters(connection) -> int:
+    """Report the stored filters of the items. Returns the number of items with problems."""
+    items = ToriItem.__table__
+    known_codes = {kind: set(get_catalog_names(kind, LANGUAGES[0])) for kind in ('categories', 'locations')}
+    total = connection.execute(select(func.count()).select_from(items)).scalar()
+    users = connection.execute(select(func.count(items.c.telegram_id.distinct()))).scalar()
+    print(f"Items: {total} of {users} users")
+
+    # An empty list (all categories / the whole Finland) is stored as one NULL code in the filter tables
+    problems = {'names instead of codes': [], 'filter tables out of sync': [], 'codes missing from the catalogs': []}
+    for rows in iter_batches(connection, items, [items.c.categories, items.c.locations]):
+        item_ids = [row.id for row in rows]
+        stored = {}
+        for kind, table in (('categories', ItemCategory.__table__), ('locations', ItemLocation.__table__)):
+            for item_id, code in connection.execute(select(table.c.item_id, table.c.code).where(table.c.item_id.in_(item_ids))):
+                stored.setdefault((item_id, kind), set()).add(code)
+        for row in rows:
+            for kind, codes in (('categories', row.categories), ('locations', row.locations)):
+                if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+                    problems['names instead of codes'].append((row.id, kind))
+                    continue
+                if stored.get((row.id, kind), set()) != (set(codes) or {None}):
+                    problems['filter tables out of sync'].append((row.id, kind))
+                if any(code not in known_codes[kind] for code in codes):
+                    problems['codes missing from the catalogs'].append((row.id, kind))
+
+    for name, found in problems.items():
+        print(f"Items with {name}: {len(found)}")
+        for item_id, kind in found[:SAMPLE_SIZE]:
+            print(f"   - ID {item_id}: {kind}")
+    return len({item_id for found in problems.values() for item_id, _ in found})
+
+def check_database():
+    """Check and report on the migrations and the stored filters."""
+    print("=" * 60)
+    print("ToriScan Database Status Report")
+    print("=" * 60)
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    print("-" * 60)
+
+    with engine.connect() as connection:
+        if check_migrations(connection):
+            print("\nACTION REQUIRED: run python tools/migrate.py (the bot also does it at startup)")
+            print("=" * 60)
+            return 1
         print("-" * 60)
-        
-        if old_urls:
-            print("\nACTION REQUIRED:")
-            print(f"   You need to migrate {len(old_urls)} items to the new URL format.")
-            print("   Run: python migrate_urls.py")
-        elif new_urls and not old_urls:
-            print("\nDATABASE STATUS: All URLs are up to date!")
-        else:
-            print("\nDATABASE STATUS: Check your database configuration")
-        
-        print("=" * 60)
-        
-        if items:
-            print("\nSample URLs in database:")
-            for item in items[:2]:
-                if item.link:
-                    print(f"\nItem: {item.item}")
-                    print(f"URL: {item.link[:100]}...")
-        
-    except Exception as e:
-        print(f"Error checking database: {e}")
-    finally:
-        session.close()
+        problems = check_filters(connection)
+
+    print("-" * 60)
+    if problems:
+        print(f"\n{problems} items need attention")
+    else:
+        print("\nDATABASE STATUS: OK")
+    print("=" * 60)
+    return 1 if problems else 0
 
 if __name__ == "__main__":
-    check_database_urls()
\ No newline at end of file
+    sys.exit(check_database())